@@ -2,8 +2,12 @@
 Contains the DataLayer class (name in progress) which takes and reads various pieces of data
 """
 
+import contextlib
 import copy
+import json
+import logging
 import os
+import shutil
 
 import numpy as np
 import pandas as pd
@@ -15,16 +19,50 @@ from . import units
 from . import utility
 from . import nb_converter
 from . import form_converters
+from .nb_store import NBParameterStore
+from .term_registry import TermRegistry
+
+logger = logging.getLogger(__name__)
 
 APC_DICT = metadata.atom_property_to_column
 
+# On-disk layout of DataLayer.save
+_SAVE_FORMAT_VERSION = 1
+_SAVE_METADATA = "datalayer.json"
+_SAVE_NB_PARAMETERS = "nb_parameters.npz"
+_SAVE_TABLES = "tables"
+_SAVE_CHUNKSIZE = 100000
+
+
+# Reverse index keys of term rows, (atom << _TERM_ID_BITS) | stable row id
+_TERM_ID_BITS = 32
+_TERM_ID_MASK = (1 << _TERM_ID_BITS) - 1
+
+
+def _atom_term_keys(term_atoms, ids):
+    """
+    Returns the flattened (atom, id) keys of the reverse index for term rows of atoms and their stable ids.
+    """
+
+    return ((term_atoms.astype(np.int64) << _TERM_ID_BITS) | ids[:, None]).ravel()
+
+
+def _json_default(obj):
+    """
+    Converts NumPy scalars for JSON serialization.
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("DataLayer: Object of type '%s' is not JSON serializable." % type(obj))
+
 
 class DataLayer(object):
     def __init__(self,
                  name,
                  store_location=None,
                  save_data=False,
-                 backend="Memory"):
+                 backend="Memory",
+                 store_options=None):
         """
         Initializes the DataLayer class
 
@@ -36,8 +74,10 @@ class DataLayer(object):
             The location to store the temporary data during the translation. Defaults to the current working directory.
         save_data : {False, True}, optional
             Decides whether to delete the store data upon destruction of the DataLayer object.
-        backend : {"HDF5", "memory"}, optional
+        backend : {"HDF5", "memory", "columnar", "npy", "sqlite"}, optional
             Storage backend for the energy expression.
+        store_options : dict, optional
+            Additional keyword arguments for the store (eg - {"complevel": 5} for the HDF5 backend).
         """
 
         # Set the state
@@ -48,13 +88,19 @@ class DataLayer(object):
         if self.store_location is None:
             self.store_location = os.getcwd()
 
+        if store_options is None:
+            store_options = {}
+
         self.store = filelayer.build_store(backend, self.name,
-                                           self.store_location, save_data)
+                                           self.store_location, save_data, **store_options)
 
         # Setup empty term holder
-        self._terms = {order: {} for order in [2, 3, 4]}
+        self._terms = {order: TermRegistry(order) for order in [2, 3, 4]}
         self._term_count = {order: {"total": 0} for order in [2, 3, 4]}
 
+        # Atom to term reverse index, built on demand
+        self._atom_term_index = {}
+
         # Setup atom holders
         self._atom_metadata = {}
         self._atom_counts = {}
@@ -66,7 +112,7 @@ class DataLayer(object):
         self._atom_counts = {k: 0 for k in list(metadata.atom_metadata)}
 
         # Set up empty nonbond holders
-        self._nb_parameters = {}
+        self._nb_parameters = NBParameterStore()
         self._nb_scaling_factors = {}
         self._nb_metadata = {}
 
@@ -100,6 +146,206 @@ class DataLayer(object):
 
         self.store.close()
 
+    def _get_state(self):
+        """
+        Returns the DataLayer state not held in the store as a JSON serializable dictionary.
+        """
+
+        terms = {}
+        for order, registry in self._terms.items():
+            terms[str(order)] = [[uid] + list(registry[uid]) for uid in registry]
+
+        atom_metadata = {}
+        for k, v in self._atom_metadata.items():
+            atom_metadata[k] = {
+                "uvals": [[key, value] for key, value in v["uvals"].items()],
+                "inv_uvals": [[key, value] for key, value in v["inv_uvals"].items()]
+            }
+
+        return {
+            "format_version": _SAVE_FORMAT_VERSION,
+            "name": self.name,
+            "terms": terms,
+            "term_count": {str(k): [[key, value] for key, value in v.items()]
+                           for k, v in self._term_count.items()},
+            "atom_metadata": atom_metadata,
+            "atom_counts": self._atom_counts,
+            "nb_scaling_factors": self._nb_scaling_factors,
+            "box_size": self._box_size,
+            "box_center": self._box_center,
+            "mixing_rule": self._mixing_rule,
+        }
+
+    def _set_state(self, state):
+        """
+        Restores the state returned by `_get_state`.
+        """
+
+        for order, terms in state["terms"].items():
+            registry = self._terms[int(order)]
+            for row in terms:
+                registry.add(row[1], row[2:], uid=row[0])
+
+        for order, counts in state["term_count"].items():
+            self._term_count[int(order)] = {key: value for key, value in counts}
+
+        for k, v in state["atom_metadata"].items():
+            self._atom_metadata[k] = {
+                "uvals": {key: value for key, value in v["uvals"]},
+                "inv_uvals": {key: value for key, value in v["inv_uvals"]}
+            }
+
+        self._atom_counts = state["atom_counts"]
+        self._nb_scaling_factors = state["nb_scaling_factors"]
+        self._box_size = state["box_size"]
+        self._box_center = state["box_center"]
+        self._mixing_rule = state["mixing_rule"]
+
+    def save(self, path):
+        """
+        Saves the complete DataLayer to a directory which can be reopened with `DataLayer.open`.
+
+        The tables are written as memory mappable .npy files, see `filelayer.NPYStore`, the remaining data is written
+        to a versioned JSON file and the nonbonded parameters to a .npz file.
+
+        Parameters
+        ----------
+        path : str
+            The directory to save to, a previous save in the directory is overwritten.
+        """
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        # Tables of a lazily opened DataLayer are already in place
+        tables_directory = os.path.join(path, _SAVE_TABLES + "_npy")
+        in_place = isinstance(self.store, filelayer.NPYStore) and (
+            os.path.abspath(self.store.store_directory) == os.path.abspath(tables_directory))
+
+        if not in_place:
+            if os.path.exists(tables_directory):
+                shutil.rmtree(tables_directory)
+
+            # Tables are copied in chunks, a full table is never held in memory
+            tables = filelayer.NPYStore(_SAVE_TABLES, path, True)
+            for key in self.store.list_tables():
+                empty = True
+                for chunk in self._read_table_chunks(key, _SAVE_CHUNKSIZE):
+                    tables.add_table(key, chunk)
+                    empty = False
+
+                if empty:
+                    tables.add_table(key, self.store.read_table(key))
+
+        # An empty archive can not be loaded again, a DataLayer without nonbonded parameters writes none
+        nb_filename = os.path.join(path, _SAVE_NB_PARAMETERS)
+        nb_state = self._nb_parameters.get_state()
+        if len(nb_state):
+            np.savez(nb_filename, **nb_state)
+        elif os.path.exists(nb_filename):
+            os.unlink(nb_filename)
+
+        with open(os.path.join(path, _SAVE_METADATA), "w") as handle:
+            json.dump(self._get_state(), handle, default=_json_default)
+
+    @classmethod
+    def open(cls, path, lazy=True, store_location=None, save_data=False, backend="Memory"):
+        """
+        Opens a DataLayer written by `DataLayer.save`.
+
+        Parameters
+        ----------
+        path : str
+            The directory the DataLayer was saved to
+        lazy : {True, False}, optional
+            If True the saved tables are memory mapped and only read from disk when accessed, changes to the tables
+            are written to the saved directory. Otherwise the tables are copied into a new store.
+        store_location : {None, str}, optional
+            The location of the new store if lazy is False.
+        save_data : {False, True}, optional
+            Decides whether to delete the new store data if lazy is False.
+        backend : str, optional
+            Storage backend of the new store if lazy is False.
+
+        Returns
+        -------
+        dl : DataLayer
+            The reopened DataLayer
+        """
+
+        metadata_filename = os.path.join(path, _SAVE_METADATA)
+        if not os.path.exists(metadata_filename):
+            raise KeyError("DataLayer:open: Did not find a saved DataLayer in '%s'." % path)
+
+        with open(metadata_filename, "r") as handle:
+            state = json.load(handle)
+
+        if state.get("format_version", None) != _SAVE_FORMAT_VERSION:
+            raise ValueError("DataLayer:open: Saved DataLayer format version '%s' is not supported." %
+                             str(state.get("format_version", None)))
+
+        tables = filelayer.NPYStore(_SAVE_TABLES, path, True, reopen=True)
+        if lazy:
+            dl = cls(state["name"], store_location=path, backend="Memory")
+            dl.store.close()
+            dl.store = tables
+        else:
+            dl = cls(state["name"], store_location=store_location, save_data=save_data, backend=backend)
+            for key in tables.list_tables():
+                dl.store.add_table(key, tables.read_table(key))
+
+        dl._set_state(state)
+
+        nb_filename = os.path.join(path, _SAVE_NB_PARAMETERS)
+        if os.path.exists(nb_filename):
+            nb_state = np.load(nb_filename)
+            dl._nb_parameters.set_state({k: nb_state[k] for k in nb_state.files})
+            nb_state.close()
+
+        return dl
+
+    @contextlib.contextmanager
+    def background_writes(self, maxsize=16):
+        """
+        Writes the tables added within the context to the store in a background thread so that parsing and store I/O
+        overlap, see `filelayer.AsyncStore`. All pending writes are finished on exit. Stores held in memory
+        (Memory, Columnar) have no I/O to overlap and are written directly.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            The maximum number of pending writes before adding tables blocks.
+
+        Examples
+        --------
+        >>> with dl.background_writes():
+        ...     dl.add_atoms(df)
+        """
+
+        # Already writing in the background, or nothing to gain from it
+        if isinstance(self.store, (filelayer.AsyncStore, filelayer.MemoryStore, filelayer.ColumnarStore)):
+            yield
+            return
+
+        store = self.store
+        async_store = filelayer.AsyncStore(store, maxsize=maxsize)
+        self.store = async_store
+
+        succeeded = False
+        try:
+            yield
+            succeeded = True
+        finally:
+            self.store = store
+
+            # An exception raised within the context takes precedence over a failed background write
+            if succeeded:
+                async_store.stop()
+            else:
+                error = async_store.stop(raise_error=False)
+                if error is not None:
+                    logger.error("DataLayer:background_writes: Background write failed: %s" % repr(error))
+
     def list_tables(self):
         """
         Lists tables loaded into the store.
@@ -479,20 +725,19 @@ class DataLayer(object):
 
         for label in nb_labels:
             rlabels.append(label)
-            rlist.append(self.store.read_table(label))
+            rlist.append(self.store.read_table(label, copy=False))
 
         ret = pd.concat(rlist, axis=1)
         ret.columns = rlabels
 
         if order is True:
             # Get atom indices from multi-level indexing
-            atom_pairs = ret.index.values
-            pair_order = []
+            pair_order = self._query_atom_pairs(ret.index.get_level_values(0).values,
+                                                ret.index.get_level_values(1).values)
 
-            pair_order.append(
-                [self.query_atom_pair(x[0], x[1]) for x in atom_pairs])
-
-            ret['order'] = pair_order[0]
+            if not np.any(np.isnan(pair_order)):
+                pair_order = pair_order.astype(np.int64)
+            ret['order'] = pair_order
 
         return ret
 
@@ -509,7 +754,7 @@ class DataLayer(object):
         for k, v in scaling_factors.items():
             for scale, val in v.items():
                 order = int(scale[-1])
-                terms = self.get_terms(order)
+                terms = self.get_terms(order, copy=False)
 
                 store_df = pd.DataFrame()
 
@@ -640,18 +885,43 @@ class DataLayer(object):
 
         return self.store.add_table(table_name, tmp_df)
 
-    def _get_atom_table(self, table_name, property_name, by_value, utype):
+    def _read_table_chunks(self, table_name, chunksize):
+        """
+        Reads a store table in chunks of at most chunksize rows, stores without chunked reads are sliced.
+        """
+
+        if int(chunksize) < 1:
+            raise ValueError("DataLayer: chunksize must be positive.")
+
+        if table_name not in self.store.list_tables():
+            return iter([])
 
-        tmp = self.store.read_table(table_name)
+        if hasattr(self.store, "iter_table"):
+            return iter(self.store.read_table(table_name, chunksize=int(chunksize)))
+
+        # In memory stores are sliced, only a chunk is copied at a time
+        table = self.store.read_table(table_name, copy=False)
+        return (table.iloc[start:start + int(chunksize)].copy() for start in range(0, table.shape[0], int(chunksize)))
+
+    def _get_atom_table(self, table_name, property_name, by_value, utype, tmp=None):
+        """
+        Reads an atom table, or converts an already read chunk of it, by index or by value.
+        """
+
+        field_data = metadata.atom_metadata[property_name]
+        expand = by_value and not (field_data["unique"])
+        scale = by_value and (field_data["units"] is not None) and (utype is not None)
+
+        # Only copy the table if it is going to be modified
+        if tmp is None:
+            tmp = self.store.read_table(table_name, copy=(expand or scale))
 
         # Expand the data from unique
-        if by_value and not (metadata.atom_metadata[property_name]["unique"]):
+        if expand:
             tmp = self._build_atom_values(tmp, property_name)
 
         # Figure out unit scaling factors
-        field_data = metadata.atom_metadata[property_name]
-        if by_value and (field_data["units"] is not None) and (utype is
-                                                               not None):
+        if scale:
             utype = self._parse_atom_utype(property_name, utype)
             cf = units.conversion_dict(field_data["utype"], utype)
             tmp[field_data["required_columns"]] *= pd.Series(cf)
@@ -838,13 +1108,13 @@ class DataLayer(object):
                 property_name)
 
     def get_bond_count(self):
-        return len(self.get_bonds())
+        return len(self.get_terms("bonds", copy=False))
 
     def get_angle_count(self):
-        return len(self.get_angles())
+        return len(self.get_terms("angles", copy=False))
 
     def get_dihedral_count(self):
-        return len(self.get_dihedrals())
+        return len(self.get_terms("dihedrals", copy=False))
 
     def get_unique_atom_types(self):
         return np.unique(self.get_atoms('atom_type'))
@@ -932,7 +1202,7 @@ class DataLayer(object):
 
         return True
 
-    def get_atoms(self, properties, by_value=False, utype=None):
+    def get_atoms(self, properties, by_value=False, utype=None, chunksize=None):
         """
         Obtains atom information to the DataLayer object.
 
@@ -942,6 +1212,9 @@ class DataLayer(object):
             The properties to obtain for the atom data.
         by_value : bool
             If true returns the property by value, otherwise returns by index.
+        chunksize : int, optional
+            If set, returns a generator of DataFrames of at most chunksize atoms which are read from the store one
+            chunk at a time.
 
         Returns
         -------
@@ -975,6 +1248,9 @@ class DataLayer(object):
         else:
             raise TypeError("utype type not understood")
 
+        if chunksize is not None:
+            return self._iter_atoms(properties, by_value, utype, chunksize)
+
         df_data = []
         for prop in properties:
             uval = None
@@ -985,6 +1261,66 @@ class DataLayer(object):
 
         return pd.concat(df_data, axis=1)
 
+    def _iter_atoms(self, properties, by_value, utype, chunksize):
+        """
+        Yields the atom properties in chunks, the property tables are read side by side.
+        """
+
+        readers = [self._read_table_chunks(prop, chunksize) for prop in properties]
+        while True:
+            chunks = [next(reader, None) for reader in readers]
+            if all(chunk is None for chunk in chunks):
+                break
+
+            df_data = []
+            for prop, chunk in zip(properties, chunks):
+                if (chunk is None) or (chunks[0] is None) or not chunk.index.equals(chunks[0].index):
+                    raise ValueError("DataLayer:get_atoms: Atom tables '%s' and '%s' do not hold the same atoms in "
+                                     "the same order, chunked reads are not possible." % (properties[0], prop))
+                df_data.append(self._get_atom_table(prop, prop, by_value, utype.get(prop, None), tmp=chunk))
+
+            yield pd.concat(df_data, axis=1)
+
+    def set_coordinates(self, xyz, utype=None):
+        """
+        Replaces the XYZ coordinates of every atom, for example with a frame of a trajectory.
+
+        Parameters
+        ----------
+        xyz : array_like
+            A (natoms, 3) array of coordinates in atom index order.
+        utype : {str, pint.Unit}, optional
+            The length unit of xyz, otherwise internal units are assumed.
+
+        Returns
+        -------
+        return : bool
+            If the set was successful or not.
+        """
+
+        atom_properties = self.list_atom_properties()
+        if len(atom_properties) == 0:
+            raise KeyError("DataLayer:set_coordinates: No atoms have been added.")
+
+        # Coordinates are labeled by the atom indices already stored
+        table_name = "xyz" if "xyz" in atom_properties else atom_properties[0]
+        index = self.store.read_table(table_name, copy=False).index
+
+        xyz = np.asarray(xyz, dtype=np.float64)
+        if xyz.shape != (index.shape[0], 3):
+            raise ValueError("DataLayer:set_coordinates: Expected a (%d, 3) array, found shape %s." %
+                             (index.shape[0], str(xyz.shape)))
+
+        df = pd.DataFrame(xyz, index=index.copy(), columns=metadata.atom_metadata["xyz"]["required_columns"])
+        df.index.name = "atom_index"
+
+        if "xyz" in atom_properties:
+            self.store.remove_table("xyz")
+            self._atom_counts["xyz"] = 0
+
+        self._store_atom_table("xyz", df, "xyz", utype is not None, utype)
+        return True
+
     def list_valid_atom_properties(self):
         """
         Returns all possible atom properties which can be stored in the datalayer
@@ -1044,12 +1380,15 @@ class DataLayer(object):
         params = metadata.validate_term_dict(
             term_name, term_md, term_parameters, utype=utype)
 
+        return self._store_term_parameter(order, term_name, params, uid)
+
+    def _store_term_parameter(self, order, term_name, params, uid):
+        """
+        Stores a single set of validated parameters in internal units, returns the resulting uid.
+        """
+
         # First we check if we already have it
-        found_key = None
-        for k, v in self._terms[order].items():
-            if (v[0] == term_name) and np.allclose(v[1:], params):
-                found_key = k
-                break
+        found_key = self._terms[order].find(term_name, params)
 
         # Figure out what actually to do
         if uid is None:
@@ -1057,16 +1396,8 @@ class DataLayer(object):
             if found_key is not None:
                 return found_key
 
-            # We have a new parameter! Find the lowest number that we can add it at.
-            if not len(self._terms[order]):
-                new_key = 0
-            else:
-                new_key = utility.find_lowest_hole(self._terms[order])
-
-            params.insert(0, term_name)
-            self._terms[order][new_key] = params
-
-            return new_key
+            # We have a new parameter! Add it at the lowest free uid.
+            return self._terms[order].add(term_name, params)
 
         else:
 
@@ -1088,10 +1419,135 @@ class DataLayer(object):
                     return uid
 
             else:
-                params.insert(0, term_name)
-                self._terms[order][uid] = params
+                return self._terms[order].add(term_name, params, uid=uid)
+
+    def add_term_parameters(self, order, df, term_name=None, utype=None):
+        """
+        Adds many parameters for a given order at once.
+
+        Parameters
+        ----------
+        order : int
+            The order of the functional form (2, 3, 4, ...)
+        df : pd.DataFrame
+            A DataFrame with a column for each parameter of the functional form. An optional "uid" column assigns uids
+            and an optional "term_name" column gives the functional form of each row.
+        term_name : str, optional
+            The name of the functional form, required if df does not have a "term_name" column.
+        utype : {list, tuple, dict}, optional
+            Custom units for the parameters, otherwise uses the default units in the registered functional form.
+
+        Return
+        ------
+        uids : np.ndarray
+            The uids of each row in df
+
+        Examples
+        --------
+
+        df = pd.DataFrame({"K": [4.0, 4.0], "R0": [5.0, 6.0]})
+        assert [0, 1] == list(dl.add_term_parameters(2, df, term_name="harmonic"))
+
+        """
+
+        order = metadata.sanitize_term_order_name(order)
+
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError("DataLayer:add_term_parameters: Input type '%s' is not understood." % str(type(df)))
+
+        if "term_name" in df.columns:
+            groups = df.groupby("term_name", sort=False).indices.items()
+        elif term_name is not None:
+            groups = [(term_name, np.arange(df.shape[0]))]
+        else:
+            raise KeyError("DataLayer:add_term_parameters: Either a 'term_name' column or keyword must be supplied.")
+
+        if "uid" in df.columns:
+            uids = df["uid"].values
+            if not np.issubdtype(uids.dtype, np.integer):
+                if not np.issubdtype(uids.dtype, np.floating) or np.any(uids % 1):
+                    raise TypeError("DataLayer:add_term_parameters: uid column must be of type int, found type '%s'." %
+                                    str(uids.dtype))
+                uids = uids.astype(np.int64)
+        else:
+            uids = None
+
+        ret = np.zeros(df.shape[0], dtype=np.int64)
+        for fname, index in groups:
+
+            # Make sure we know what this is
+            try:
+                term_md = metadata.get_term_metadata(order, "forms", fname)
+            except KeyError:
+                raise KeyError("DataLayer:add_term_parameters: Did not understand term order: %d, name: %s'." %
+                               (order, fname))
+
+            param_names = term_md["parameters"]
+            not_found = set(param_names) - set(df.columns)
+            if not_found:
+                raise KeyError("DataLayer:add_term_parameters: Missing required columns '%s' for term '%s'." %
+                               (str(not_found), fname))
+
+            values = df[param_names].values[index]
+            if not np.issubdtype(values.dtype, np.number):
+                raise TypeError("DataLayer:add_term_parameters: Parameters must be floats, found type %s." %
+                                str(values.dtype))
+            values = values.astype(np.float64)
+
+            # Convert units to internal, a single factor per column
+            if utype is not None:
+                form_utype = self._term_utype_dict(term_md, utype, "add_term_parameters")
+                for num, key in enumerate(param_names):
+                    values[:, num] *= units.conversion_factor(form_utype[key], term_md["utype"][key])
+
+            if uids is None:
+                ret[index] = self._terms[order].add_unique(fname, values)
+            else:
+                ret[index] = self._store_term_parameters_by_uid(order, fname, values, uids[index])
+
+        return ret
+
+    def _store_term_parameters_by_uid(self, order, term_name, values, uids):
+        """
+        Stores many validated parameters in internal units under the given uids, existing uids must match.
+        """
+
+        unique_uids, first, inverse = np.unique(uids, return_index=True, return_inverse=True)
+
+        # Rows repeating a uid must match its first row
+        if not np.allclose(values[first][inverse], values):
+            raise KeyError("DataLayer:add_term_parameters: uid repeated with different parameters.")
+
+        # Keep the order of the rows
+        row_order = np.argsort(first)
+        unique_uids, values = unique_uids[row_order], values[first[row_order]]
+
+        exists, match = self._terms[order].compare_many(term_name, values, unique_uids)
+        if np.any(exists & ~match):
+            raise KeyError("DataLayer:add_term_parameters: uid already exists, but does not much current parameters.")
+
+        self._terms[order].add_many(term_name, values[~exists], uids=unique_uids[~exists])
+
+        return uids
+
+    def _term_utype_dict(self, term_md, utype, func_name):
+        """
+        Builds a {parameter : unit} dictionary from a list, tuple, or dictionary of units.
+        """
+
+        if isinstance(utype, (list, tuple)):
+            if len(utype) != len(term_md["parameters"]):
+                raise KeyError(
+                    "DataLayer:%s: length of utype should match the length of parameters." % func_name)
+            utype = {k: v for k, v in zip(term_md["parameters"], utype)}
+
+        if not isinstance(utype, dict):
+            raise TypeError("DataLayer:%s: Input utype '%s' is not understood." % (func_name, str(type(utype))))
 
-                return uid
+        if (set(term_md["parameters"]) != set(utype.keys())):
+            raise KeyError("DataLayer:%s: Utype and ftype keys are not consistent" % func_name)
+
+        return utype
 
     def get_term_parameter(self, order, uid=None, utype=None, ftype=None):
         """
@@ -1185,6 +1641,79 @@ class DataLayer(object):
 
         return ftype, parameters
 
+    def get_term_parameters(self, order, uids=None, utype=None, ftype=None):
+        """
+        Obtains many term parameters of a given order at once.
+
+        Parameters
+        ----------
+        order : int
+            The order of the functional form (2, 3, 4, ...)
+        uids : list, optional
+            The uids to obtain, otherwise all stored uids are returned.
+        utype : {list, tuple, dict}, optional
+            The units to return the parameters in, otherwise internal units are used.
+        ftype : str, optional
+            The functional form to convert all parameters to, otherwise the stored functional form is used.
+
+        Return
+        ------
+        ret : pd.DataFrame
+            A DataFrame indexed by uid containing a "term_name" column and a column for each parameter.
+        """
+
+        order = metadata.sanitize_term_order_name(order)
+
+        if ftype is not None and not isinstance(ftype, str):
+            raise TypeError("DataLayer:get_term_parameters: Input ftype '%s' is not understood." % str(type(ftype)))
+
+        if uids is None:
+            uids = sorted(self._terms[order])
+        else:
+            uids = [int(x) for x in uids]
+
+        missing = [x for x in uids if x not in self._terms[order]]
+        if missing:
+            raise KeyError("DataLayer:get_term_parameters: Did not find terms of order %d with uids %s" %
+                           (order, str(missing)))
+
+        # Group the uids by stored functional form
+        groups = {}
+        for uid in uids:
+            groups.setdefault(self._terms[order][uid][0], []).append(uid)
+
+        frames = []
+        for form_name, form_uids in groups.items():
+            term_md = metadata.get_term_metadata(order, "forms", form_name)
+            values = np.array([self._terms[order][uid][1:] for uid in form_uids], dtype=np.float64)
+            values = values.reshape(len(form_uids), len(term_md["parameters"]))
+            data = pd.DataFrame(values, index=form_uids, columns=term_md["parameters"])
+
+            # Whole parameter columns are converted at once
+            if (ftype is not None) and (ftype != form_name):
+                term_md = metadata.get_term_metadata(order, "forms", ftype)
+                converted = form_converters.convert_form_arrays(order, {k: data[k].values for k in data.columns},
+                                                                form_name, ftype)
+                data = pd.DataFrame(converted, index=form_uids, columns=term_md["parameters"])
+                form_name = ftype
+
+            # A single conversion factor per column
+            if utype is not None:
+                form_utype = self._term_utype_dict(term_md, utype, "get_term_parameters")
+                for key in term_md["parameters"]:
+                    data[key] *= units.conversion_factor(term_md["utype"][key], form_utype[key])
+
+            data.insert(0, "term_name", form_name)
+            frames.append(data)
+
+        if len(frames) == 0:
+            ret = pd.DataFrame(columns=["term_name"])
+        else:
+            ret = pd.concat(frames, sort=False).loc[uids]
+        ret.index.name = "uid"
+
+        return ret
+
     def list_term_parameters(self, order):
         """
         Gives information for all terms of specified order
@@ -1205,6 +1734,34 @@ class DataLayer(object):
 
         return self._terms[order]
 
+    def get_term_parameter_arrays(self, order, term_name=None):
+        """
+        Returns the term parameters of a given order as columnar arrays grouped by functional form.
+
+        Parameters
+        ----------
+        order : int
+            The order of the functional form (2, 3, 4, ...)
+        term_name : str, optional
+            Only return the arrays of this functional form.
+
+        Return
+        ----------
+        return : dict
+            Returns dictionary of form
+                { form_name : {"uid" : uids, parameter_name : values, ...} }
+            where all arrays are read-only, sorted by uid, and in internal units.
+        """
+
+        order = metadata.sanitize_term_order_name(order)
+
+        if term_name is None:
+            forms = self._terms[order].list_forms()
+        else:
+            forms = [term_name]
+
+        return {form: self._terms[order].get_arrays(form) for form in forms}
+
     def remove_term_parameter(self, order, uid):
         """
         Removes parameter from datalayer based on term order and uid. This paramater must have a term count of 0.
@@ -1237,8 +1794,8 @@ class DataLayer(object):
                 "Terms for order %s and uid %s exist in datalayer. Term parameter cannot be removed"
                 % (order, uid))
 
-        # Remove (just delete this key out of _terms dict)
-        del self._terms[order][uid]
+        # Remove from the parameter registry
+        self._terms[order].remove(uid)
 
         return True
 
@@ -1340,6 +1897,8 @@ class DataLayer(object):
             self._term_count[order]["total"] += cnt
 
         # Finally store the dataframe
+        if order in self._atom_term_index:
+            self._append_atom_term_index(order, df)
         return self.store.add_table("term" + str(order), df)
 
     def remove_terms(self, order, index=None, propagate=False):
@@ -1372,73 +1931,181 @@ class DataLayer(object):
             order_list.extend([x for x in [3, 4] if x > order])
 
         # Figure out atom numbers for this removal.
-        # The way this should be done - the index for a particular term to be removed will give the atoms which are involved.
-        # All higher order terms which should also be removed if this removal is propagated will involve these atoms.
-        atoms = []
+        # The index for a particular term to be removed will give the atoms which are involved. All higher order terms
+        # which should also be removed if this removal is propagated will involve these atoms.
+        atoms = None
 
         if index is not None:
-            atom_df = self.get_terms(order).iloc[index]
-            cols = metadata.get_term_metadata(order, "index_columns")
-            cols = [x for x in cols if 'atom' in x]
-
-            # Terms are to be removed for higher order interactions containing. Below results df with just atoms of interest
-            atoms = atom_df[cols]
+            atoms = self._get_atom_term_index(order)["atoms"][np.asarray(index, dtype=np.int64)]
 
         # Loop through order to be removed
         for current_order in order_list:
 
-            # Get column names for order ord
-            cols = metadata.get_term_metadata(current_order, "index_columns")
-            cols = [x for x in cols if 'atom' in x]
+            # If no index is given, remove all interactions. Otherwise, only remove interactions for specified atoms.
+            if atoms is None:
+                if ("term" + str(current_order)) in self.store.list_tables():
+                    self.store.remove_table("term" + str(current_order))
+                self._term_count[current_order] = {"total": 0}
+                if current_order in self._atom_term_index:
+                    self._delete_atom_term_index(current_order, None)
+                continue
 
-            # Get terms for order ord
-            terms = self.get_terms(current_order)
+            reverse_index = self._get_atom_term_index(current_order)
+            remove_index = self._find_terms_by_atoms(reverse_index, atoms)
+            if remove_index.shape[0] == 0:
+                continue
 
-            # If atoms list is empty, remove_index = None (ie, all removed). Otherwise, only remove interactions
-            # for specified atoms.
-            if not len(atoms):
-                remove_index = None
-            else:
-                remove_index = []
+            # Use FL remove function, it expects sorted row positions
+            self.store.remove_table("term" + str(current_order), remove_index)
 
-                # Build list of indices to remove. Should be removed for order if all atoms from 'atoms' are in same row
-                # in dataframe
-                for atom_list in atoms.values:
-                    search = terms[cols].isin(atom_list).T
-                    matching_ind = search.sum()[search.sum() ==
-                                                order].index.tolist()
-                    remove_index.extend(matching_ind)
+            # Update the term count
+            uvals, ucnts = np.unique(reverse_index["term_index"][remove_index], return_counts=True)
+            for uval, cnt in zip(uvals, ucnts):
+                self._term_count[current_order][uval] -= cnt
+                if self._term_count[current_order][uval] == 0:
+                    del self._term_count[current_order][uval]
 
-            # Use FL remove function.
-            self.store.remove_table("term" + str(current_order), remove_index)
+                self._term_count[current_order]["total"] -= cnt
 
-            df = self.get_terms(current_order)
+            self._delete_atom_term_index(current_order, remove_index)
 
-            # Redo term count
-            self._term_count[current_order] = {}
-            self._term_count[current_order]["total"] = 0
+        return True
 
-            if not df.empty:
-                uvals, ucnts = np.unique(df["term_index"], return_counts=True)
-                for uval, cnt in zip(uvals, ucnts):
-                    if uval not in self._term_count[current_order]:
-                        self._term_count[current_order][uval] = cnt
-                    else:
-                        self._term_count[current_order][uval] += cnt
+    def _get_atom_term_index(self, order):
+        """
+        Returns the reverse index from atoms to the terms of a given order that contain them, built on first use and
+        updated in place by `add_terms` and `remove_terms`.
 
-                    self._term_count[current_order]["total"] += cnt
+        Every term row has a stable id, "ids", "atoms" and "term_index" hold the rows in store order and "keys" holds
+        the sorted (atom << 32 | id) pairs so that all terms of an atom are contiguous.
+        """
 
-        return True
+        if order in self._atom_term_index:
+            return self._atom_term_index[order]
+
+        cols = metadata.get_term_metadata(order, "index_columns")
+        cols = [x for x in cols if 'atom' in x]
+
+        terms = self.get_terms(order, copy=False)
+        if terms.empty:
+            term_atoms = np.zeros((0, len(cols)), dtype=np.int64)
+            term_index = np.zeros(0, dtype=np.int64)
+        else:
+            term_atoms = terms[cols].values.astype(np.int64)
+            term_index = terms["term_index"].values.astype(np.int64)
+
+        ids = np.arange(term_atoms.shape[0], dtype=np.int64)
+        ret = {
+            "ids": ids,
+            "next_id": ids.shape[0],
+            "atoms": term_atoms,
+            "term_index": term_index,
+            "keys": np.sort(_atom_term_keys(term_atoms, ids))
+        }
+
+        self._atom_term_index[order] = ret
+        return ret
+
+    def _append_atom_term_index(self, order, df):
+        """
+        Adds the rows of a new term DataFrame to the end of the reverse index.
+        """
+
+        index = self._atom_term_index[order]
+
+        cols = [x for x in metadata.get_term_metadata(order, "index_columns") if 'atom' in x]
+        term_atoms = df[cols].values.astype(np.int64)
+        ids = np.arange(index["next_id"], index["next_id"] + term_atoms.shape[0], dtype=np.int64)
+
+        # Merge the new sorted keys into the existing keys
+        keys = np.sort(_atom_term_keys(term_atoms, ids))
+        index["keys"] = np.insert(index["keys"], np.searchsorted(index["keys"], keys), keys)
+
+        index["ids"] = np.concatenate((index["ids"], ids))
+        index["atoms"] = np.concatenate((index["atoms"], term_atoms))
+        index["term_index"] = np.concatenate((index["term_index"], df["term_index"].values.astype(np.int64)))
+        index["next_id"] += term_atoms.shape[0]
+
+    def _delete_atom_term_index(self, order, rows):
+        """
+        Deletes the given sorted row positions from the reverse index, or all rows if rows is None.
+        """
+
+        index = self._atom_term_index[order]
+
+        if rows is None:
+            rows = np.arange(index["ids"].shape[0])
+
+        # Find the exact positions of the keys of the removed rows, a term may contain an atom more than once
+        keys = np.unique(_atom_term_keys(index["atoms"][rows], index["ids"][rows]))
+        lower = np.searchsorted(index["keys"], keys, side="left")
+        counts = np.searchsorted(index["keys"], keys, side="right") - lower
+        offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        index["keys"] = np.delete(index["keys"], np.repeat(lower, counts) + offsets)
+        index["ids"] = np.delete(index["ids"], rows)
+        index["atoms"] = np.delete(index["atoms"], rows, axis=0)
+        index["term_index"] = np.delete(index["term_index"], rows)
+
+    def _find_terms_by_atoms(self, reverse_index, atoms):
+        """
+        Finds the sorted row positions of all terms which contain every atom of any row of atoms.
+        """
+
+        if (atoms.shape[0] == 0) or (reverse_index["atoms"].shape[0] == 0):
+            return np.zeros(0, dtype=np.int64)
+
+        # Candidate terms are all terms containing the first atom of each removed term
+        first_atoms = atoms[:, 0].astype(np.int64)
+        lower = np.searchsorted(reverse_index["keys"], first_atoms << _TERM_ID_BITS, side="left")
+        upper = np.searchsorted(reverse_index["keys"], (first_atoms + 1) << _TERM_ID_BITS, side="left")
+        counts = upper - lower
+
+        query = np.repeat(np.arange(atoms.shape[0]), counts)
+        offsets = np.arange(query.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        ids = reverse_index["keys"][np.repeat(lower, counts) + offsets] & _TERM_ID_MASK
+
+        # Row positions of the candidate ids, ids are sorted in store order
+        rows = np.searchsorted(reverse_index["ids"], ids)
+
+        # Keep the candidates which contain every atom of the removed term
+        candidates = reverse_index["atoms"][rows]
+        keep = np.ones(rows.shape[0], dtype=bool)
+        for col in range(atoms.shape[1]):
+            keep &= (candidates == atoms[query, col][:, None]).any(axis=1)
+
+        return np.unique(rows[keep])
+
+    def get_terms(self, order, copy=True, chunksize=None):
+        """
+        Obtains the terms of a given order.
+
+        Parameters
+        ----------
+        order : {str, int}
+            The order (number of atoms) involved in the expression i.e. 2, "two"
+        copy : bool, optional
+            If False a read-only DataFrame sharing memory with the store is returned where possible.
+        chunksize : int, optional
+            If set, returns a generator of DataFrames of at most chunksize terms which are read from the store one
+            chunk at a time.
 
-    def get_terms(self, order):
+        Returns
+        -------
+        return : pd.DataFrame
+            The terms with columns ["atom1", ..., "atom(order)", "term_index"]
+        """
         order = metadata.sanitize_term_order_name(order)
         if order not in list(self._terms):
             raise KeyError(
                 "DataLayer:add_terms: Did not understand order key '%s'." %
                 str(order))
 
+        if chunksize is not None:
+            return self._read_table_chunks("term" + str(order), chunksize)
+
         try:
-            return self.store.read_table("term" + str(order))
+            return self.store.read_table("term" + str(order), copy=copy)
         except KeyError:
             cols = metadata.get_term_metadata(
                 order, "index_columns") + ["term_index"]
@@ -1548,18 +2215,41 @@ class DataLayer(object):
                 Order of atom interaction. None is returned if atom pair is not involved in bond, angle, or dihedral
         """
 
-        orders = None
+        orders = self._query_atom_pairs([atom1_index], [atom2_index])[0]
+        if np.isnan(orders):
+            return None
+
+        return int(orders)
 
+    def _query_atom_pairs(self, atom1_index, atom2_index):
+        """
+        Finds the order of many atom pairs at once, see `query_atom_pair`. Returns a float array with NaN for pairs
+        which are not connected.
+        """
+
+        atom1_index = np.asarray(atom1_index, dtype=np.int64)
+        atom2_index = np.asarray(atom2_index, dtype=np.int64)
+
+        orders = np.full(atom1_index.shape[0], np.nan)
+        if atom1_index.shape[0] == 0:
+            return orders
+
+        # Pairs are matched on the first and last atom of each term, higher orders take precedence
         for ord in [2, 3, 4]:
-            terms = self.get_terms(ord)
+            terms = self.get_terms(ord, copy=False)
 
             if not terms.empty:
                 v_col_name = terms.columns.tolist()[-2]
-                a1 = terms['atom1'] == atom1_index
-                a2 = terms[v_col_name] == atom2_index
+                term_atom1 = terms['atom1'].values.astype(np.int64)
+                term_atom2 = terms[v_col_name].values.astype(np.int64)
 
-                if not terms[a1 & a2].empty:
-                    orders = ord
+                # Encode each pair as a single integer
+                low = min(atom1_index.min(), atom2_index.min(), term_atom1.min(), term_atom2.min())
+                base = max(atom2_index.max(), term_atom2.max()) - low + 1
+                keys = (atom1_index - low) * base + (atom2_index - low)
+                term_keys = (term_atom1 - low) * base + (term_atom2 - low)
+
+                orders[np.in1d(keys, term_keys)] = ord
 
         return orders
 
@@ -1622,7 +2312,7 @@ class DataLayer(object):
         tmp_data = []
         for k in key:
             k = "other_" + k
-            tmp_data.append(self.store.read_table(k))
+            tmp_data.append(self.store.read_table(k, copy=False))
 
         return pd.concat(tmp_data, axis=1)
 
@@ -1736,16 +2426,129 @@ class DataLayer(object):
             param_dict['parameters'] = nb_converter.convert_LJ_coeffs(
                 param_dict['parameters'], nb_model, model_default)
 
-        # Store it! --
-        param_dict_key = (atom_type, atom_type2)
+        # Store it! -- the store sorts (atom_type1, atom_type2) so that atom_type1 is always less than atom_type2
+        values = [param_dict['parameters'][k] for k in metadata.get_nb_metadata(nb_name, "parameters")]
+        if atom_type2 is None:
+            self._nb_parameters.set(nb_name, [atom_type], [values])
+        else:
+            self._nb_parameters.set(nb_name, [atom_type], [values], atom_type2=[atom_type2])
+
+        return True
+
+    def add_nb_parameters(self, df, nb_name, nb_model=None, utype=None):
+        """
+        Stores many nb parameters at once.
 
-        # Sort if atom_type2 is not None. atom_type1 is always less than atom_type2
-        if atom_type2 != None:
-            param_dict_key = tuple(sorted(param_dict_key))
+        Parameters
+        ----------
+        df : pd.DataFrame
+            A DataFrame with an "atom_type" column, an optional "atom_type2" column for pair interactions, and a
+            column for each parameter of the functional form.
+        nb_name: str
+            The name of the functional form (eg - "LJ", "Buckingham")
+        nb_model: str
+            (optional) - The form of the input (ex 'epsilon/sigma' with 'nb_name=LJ' indicates the input parameters are
+            'epsilon' and 'sigma'
+        utype: dict
+            Units of the parameters
+
+        Returns
+        -------------
+        return: bool
+              Returns True if successful
+        """
+
+        if not isinstance(df, pd.DataFrame):
+            raise TypeError("DataLayer:add_nb_parameters: Input type '%s' is not understood." % str(type(df)))
+
+        try:
+            form_md = metadata.get_nb_metadata(nb_name, model=nb_model)
+        except KeyError:
+            raise KeyError("DataLayer:add_nb_parameters: Did not understand nonbond form: %s, model: %s'." %
+                           (nb_name, nb_model))
+        parameters = form_md['parameters']
+
+        not_found = set(parameters + ["atom_type"]) - set(df.columns)
+        if not_found:
+            raise KeyError("DataLayer:add_nb_parameters: Missing required columns '%s' for nonbond form %s." %
+                           (str(not_found), nb_name))
+
+        # A single conversion factor per column
+        values = {k: df[k].values.astype(np.float64) for k in parameters}
+        if utype is not None:
+            if isinstance(utype, (list, tuple)):
+                if len(utype) != len(parameters):
+                    raise ValueError("DataLayer:add_nb_parameters: Number of units passed is %d, expected %d" %
+                                     (len(utype), len(parameters)))
+                utype = {k: v for k, v in zip(parameters, utype)}
+            elif not isinstance(utype, dict):
+                raise TypeError("DataLayer:add_nb_parameters: Unit type '%s' not understood" % str(type(utype)))
+
+            for key in parameters:
+                if key not in utype:
+                    raise KeyError("DataLayer:add_nb_parameters: Did not find expected key '%s' in utype." % key)
+                values[key] = values[key] * units.conversion_factor(utype[key], form_md["utype"][key])
+
+        if nb_name == "LJ":
+            model_default = metadata.get_nb_metadata(nb_name, "default")
+            values = nb_converter.convert_LJ_arrays(values, nb_model or model_default, model_default)
+
+        values = np.column_stack([values[k] for k in metadata.get_nb_metadata(nb_name, "parameters")])
+        atom_type = df["atom_type"].values.tolist()
+        if "atom_type2" in df.columns:
+            self._nb_parameters.set(nb_name, atom_type, values, atom_type2=df["atom_type2"].values.tolist())
+        else:
+            self._nb_parameters.set(nb_name, atom_type, values)
 
-        self._nb_parameters[param_dict_key] = param_dict
         return True
 
+    def get_nb_parameters(self, nb_name, nb_model=None, utype=None, itype="single"):
+        """
+        Retrieves all nb parameters of a functional form as arrays.
+
+        Parameters
+        -----------------
+        nb_name: str
+            Name of nonbond potential (ex "LJ" or "Buckingham")
+        nb_model: str
+            The desired output form (optional). If not indicated, default for datalayer will be returned.
+        utype: dict
+            Units of output. Must be compatible with parameters.
+        itype: str
+            Either "single" for (atom_type1, None) interactions or "pair" for (atom_type1, atom_type2) interactions.
+
+        Returns
+        ------------------
+        return: dict
+
+        Returned dictionary has form:
+            {
+                "atom_type": atom_types,
+                "atom_type2": atom_types2, (only for itype="pair")
+                parameter_name_1: nb_parameters_1,
+                ...
+            }
+        """
+
+        form_md = metadata.get_nb_metadata(nb_name, model=nb_model)
+
+        ret = self._nb_parameters.get_arrays(nb_name, itype=itype)
+        values = {k: ret.pop(k) for k in metadata.get_nb_metadata(nb_name, "parameters")}
+
+        if nb_name == "LJ":
+            model_default = metadata.get_nb_metadata(nb_name, "default")
+            values = nb_converter.convert_LJ_arrays(values, model_default, nb_model or model_default)
+
+        # A single conversion factor per column
+        if utype is not None:
+            for key in form_md["parameters"]:
+                if key not in utype:
+                    raise KeyError("DataLayer:get_nb_parameters: Did not find expected key '%s' in utype." % key)
+                values[key] = values[key] * units.conversion_factor(form_md["utype"][key], utype[key])
+
+        ret.update(values)
+        return ret
+
     def get_nb_parameter(self,
                          atom_type,
                          nb_model=None,
@@ -1784,9 +2587,9 @@ class DataLayer(object):
         param_dict_key = (atom_type, atom_type2)
 
         # Get information from data layer - check that interaction is set for atom types
-        if param_dict_key in self._nb_parameters.keys():
-            # Use deep copy here
-            nb_parameters = copy.deepcopy(self._nb_parameters[param_dict_key])
+        if param_dict_key in self._nb_parameters:
+            # The store returns a new dictionary each time
+            nb_parameters = self._nb_parameters[param_dict_key]
         else:
             raise KeyError(
                 "Nonbond interaction for atom types (%s, %s) not found" %
@@ -1902,16 +2705,20 @@ class DataLayer(object):
             Returns True if successful
         """
 
-        parameters = self.list_nb_parameters(
+        parameters = self.get_nb_parameters(
             nb_name="LJ", nb_model="AB", itype="single")
+        atom_types = parameters.pop("atom_type")
+        if atom_types.shape[0] == 0:
+            return True
 
-        parameter_keys = list(parameters)
+        # Build the full pair matrix at once and store the upper triangle
+        mixed = nb_converter.mix_LJ_table(
+            parameters, self._mixing_rule, origin="AB", final="AB")
+        k, k2 = np.triu_indices(atom_types.shape[0])
 
-        for k in range(0, len(parameter_keys)):
-            for k2 in range(0, k + 1):
-                self.mix_LJ_parameters(
-                    atom_type1=parameter_keys[k][0],
-                    atom_type2=parameter_keys[k2][0])
+        values = np.column_stack([mixed[x][k, k2] for x in metadata.get_nb_metadata("LJ", "parameters")])
+        self._nb_parameters.set(
+            "LJ", atom_types[k].tolist(), values, atom_type2=atom_types[k2].tolist())
 
         return True
 
@@ -1921,11 +2728,7 @@ class DataLayer(object):
             ex. - ["LJ", "Buckingham"]
         """
 
-        nb_types = []
-        for k, v in self._nb_parameters.items():
-            nb_types.append(v['form'])
-        unique_nb_types = np.unique(nb_types)
-        return unique_nb_types
+        return np.unique(self._nb_parameters.list_forms())
 
     def list_nb_parameters(self,
                            nb_name,
@@ -1967,23 +2770,26 @@ class DataLayer(object):
                 }
         """
         return_parameters = {}
-        term_dict = self._nb_parameters.copy()
 
-        for key, value in term_dict.items():
-            if value['form'] != nb_name:
+        if itype not in ["all", "single", "pair"]:
+            return return_parameters
+
+        form_params = metadata.get_nb_metadata(nb_name, "parameters", model=nb_model)
+
+        for current in ["single", "pair"]:
+            if itype not in ["all", current]:
                 continue
 
-            if (None in key) and (itype == "all" or itype == "single"):
-                return_parameters[key] = self.get_nb_parameter(
-                    atom_type=key[0],
-                    atom_type2=key[1],
-                    nb_model=nb_model,
-                    utype=utype)
-            elif (None not in key) and (itype == "all" or itype == "pair"):
-                return_parameters[key] = self.get_nb_parameter(
-                    atom_type=key[0],
-                    atom_type2=key[1],
-                    nb_model=nb_model,
-                    utype=utype)
+            data = self.get_nb_parameters(nb_name, nb_model=nb_model, utype=utype, itype=current)
+
+            atom_type = data["atom_type"].tolist()
+            if current == "single":
+                atom_type2 = [None] * len(atom_type)
+            else:
+                atom_type2 = data["atom_type2"].tolist()
+            values = [data[k].tolist() for k in form_params]
+
+            for num, key in enumerate(zip(atom_type, atom_type2)):
+                return_parameters[key] = {k: v[num] for k, v in zip(form_params, values)}
 
         return return_parameters
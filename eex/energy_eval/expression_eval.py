@@ -63,15 +63,12 @@ def evaluate_energy_expression(dl, utype):
     loop_data = {
         "two-body": {
             "order": 2,
-            "get_data": "get_bonds"
         },
         "three-body": {
             "order": 3,
-            "get_data": "get_angles"
         },
         "four-body": {
             "order": 4,
-            "get_data": "get_dihedrals"
         }
     }
 
@@ -79,24 +76,39 @@ def evaluate_energy_expression(dl, utype):
     xyz = dl.get_atoms("xyz")
 
     for order_key, inst in loop_data.items():
-        indices = dl.call_by_string(inst["get_data"])
         order = inst["order"]
-        for idx, df in indices.groupby("term_index"):
-            if df.shape[0] == 0: continue
+        indices = dl.get_terms(order, copy=False)
+        if indices.shape[0] == 0: continue
+
+        term_index = indices["term_index"].values
+        known = np.zeros(term_index.shape[0], dtype=bool)
+
+        # Evaluate all terms sharing a functional form at once (eg 'harmonic' -> K * (r-r0) ** 2)
+        for form_type, arrays in dl.get_term_parameter_arrays(order).items():
+            uids = arrays["uid"]
+            pos = np.searchsorted(uids, term_index)
+            pos[pos >= uids.shape[0]] = 0
+            mask = uids[pos] == term_index
+            if not np.any(mask): continue
+            known |= mask
 
             # Variables are computed distances and angles based on xyz positions
-            variables = _compute_temporaries(order, xyz, df)
+            variables = _compute_temporaries(order, xyz, indices[mask])
 
-            # Form type is name of functional form (eg 'harmonic' and parameters contains parameters and values (eg 'K' : 200)
-            form_type, parameters = dl.get_term_parameter(order, idx)
+            # Gather the parameters of every term (eg 'K' : [200, 200, ...])
+            parameters = {k: v[pos[mask]] for k, v in arrays.items() if k != "uid"}
 
-            # Above values are used to look up functional form (eg 'harmonic' -> K * (r-r0) ** 2)
             form = metadata.get_term_metadata(order, "forms",
                                               form_type)["form"]
 
             energy[order_key] += np.sum(
                 evaluate_form(form, parameters, variables))
 
+        if not np.all(known):
+            missing = np.unique(term_index[~known])
+            raise KeyError("evaluate_energy_expression: Did not find term parameters for order %d, uids %s" %
+                           (order, str(list(missing))))
+
     # LJ terms
     # Electostatics
 
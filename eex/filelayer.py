@@ -2,23 +2,101 @@
 Base class for the filelayer.
 """
 
+import collections
+import functools
+import json
 import os
+import re
+import shutil
+import sqlite3
+import struct
+import threading
 
 import pandas as pd
 import numpy as np
 
+# Python 2/3 compat
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-def build_store(store_type, name, store_location, save_data):
+
+def build_store(store_type, name, store_location, save_data, **kwargs):
+    """
+    Builds a store of a given type, additional keyword arguments are passed to the store.
+    """
 
     if store_type.upper() == "HDF5":
-        return HDFStore(name, store_location, save_data)
+        return HDFStore(name, store_location, save_data, **kwargs)
     elif store_type.upper() == "MEMORY":
         return MemoryStore(name, store_location, save_data)
+    elif store_type.upper() == "COLUMNAR":
+        return ColumnarStore(name, store_location, save_data)
+    elif store_type.upper() == "NPY":
+        return NPYStore(name, store_location, save_data, **kwargs)
+    elif store_type.upper() == "SQLITE":
+        return SQLiteStore(name, store_location, save_data, **kwargs)
     else:
         raise KeyError("build_store: store_type of type '%s' not recognized." %
                        store_type)
 
 
+def _column_values(df):
+    """
+    Returns the values of every column of a DataFrame, or the values of a Series.
+    """
+
+    if isinstance(df, pd.Series):
+        return [df.values]
+
+    return [df.iloc[:, num].values for num in range(df.shape[1])]
+
+
+def _mark_read_only(df):
+    """
+    Marks the NumPy arrays holding the columns of a DataFrame as non-writeable, returns True if every column is now
+    read-only and the columns of each dtype share a single array.
+
+    Columns of one dtype held in separate arrays are later consolidated by pandas into a new writeable array.
+    """
+
+    owners = {}
+    consolidated = True
+    for values in _column_values(df):
+        if not isinstance(values, np.ndarray):
+            continue
+
+        owner = values if values.base is None else values.base
+        if owners.setdefault(values.dtype, owner) is not owner:
+            consolidated = False
+
+        if isinstance(owner, np.ndarray):
+            owner.flags.writeable = False
+
+    if not consolidated:
+        return False
+
+    return not any(isinstance(values, np.ndarray) and values.flags.writeable for values in _column_values(df))
+
+
+def _read_only_view(df):
+    """
+    Returns a shallow copy of a DataFrame whose NumPy arrays are marked as non-writeable.
+
+    The arrays owned by the store are shared with the view so no data is copied, a private copy is only made when the
+    column arrays are views of memory that cannot be marked or are not yet consolidated. Writing to existing values of
+    the view raises a ValueError, assigned columns only belong to the view.
+    """
+
+    view = df.copy(deep=False)
+    if not _mark_read_only(view):
+        view = df.copy()
+        _mark_read_only(view)
+
+    return view
+
+
 class BaseStore(object):
     def __init__(self, name, store_location, save_data):
 
@@ -39,19 +117,146 @@ class BaseStore(object):
         return store_location
 
 
+# Columns that are indexed in HDF5 tables
+_DATA_COLUMNS = re.compile(r"^(atom_index\d*|term_index|atom\d+)$")
+
+# Default size of the HDF5 write buffer of each table and of the read cache in bytes
+_HDF_BUFFER_SIZE = 16 * 1024**2
+_HDF_CACHE_SIZE = 128 * 1024**2
+
+
+def _nbytes(data):
+    """
+    Returns the memory used by a DataFrame or Series, including the index.
+    """
+
+    return int(np.sum(data.memory_usage(index=True)))
+
+
 class HDFStore(BaseStore):
-    def __init__(self, name, store_location, save_data):
+    """
+    A store that holds each table in a PyTables table of a HDF5 file.
+
+    Appended data is held in a write buffer per table which is written once it exceeds buffer_size bytes, or before
+    the table is read, modified or the store is closed. Full table reads are held in a least recently used cache of
+    up to cache_size bytes, the cache_hits and cache_misses counters can be used to tune the cache size.
+
+    Parameters
+    ----------
+    buffer_size : int, optional
+        The size of the write buffer of each table in bytes, a value of zero writes every append directly.
+    complevel : int, optional
+        The compression level from 0 to 9.
+    complib : {"blosc", "zlib", "lzo", "bzip2"}, optional
+        The compression library, defaults to "blosc" if complevel is set.
+    expectedrows : int, optional
+        A hint of the number of rows of each table used to size the PyTables chunks.
+    cache_size : int, optional
+        The size of the read cache in bytes, a value of zero disables the cache.
+    """
+
+    def __init__(self, name, store_location, save_data, buffer_size=_HDF_BUFFER_SIZE, complevel=None, complib=None,
+                 expectedrows=None, cache_size=_HDF_CACHE_SIZE):
 
         # Init the base class
         BaseStore.__init__(self, name, store_location, save_data)
 
+        if (complevel is not None) and (complib is None):
+            complib = "blosc"
+
         # Setup the store
         self.store_filename = os.path.join(self.store_location,
                                            self.name + ".h5")
-        self.store = pd.HDFStore(self.store_filename)
+        self.store = pd.HDFStore(self.store_filename, complevel=complevel, complib=complib)
+        self.complevel = complevel
+        self.complib = complib
 
         # Set additional state
         self.created_tables = []
+        self.written_tables = set()
+        self.buffer_size = buffer_size
+        self.expectedrows = expectedrows
+        self.buffers = {}
+        self.buffer_bytes = {}
+        self.nrows = {}
+
+        # Read cache
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.cache_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _invalidate(self, key):
+        """
+        Removes a table from the read cache.
+        """
+
+        if key in self.cache:
+            self.cache_bytes -= _nbytes(self.cache.pop(key))
+
+    def _cache_table(self, key, data):
+        """
+        Adds a table to the read cache, evicting the least recently used tables.
+        """
+
+        nbytes = _nbytes(data)
+        if nbytes > self.cache_size:
+            return
+
+        while self.cache and (self.cache_bytes + nbytes > self.cache_size):
+            self.cache_bytes -= _nbytes(self.cache.popitem(last=False)[1])
+
+        self.cache[key] = data
+        self.cache_bytes += nbytes
+
+    def _write_table(self, key, data, data_columns=None):
+        """
+        Creates or overwrites a table.
+        """
+
+        # Index the columns that are commonly queried
+        if (data_columns is None) and isinstance(data, pd.DataFrame):
+            data_columns = [x for x in data.columns if _DATA_COLUMNS.match(str(x))]
+
+        expectedrows = data.shape[0]
+        if self.expectedrows is not None:
+            expectedrows = max(self.expectedrows, expectedrows)
+
+        # HDFStore.put does not forward expectedrows on newer pandas, the table is created through append instead
+        if key in self.store:
+            self.store.remove(key)
+
+        self.store.append(key, data, format="t", data_columns=data_columns, expectedrows=expectedrows,
+                          complevel=self.complevel, complib=self.complib)
+
+    def _flush(self, key=None):
+        """
+        Writes the buffered data of a table, or all tables if key is None.
+        """
+
+        if key is None:
+            keys = list(self.buffers)
+        elif key in self.buffers:
+            keys = [key]
+        else:
+            keys = []
+
+        for key in keys:
+            data = self.buffers.pop(key)
+            self.buffer_bytes.pop(key)
+
+            if len(data) == 1:
+                data = data[0]
+            else:
+                data = pd.concat(data)
+
+            if key in self.written_tables:
+                self.store.append(key, data, complevel=self.complevel, complib=self.complib)
+                continue
+
+            self._write_table(key, data)
+            self.written_tables.add(key)
 
     def add_table(self, key, data):
         """
@@ -69,79 +274,186 @@ class HDFStore(BaseStore):
         if 0 in data.shape:
             return False
 
-        # Do we append, or do we need a new table?
-        do_append = True
         if key not in self.created_tables:
-            do_append = False
             self.created_tables.append(key)
+            self.nrows[key] = 0
 
-        if do_append:
-            self.store.append(key, data)
-        else:
-            data.to_hdf(self.store, key, format="t", append=do_append)
+        self.nrows[key] += data.shape[0]
+        self.buffers.setdefault(key, []).append(data)
+        self._invalidate(key)
+        self.buffer_bytes[key] = self.buffer_bytes.get(key, 0) + _nbytes(data)
+        if self.buffer_bytes[key] >= self.buffer_size:
+            self._flush(key)
 
         return True
 
-    def read_table(self, key, rows=None, where=None, chunksize=None):
+    def _build_where(self, key, rows, where):
+        """
+        Combines the rows and where arguments into a PyTables selection.
+        """
+
+        if isinstance(where, dict):
+            terms = []
+            for col, value in where.items():
+                if isinstance(value, (list, tuple, set, np.ndarray, pd.Series, pd.Index)):
+                    value = np.unique(np.asarray(list(value) if isinstance(value, set) else value)).tolist()
+                elif isinstance(value, np.generic):
+                    value = value.item()
+                terms.append("%s=%r" % (col, value))
+            where = terms
+
+        if rows is None:
+            return where
+
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        if where is not None:
+            rows = np.intersect1d(rows, self.store.select_as_coordinates(key, where=where))
+        return rows
+
+    def iter_table(self, key, chunksize, rows=None, where=None, columns=None):
+        """
+        Iterates over a table in chunks without reading the full table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        chunksize : int
+            The maximum number of rows in each chunk
+        rows : array_like, optional
+            The row positions to read
+        where : {str, list, dict}, optional
+            Either a PyTables query or a dictionary of {column : value or list of values} to filter the rows by.
+            Only the index and the atom_index, term_index and atomN columns can be queried.
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+
+        Returns
+        -------
+        ret : generator
+            A generator of DataFrames, or Series for Series tables
+        """
+
+        if int(chunksize) < 1:
+            raise ValueError("HDFStore: chunksize must be positive.")
+
+        if key not in self.list_tables():
+            return iter([])
+
+        self._flush(key)
+        where = self._build_where(key, rows, where)
+        if where is not None:
+            return iter(self.store.select(key, where=where, columns=columns, chunksize=int(chunksize), iterator=True))
+
+        # Unfiltered reads are contiguous slices, PyTables reads chunks by coordinates otherwise
+        nrows = self.store.get_storer(key).nrows
+        return (self.store.select(key, columns=columns, start=start, stop=start + int(chunksize))
+                for start in range(0, nrows, int(chunksize)))
+
+    def read_table(self, key, rows=None, where=None, columns=None, chunksize=None, copy=True):
         """
         Reads the table using either the rows or where syntax
-        Appends or builds a new table
 
         Parameters
         ----------
         key : str
             The name of the table
-        data : pd.DataFrame
-            The data to append to the table
+        rows : array_like, optional
+            The row positions to read
+        where : {str, list, dict}, optional
+            Either a PyTables query or a dictionary of {column : value or list of values} to filter the rows by.
+            Only the index and the atom_index, term_index and atomN columns can be queried.
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+        chunksize : int, optional
+            If set, returns a generator of chunks, see `iter_table`.
+        copy : bool, optional
+            If False a read-only DataFrame is returned, see MemoryStore.read_table.
         """
 
-        if rows:
-            raise Exception("NYI")
+        if chunksize is not None:
+            return self.iter_table(key, chunksize, rows=rows, where=where, columns=columns)
 
-        if key in self.list_tables():
-            return pd.read_hdf(self.store, key)
-        else:
+        if key not in self.list_tables():
             return pd.DataFrame()
 
+        if (rows is None) and (where is None) and (columns is None):
+            # Full reads go through the cache
+            if key in self.cache:
+                self.cache_hits += 1
+                ret = self.cache.pop(key)
+                self.cache[key] = ret
+            else:
+                self.cache_misses += 1
+                self._flush(key)
+                ret = self.store.select(key)
+                self._cache_table(key, ret)
+
+            if copy:
+                return ret.copy()
+        else:
+            self._flush(key)
+            where = self._build_where(key, rows, where)
+            ret = self.store.select(key, where=where, columns=columns)
+
+            if copy:
+                return ret
+
+        return _read_only_view(ret)
+
     def remove_table(self, key, index=None):
+        """
+        Removes a table or rows of a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        index : array_like, optional
+            The row positions to remove, otherwise the whole table is removed.
+        """
+
         if key not in self.list_tables():
             raise KeyError("Key %s does not exist" % key)
 
+        if index is not None:
+            keep = np.ones(self.nrows[key], dtype=bool)
+            keep[np.asarray(index, dtype=np.int64)] = False
+            if np.all(keep):
+                return
+            if not np.any(keep):
+                index = None
+
+        self._invalidate(key)
+        self._flush(key)
         if index is None:
             # Drop whole table
             # Remove key from self.tables and self.created_tables
             self.store.remove(key)
             self.created_tables.remove(key)
+            self.written_tables.discard(key)
+            del self.nrows[key]
 
         else:
-            # Drop the subsection of the table.
-            index.sort()
-
-            # Group consectutive indices
-            indices = np.split(index, np.where(np.diff(index) != 1)[0] + 1)
-
-            ret = []
-            for pair in indices:
-                if pair.shape[0] == 1:
-                    ret.append((pair[0], pair[0] + 1))
-                else:
-                    ret.append((pair[0], pair[-1] + 1))
-
-            ret.reverse()
-
-            for i in ret:
-                self.store.remove(key, start=i[0], stop=i[-1])
-
-            # If everything is removed by index, we should drop this key from the list of created tables
-            if self.read_table(key).empty:
-                self.created_tables.remove(key)
+            # Rewrite the remaining rows in a single pass
+            data_columns = self.store.get_storer(key).data_columns
+            data = self.store.select(key, where=np.where(keep)[0])
+            self._write_table(key, data, data_columns=data_columns)
+            self.nrows[key] = data.shape[0]
 
     def close(self):
         """
         Closes the FL file.
         """
 
-        self.store.close()
+        if self.store.is_open:
+            self._flush()
+        try:
+            self.store.close()
+        except KeyError:
+            # Closing from a garbage collection pass can leave collected index nodes in the PyTables node registry,
+            # the failed close drains the registry so closing again releases the file
+            self.store.close()
         if not self.save_data:
             try:
                 os.unlink(self.store_filename)
@@ -164,6 +476,8 @@ class HDFStore(BaseStore):
         Copies a table from one key to another
         """
 
+        self._flush(from_key)
+        self._invalidate(to_key)
         for chunk in pd.read_hdf(
                 self.store, from_key, iterator=True, chunksize=1.e6):
             if columns_rename is not None:
@@ -181,6 +495,9 @@ class MemoryStore(BaseStore):
         self.tables = {}
         self.table_frags = {}
 
+        # Read-only views of the tables, rebuilt after any modification
+        self.table_views = {}
+
     def add_table(self, key, data):
 
         # Lazy concat fragments for speed
@@ -190,31 +507,64 @@ class MemoryStore(BaseStore):
         else:
             self.table_frags[key].append(data)
 
-    def read_table(self, key):
-        if key not in list(self.tables):
-            raise KeyError("Key %s does not exist" % key)
+        self.table_views.pop(key, None)
+
+    def _concat_fragments(self, key):
+        """
+        Concatenates any appended fragments of a table.
+        """
 
-        # Concat any fragments
         if len(self.table_frags[key]):
             if not self.tables[key].empty:
                 self.table_frags[key].insert(0, self.tables[key])
             self.tables[key] = pd.concat(self.table_frags[key])
             self.table_frags[key] = []
 
-        return self.tables[key].copy()
+    def read_table(self, key, copy=True):
+        """
+        Reads a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        copy : bool, optional
+            If True a copy of the table is returned. Otherwise a read-only DataFrame sharing the memory of the store is
+            returned, modifying its values in place raises a ValueError. Note that some pandas operations (isin,
+            groupby, merge, ...) require writeable data and should be performed on a copy.
+        """
+
+        if key not in list(self.tables):
+            raise KeyError("Key %s does not exist" % key)
+
+        self._concat_fragments(key)
+
+        if copy:
+            return self.tables[key].copy()
+
+        if key not in self.table_views:
+            self.table_views[key] = _read_only_view(self.tables[key])
+
+        # A new shallow copy so that column assignments are not shared between callers
+        return self.table_views[key].copy(deep=False)
 
     def remove_table(self, key, index=None):
         if key not in list(self.tables):
             raise KeyError("Key %s does not exist" % key)
 
+        self.table_views.pop(key, None)
+
         if index is None:
             # Drop whole table
             # Remove key from self.tables and self.table_frags dictionaries
             del self.tables[key]
             del self.table_frags[key]
         else:
-            # Drop the subsection of the table
-            self.tables[key].drop(self.tables[key].index[index], inplace=True)
+            # Drop the subsection of the table by position, appended fragments can repeat index labels
+            self._concat_fragments(key)
+            keep = np.ones(self.tables[key].shape[0], dtype=bool)
+            keep[np.asarray(index, dtype=np.int64)] = False
+            self.tables[key] = self.tables[key].iloc[keep]
 
     def close(self):
         """
@@ -245,3 +595,1155 @@ class MemoryStore(BaseStore):
 
     def __del__(self):
         self.close()
+
+
+class ColumnarStore(BaseStore):
+    """
+    An in-memory store that holds each table as typed NumPy column arrays.
+
+    Appends write into preallocated arrays whose capacity doubles as needed and removed rows are only flagged in a
+    validity mask, the arrays are compacted on the next read.
+    """
+
+    def __init__(self, name, store_location, save_data):
+
+        # Init the base class
+        BaseStore.__init__(self, name, store_location, save_data)
+
+        self.store_filename = os.path.join(self.store_location,
+                                           self.name + ".h5")
+
+        # Table holder dictionary
+        self.tables = {}
+
+        # Read-only views of the tables, rebuilt after any modification
+        self.table_views = {}
+
+    def _new_table(self, data):
+        """
+        Builds an empty table with the layout of a DataFrame.
+        """
+
+        index_names = list(data.index.names)
+        if data.index.nlevels == 1:
+            index_arrays = [data.index.values]
+        else:
+            index_arrays = [data.index.get_level_values(x).values for x in range(data.index.nlevels)]
+
+        return {
+            "series": False,
+            "columns": list(data.columns),
+            "arrays": [np.empty(0, dtype=data[col].values.dtype) for col in data.columns],
+            "index_names": index_names,
+            "index": [np.empty(0, dtype=x.dtype) for x in index_arrays],
+            "valid": np.empty(0, dtype=bool),
+            "size": 0,
+            "nvalid": 0,
+        }
+
+    def _grow(self, table, needed):
+        """
+        Doubles the capacity of all arrays of a table until needed rows fit.
+        """
+
+        capacity = table["valid"].shape[0]
+        if needed <= capacity:
+            return
+
+        capacity = max(needed, 2 * capacity, 16)
+        for name in ["arrays", "index"]:
+            for num, arr in enumerate(table[name]):
+                tmp = np.empty(capacity, dtype=arr.dtype)
+                tmp[:table["size"]] = arr[:table["size"]]
+                table[name][num] = tmp
+
+        tmp = np.zeros(capacity, dtype=bool)
+        tmp[:table["size"]] = table["valid"][:table["size"]]
+        table["valid"] = tmp
+
+    def _append_column(self, table, name, num, values):
+        """
+        Writes values after the used part of a column array, promoting the column dtype if required.
+        """
+
+        arr = table[name][num]
+        dtype = np.result_type(arr.dtype, values.dtype)
+        if dtype != arr.dtype:
+            arr = arr.astype(dtype)
+            table[name][num] = arr
+
+        arr[table["size"]:table["size"] + values.shape[0]] = values
+
+    def add_table(self, key, data):
+        """
+        Appends or builds a new table
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        data : pd.DataFrame
+            The data to append to the table
+        """
+
+        # Series are held as single column tables
+        is_series = isinstance(data, pd.Series)
+        if is_series:
+            data = data.to_frame()
+
+        if key not in self.tables:
+            self.tables[key] = self._new_table(data)
+            self.tables[key]["series"] = is_series
+
+        table = self.tables[key]
+        if set(data.columns) != set(table["columns"]):
+            raise KeyError("ColumnarStore: Columns '%s' do not match the columns of table '%s'." %
+                           (str(list(data.columns)), key))
+
+        if data.index.nlevels != len(table["index"]):
+            raise KeyError("ColumnarStore: Index of the data does not match the index of table '%s'." % key)
+
+        nrows = data.shape[0]
+        self._grow(table, table["size"] + nrows)
+
+        for num, col in enumerate(table["columns"]):
+            self._append_column(table, "arrays", num, data[col].values)
+
+        for num in range(len(table["index"])):
+            self._append_column(table, "index", num, data.index.get_level_values(num).values)
+
+        table["valid"][table["size"]:table["size"] + nrows] = True
+        table["size"] += nrows
+        table["nvalid"] += nrows
+
+        self.table_views.pop(key, None)
+        return True
+
+    def compact(self, key):
+        """
+        Removes all rows flagged as deleted from a table.
+        """
+
+        table = self.tables[key]
+        if table["nvalid"] == table["size"]:
+            return
+
+        mask = table["valid"][:table["size"]]
+        for name in ["arrays", "index"]:
+            for num, arr in enumerate(table[name]):
+                table[name][num] = arr[:table["size"]][mask]
+
+        table["size"] = table["nvalid"]
+        table["valid"] = np.ones(table["size"], dtype=bool)
+
+    def read_arrays(self, key, columns=None):
+        """
+        Returns read-only views of the column arrays of a table without copying.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+
+        Returns
+        -------
+        ret : dict
+            A dictionary of {column : array}
+        """
+
+        if key not in self.tables:
+            raise KeyError("Key %s does not exist" % key)
+
+        self.compact(key)
+        table = self.tables[key]
+
+        if columns is None:
+            columns = table["columns"]
+
+        ret = {}
+        for col in columns:
+            arr = table["arrays"][table["columns"].index(col)][:table["size"]].view()
+            arr.flags.writeable = False
+            ret[col] = arr
+
+        return ret
+
+    def read_table(self, key, copy=True):
+        """
+        Reads a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        copy : bool, optional
+            If False a cached read-only DataFrame is returned, see MemoryStore.read_table.
+        """
+
+        if key not in self.tables:
+            raise KeyError("Key %s does not exist" % key)
+
+        if key not in self.table_views:
+            self.compact(key)
+            table = self.tables[key]
+            size = table["size"]
+
+            if len(table["index"]) == 1:
+                index = pd.Index(table["index"][0][:size], name=table["index_names"][0])
+            else:
+                index = pd.MultiIndex.from_arrays([x[:size] for x in table["index"]], names=table["index_names"])
+
+            data = {col: arr[:size] for col, arr in zip(table["columns"], table["arrays"])}
+            self.table_views[key] = _read_only_view(pd.DataFrame(data, index=index, columns=table["columns"]))
+
+        if copy:
+            ret = self.table_views[key].copy()
+        else:
+            ret = self.table_views[key].copy(deep=False)
+
+        if self.tables[key]["series"]:
+            ret = ret[ret.columns[0]]
+
+        return ret
+
+    def remove_table(self, key, index=None):
+        """
+        Removes a table or rows of a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        index : array_like, optional
+            The row positions to remove, otherwise the whole table is removed.
+        """
+
+        if key not in self.tables:
+            raise KeyError("Key %s does not exist" % key)
+
+        self.table_views.pop(key, None)
+
+        if index is None:
+            # Drop whole table
+            del self.tables[key]
+            return
+
+        # Flag the rows as deleted, positions refer to the valid rows
+        table = self.tables[key]
+        rows = np.flatnonzero(table["valid"][:table["size"]])[np.asarray(index, dtype=np.int64)]
+        table["valid"][rows] = False
+        table["nvalid"] = int(np.sum(table["valid"][:table["size"]]))
+
+    def close(self):
+        """
+        Closes the FL file.
+        """
+
+        if self.save_data:
+            store = pd.HDFStore(self.store_filename)
+            for k in self.list_tables():
+                self.read_table(k).to_hdf(store, k, format="t")
+            store.close()
+
+    def list_tables(self):
+
+        return list(self.tables)
+
+    def copy_table(self, from_key, to_key, columns_rename=None):
+        """
+        Copies a table from one key to another
+        """
+
+        tmp = self.read_table(from_key)
+
+        if columns_rename is not None:
+            tmp.rename(columns=columns_rename, inplace=True)
+
+        self.add_table(to_key, tmp)
+
+    def __del__(self):
+        self.close()
+
+
+# Fixed size of the .npy headers written by the NPYStore, the header is rewritten in place on append
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, nrows):
+    """
+    Builds a version 1.0 .npy header for a 1D array padded to a fixed size.
+    """
+
+    header = "{'descr': %s, 'fortran_order': False, 'shape': (%d,), }" % (repr(np.lib.format.dtype_to_descr(dtype)),
+                                                                         nrows)
+    header = header.ljust(_NPY_HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def _npy_write(filename, data):
+    """
+    Writes a 1D array to a .npy file.
+
+    The file is written under a temporary name and renamed over the old file, memory maps of the old file held by
+    this or other processes are never truncated.
+    """
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as handle:
+        handle.write(_npy_header(data.dtype, data.shape[0]))
+        handle.write(np.ascontiguousarray(data).tobytes())
+    os.rename(tmp_filename, filename)
+
+
+def _npy_append(filename, data, nrows):
+    """
+    Appends a 1D array to a .npy file holding nrows values of the same dtype.
+    """
+
+    with open(filename, "r+b") as handle:
+        handle.seek(0, os.SEEK_END)
+        handle.write(np.ascontiguousarray(data).tobytes())
+        handle.seek(0)
+        handle.write(_npy_header(data.dtype, nrows + data.shape[0]))
+
+
+def _npy_values(values):
+    """
+    Converts column values to a dtype that can be memory mapped.
+    """
+
+    values = np.asarray(values)
+    if values.dtype.kind == "O":
+        values = values.astype(str)
+    return values
+
+
+class NPYStore(BaseStore):
+    """
+    A store that holds each table as a directory of .npy files, one per column.
+
+    Appends are written to the end of the column files and reads memory map them, so several processes can share a
+    store through the OS page cache. A JSON manifest records the layout of each table. An existing store in the
+    same location is cleared unless reopen is True, use save_data=True to keep the files after closing.
+    """
+
+    def __init__(self, name, store_location, save_data, reopen=False):
+
+        # Init the base class
+        BaseStore.__init__(self, name, store_location, save_data)
+
+        self.store_directory = os.path.join(self.store_location,
+                                            self.name + "_npy")
+        self.manifest_filename = os.path.join(self.store_directory,
+                                              "manifest.json")
+
+        if reopen:
+            if not os.path.exists(self.manifest_filename):
+                raise KeyError("NPYStore: Could not find a store to reopen in '%s'." % self.store_directory)
+
+            with open(self.manifest_filename, "r") as handle:
+                self.manifest = json.load(handle)
+        else:
+            # A new store never picks up the tables of an earlier one
+            if os.path.exists(self.store_directory):
+                shutil.rmtree(self.store_directory)
+            os.makedirs(self.store_directory)
+            self.manifest = {}
+            self._write_manifest()
+
+    def _write_manifest(self):
+        """
+        Atomically replaces the manifest so that readers never see a partial file.
+        """
+
+        tmp_filename = self.manifest_filename + ".tmp"
+        with open(tmp_filename, "w") as handle:
+            json.dump(self.manifest, handle)
+        os.rename(tmp_filename, self.manifest_filename)
+
+    def _filenames(self, key):
+        """
+        Returns the filenames of the columns and index levels of a table.
+        """
+
+        table = self.manifest[key]
+        path = os.path.join(self.store_directory, key)
+        columns = [os.path.join(path, "c%d.npy" % x) for x in range(len(table["columns"]))]
+        index = [os.path.join(path, "i%d.npy" % x) for x in range(len(table["index_names"]))]
+        return columns, index
+
+    def add_table(self, key, data):
+        """
+        Appends or builds a new table
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        data : pd.DataFrame
+            The data to append to the table
+        """
+
+        # Series are held as single column tables
+        is_series = isinstance(data, pd.Series)
+        if is_series:
+            data = data.to_frame()
+
+        index_values = [_npy_values(data.index.get_level_values(x)) for x in range(data.index.nlevels)]
+        column_values = [_npy_values(data[col].values) for col in data.columns]
+
+        if key not in self.manifest:
+            self.manifest[key] = {
+                "series": is_series,
+                "columns": [x.item() if isinstance(x, np.generic) else x for x in data.columns],
+                "index_names": list(data.index.names),
+                "dtypes": [None] * len(column_values),
+                "index_dtypes": [None] * len(index_values),
+                "nrows": 0
+            }
+            os.makedirs(os.path.join(self.store_directory, key))
+
+        table = self.manifest[key]
+        if list(data.columns) != table["columns"]:
+            if set(data.columns) != set(table["columns"]):
+                raise KeyError("NPYStore: Columns '%s' do not match the columns of table '%s'." %
+                               (str(list(data.columns)), key))
+            column_values = [_npy_values(data[col].values) for col in table["columns"]]
+
+        if len(index_values) != len(table["index_names"]):
+            raise KeyError("NPYStore: Index of the data does not match the index of table '%s'." % key)
+
+        column_files, index_files = self._filenames(key)
+        for dtype_key, filenames, values in [("dtypes", column_files, column_values),
+                                             ("index_dtypes", index_files, index_values)]:
+            for num, (filename, arr) in enumerate(zip(filenames, values)):
+                if table[dtype_key][num] is None:
+                    _npy_write(filename, arr)
+                    table[dtype_key][num] = np.lib.format.dtype_to_descr(arr.dtype)
+                    continue
+
+                # Promote and rewrite the column if required
+                old_dtype = np.dtype(table[dtype_key][num])
+                dtype = np.result_type(old_dtype, arr.dtype)
+                if dtype != old_dtype:
+                    old = self._load(filename, old_dtype, table["nrows"])
+                    _npy_write(filename, np.concatenate([old.astype(dtype), arr.astype(dtype)]))
+                    table[dtype_key][num] = np.lib.format.dtype_to_descr(dtype)
+                else:
+                    _npy_append(filename, arr.astype(dtype), table["nrows"])
+
+        table["nrows"] += data.shape[0]
+        self._write_manifest()
+        return True
+
+    def _load(self, filename, dtype, nrows):
+        """
+        Memory maps a column file, empty columns cannot be mapped.
+        """
+
+        if nrows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.load(filename, mmap_mode="r")
+
+    def read_arrays(self, key, columns=None):
+        """
+        Returns read-only memory mapped arrays of the columns of a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+
+        Returns
+        -------
+        ret : dict
+            A dictionary of {column : array}
+        """
+
+        if key not in self.manifest:
+            raise KeyError("Key %s does not exist" % key)
+
+        table = self.manifest[key]
+        column_files, _ = self._filenames(key)
+
+        if columns is None:
+            columns = table["columns"]
+
+        ret = {}
+        for col in columns:
+            num = table["columns"].index(col)
+            ret[col] = self._load(column_files[num], np.dtype(table["dtypes"][num]), table["nrows"])
+
+        return ret
+
+    def read_table(self, key, copy=True):
+        """
+        Reads a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        copy : bool, optional
+            If False a read-only DataFrame is returned, see MemoryStore.read_table.
+        """
+
+        if key not in self.manifest:
+            raise KeyError("Key %s does not exist" % key)
+
+        table = self.manifest[key]
+        column_files, index_files = self._filenames(key)
+
+        index = [
+            self._load(fn, np.dtype(dt), table["nrows"]) for fn, dt in zip(index_files, table["index_dtypes"])
+        ]
+        if len(index) == 1:
+            index = pd.Index(np.array(index[0]), name=table["index_names"][0])
+        else:
+            index = pd.MultiIndex.from_arrays([np.array(x) for x in index], names=table["index_names"])
+
+        data = self.read_arrays(key)
+        ret = pd.DataFrame(data, index=index, columns=table["columns"])
+
+        if not copy:
+            ret = _read_only_view(ret)
+
+        if table["series"]:
+            ret = ret[ret.columns[0]]
+
+        return ret
+
+    def remove_table(self, key, index=None):
+        """
+        Removes a table or rows of a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        index : array_like, optional
+            The row positions to remove, otherwise the whole table is removed.
+        """
+
+        if key not in self.manifest:
+            raise KeyError("Key %s does not exist" % key)
+
+        if index is None:
+            # Drop whole table
+            del self.manifest[key]
+            self._write_manifest()
+            shutil.rmtree(os.path.join(self.store_directory, key))
+            return
+
+        table = self.manifest[key]
+        column_files, index_files = self._filenames(key)
+        index = np.asarray(index, dtype=np.int64)
+
+        for dtype_key, filenames in [("dtypes", column_files), ("index_dtypes", index_files)]:
+            for filename, dtype in zip(filenames, table[dtype_key]):
+                data = self._load(filename, np.dtype(dtype), table["nrows"])
+                data = np.delete(data, index)
+                _npy_write(filename, data)
+
+        table["nrows"] -= np.unique(index).shape[0]
+        self._write_manifest()
+
+    def close(self):
+        """
+        Closes the FL file.
+        """
+
+        if not self.save_data:
+            shutil.rmtree(self.store_directory, ignore_errors=True)
+
+    def list_tables(self):
+
+        return list(self.manifest)
+
+    def copy_table(self, from_key, to_key, columns_rename=None):
+        """
+        Copies a table from one key to another
+        """
+
+        tmp = self.read_table(from_key)
+
+        if columns_rename is not None:
+            tmp.rename(columns=columns_rename, inplace=True)
+
+        self.add_table(to_key, tmp)
+
+    def __del__(self):
+        self.close()
+
+
+# Largest number of values inlined into a single IN clause
+_SQL_MAX_VARIABLES = 900
+
+
+def _sql_name(name):
+    """
+    Quotes a SQLite identifier.
+    """
+
+    return '"%s"' % str(name).replace('"', '""')
+
+
+class SQLiteStore(BaseStore):
+    """
+    A store that holds each table in an SQLite database.
+
+    The atom_index, term_index and atomN columns of each table are indexed so that reads can be filtered in the
+    database with the `where` and `columns` arguments of `read_table` and `iter_table`. An existing database in the
+    same location is replaced unless reopen is True.
+    """
+
+    def __init__(self, name, store_location, save_data, reopen=False):
+
+        # Init the base class
+        BaseStore.__init__(self, name, store_location, save_data)
+
+        self.store_filename = os.path.join(self.store_location,
+                                           self.name + ".db")
+
+        if reopen:
+            if not os.path.exists(self.store_filename):
+                raise KeyError("SQLiteStore: Could not find a store to reopen in '%s'." % self.store_filename)
+
+        # A new store never picks up the tables of an earlier one
+        elif os.path.exists(self.store_filename):
+            os.unlink(self.store_filename)
+
+        # The connection may be used by the writer thread of an AsyncStore, which serializes access
+        self.connection = sqlite3.connect(self.store_filename, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS eex_tables (key TEXT PRIMARY KEY, meta TEXT)")
+        self.connection.commit()
+
+        self.tables = {}
+        for key, meta in self.connection.execute("SELECT key, meta FROM eex_tables"):
+            self.tables[key] = json.loads(meta)
+
+    def _write_meta(self, key):
+        self.connection.execute("INSERT OR REPLACE INTO eex_tables (key, meta) VALUES (?, ?)",
+                                (key, json.dumps(self.tables[key])))
+
+    def _create_table(self, key, data, is_series):
+        """
+        Creates the SQL table and the indices for a new key.
+        """
+
+        columns = [x.item() if isinstance(x, np.generic) else x for x in data.columns]
+        sql_columns = [str(x) for x in columns]
+        sql_index = []
+        for num, name in enumerate(data.index.names):
+            if (name is None) or (str(name) in sql_columns):
+                sql_index.append("__index_%d__" % num)
+            else:
+                sql_index.append(str(name))
+
+        meta = {
+            "series": is_series,
+            "columns": columns,
+            "sql_columns": sql_columns,
+            "dtypes": [np.lib.format.dtype_to_descr(x) for x in data.dtypes],
+            "index_names": list(data.index.names),
+            "sql_index": sql_index,
+            "index_dtypes": [
+                np.lib.format.dtype_to_descr(data.index.get_level_values(x).dtype) for x in range(data.index.nlevels)
+            ]
+        }
+
+        sql_types = []
+        for name, dtype in zip(sql_index + sql_columns, meta["index_dtypes"] + meta["dtypes"]):
+            dtype = np.dtype(dtype)
+            if dtype.kind in "iub":
+                sql_types.append(_sql_name(name) + " INTEGER")
+            elif dtype.kind == "f":
+                sql_types.append(_sql_name(name) + " REAL")
+            else:
+                sql_types.append(_sql_name(name) + " TEXT")
+
+        self.connection.execute("CREATE TABLE %s (%s)" % (_sql_name(key), ", ".join(sql_types)))
+        for name in sql_index + sql_columns:
+            if _DATA_COLUMNS.match(name):
+                self.connection.execute("CREATE INDEX %s ON %s (%s)" % (_sql_name(key + "__" + name), _sql_name(key),
+                                                                        _sql_name(name)))
+
+        self.tables[key] = meta
+
+    def add_table(self, key, data):
+        """
+        Appends or builds a new table
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        data : pd.DataFrame
+            The data to append to the table
+        """
+
+        # Series are held as single column tables
+        is_series = isinstance(data, pd.Series)
+        if is_series:
+            data = data.to_frame()
+
+        if key not in self.tables:
+            self._create_table(key, data, is_series)
+
+        meta = self.tables[key]
+        if set(data.columns) != set(meta["columns"]):
+            raise KeyError("SQLiteStore: Columns '%s' do not match the columns of table '%s'." %
+                           (str(list(data.columns)), key))
+
+        if data.index.nlevels != len(meta["sql_index"]):
+            raise KeyError("SQLiteStore: Index of the data does not match the index of table '%s'." % key)
+
+        values = [data.index.get_level_values(x) for x in range(data.index.nlevels)]
+        values.extend(data[col] for col in meta["columns"])
+
+        # Promote the stored dtypes, SQLite columns are dynamically typed
+        dtypes = meta["index_dtypes"] + meta["dtypes"]
+        for num, arr in enumerate(values):
+            dtypes[num] = np.lib.format.dtype_to_descr(np.result_type(np.dtype(dtypes[num]), arr.dtype))
+        nindex = len(meta["sql_index"])
+        meta["index_dtypes"] = dtypes[:nindex]
+        meta["dtypes"] = dtypes[nindex:]
+
+        names = meta["sql_index"] + meta["sql_columns"]
+        sql = "INSERT INTO %s (%s) VALUES (%s)" % (_sql_name(key), ", ".join(_sql_name(x) for x in names), ", ".join(
+            ["?"] * len(names)))
+
+        self.connection.executemany(sql, zip(*[np.asarray(x).tolist() for x in values]))
+        self._write_meta(key)
+        self.connection.commit()
+
+        return True
+
+    def _build_where(self, where):
+        """
+        Builds a WHERE clause from either an SQL string or a dictionary of {column : value(s)}.
+        """
+
+        if where is None:
+            return "", []
+
+        if isinstance(where, str):
+            return " WHERE " + where, []
+
+        if not isinstance(where, dict):
+            raise TypeError("SQLiteStore: where must either be a string or a dictionary, found %s." % type(where))
+
+        clauses = []
+        params = []
+        for col, value in where.items():
+            if isinstance(value, (list, tuple, set, np.ndarray, pd.Series, pd.Index)):
+                value = np.unique(np.asarray(list(value) if isinstance(value, set) else value))
+                if value.dtype.kind in "iu":
+                    # Integers are inlined to avoid the SQLite variable limit
+                    clauses.append("%s IN (%s)" % (_sql_name(col), ", ".join("%d" % x for x in value)))
+                elif value.shape[0] > _SQL_MAX_VARIABLES:
+                    raise ValueError("SQLiteStore: Too many values for column '%s'." % str(col))
+                else:
+                    clauses.append("%s IN (%s)" % (_sql_name(col), ", ".join(["?"] * value.shape[0])))
+                    params.extend(value.tolist())
+            else:
+                clauses.append("%s = ?" % _sql_name(col))
+                params.append(value.item() if isinstance(value, np.generic) else value)
+
+        if len(clauses) == 0:
+            return "", []
+
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _build_frame(self, meta, rows, columns):
+        """
+        Builds a DataFrame from the rows of a SELECT statement.
+        """
+
+        nindex = len(meta["sql_index"])
+        dtypes = meta["index_dtypes"] + [meta["dtypes"][meta["columns"].index(x)] for x in columns]
+
+        if len(rows):
+            values = list(zip(*rows))
+        else:
+            values = [[] for x in dtypes]
+
+        arrays = []
+        for vals, dtype in zip(values, dtypes):
+            dtype = np.dtype(dtype)
+            if dtype.kind == "O":
+                arrays.append(np.array(vals, dtype=object))
+            else:
+                arrays.append(np.array(vals).astype(dtype, copy=False))
+
+        if nindex == 1:
+            index = pd.Index(arrays[0], name=meta["index_names"][0])
+        else:
+            index = pd.MultiIndex.from_arrays(arrays[:nindex], names=meta["index_names"])
+
+        ret = pd.DataFrame(dict(zip(columns, arrays[nindex:])), index=index, columns=columns)
+        if meta["series"]:
+            ret = ret[ret.columns[0]]
+
+        return ret
+
+    def _select(self, key, where, columns):
+        """
+        Runs the SELECT statement of a read, returns the table metadata, the selected columns and the cursor.
+        """
+
+        if key not in self.tables:
+            raise KeyError("Key %s does not exist" % key)
+
+        meta = self.tables[key]
+        if columns is None:
+            columns = meta["columns"]
+        columns = list(columns)
+
+        missing = set(columns) - set(meta["columns"])
+        if missing:
+            raise KeyError("SQLiteStore: Columns '%s' not found in table '%s'." % (str(missing), key))
+
+        names = meta["sql_index"] + [meta["sql_columns"][meta["columns"].index(x)] for x in columns]
+        where_sql, params = self._build_where(where)
+        sql = "SELECT %s FROM %s%s ORDER BY rowid" % (", ".join(_sql_name(x) for x in names), _sql_name(key),
+                                                      where_sql)
+
+        return meta, columns, self.connection.execute(sql, params)
+
+    def iter_table(self, key, chunksize, where=None, columns=None):
+        """
+        Iterates over a table in chunks.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        chunksize : int
+            The maximum number of rows in each chunk
+        where : {str, dict}, optional
+            Either a SQL expression or a dictionary of {column : value or list of values} to filter the rows by.
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+
+        Returns
+        -------
+        ret : generator
+            A generator of DataFrames, or Series for Series tables
+        """
+
+        if int(chunksize) < 1:
+            raise ValueError("SQLiteStore: chunksize must be positive.")
+
+        meta, columns, cursor = self._select(key, where, columns)
+
+        def _chunks():
+            while True:
+                rows = cursor.fetchmany(int(chunksize))
+                if len(rows) == 0:
+                    break
+                yield self._build_frame(meta, rows, columns)
+
+        return _chunks()
+
+    def read_table(self, key, where=None, columns=None, chunksize=None, copy=True):
+        """
+        Reads a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        where : {str, dict}, optional
+            Either a SQL expression or a dictionary of {column : value or list of values} to filter the rows by.
+        columns : list, optional
+            The columns to return, otherwise all columns are returned.
+        chunksize : int, optional
+            If set, returns a generator of chunks, see `iter_table`.
+        copy : bool, optional
+            If False a read-only DataFrame is returned, see MemoryStore.read_table.
+        """
+
+        if chunksize is not None:
+            return self.iter_table(key, chunksize, where=where, columns=columns)
+
+        meta, columns, cursor = self._select(key, where, columns)
+        ret = self._build_frame(meta, cursor.fetchall(), columns)
+
+        if copy:
+            return ret
+        else:
+            return _read_only_view(ret)
+
+    def remove_table(self, key, index=None):
+        """
+        Removes a table or rows of a table.
+
+        Parameters
+        ----------
+        key : str
+            The name of the table
+        index : array_like, optional
+            The row positions to remove, otherwise the whole table is removed.
+        """
+
+        if key not in self.tables:
+            raise KeyError("Key %s does not exist" % key)
+
+        if index is None:
+            # Drop whole table
+            self.connection.execute("DROP TABLE %s" % _sql_name(key))
+            self.connection.execute("DELETE FROM eex_tables WHERE key = ?", (key, ))
+            del self.tables[key]
+        else:
+            rowids = np.array(
+                [x[0] for x in self.connection.execute("SELECT rowid FROM %s ORDER BY rowid" % _sql_name(key))],
+                dtype=np.int64)
+            rowids = rowids[np.unique(np.asarray(index, dtype=np.int64))]
+            self.connection.executemany("DELETE FROM %s WHERE rowid = ?" % _sql_name(key),
+                                        [(x, ) for x in rowids.tolist()])
+
+        self.connection.commit()
+
+    def close(self):
+        """
+        Closes the FL file.
+        """
+
+        if self.connection is None:
+            return
+
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+        if not self.save_data:
+            try:
+                os.unlink(self.store_filename)
+            except OSError:
+                pass
+
+    def list_tables(self):
+
+        return list(self.tables)
+
+    def copy_table(self, from_key, to_key, columns_rename=None):
+        """
+        Copies a table from one key to another
+        """
+
+        tmp = self.read_table(from_key)
+
+        if columns_rename is not None:
+            tmp.rename(columns=columns_rename, inplace=True)
+
+        self.add_table(to_key, tmp)
+
+    def __del__(self):
+        self.close()
+
+
+class AsyncStore(object):
+    """
+    Wraps a store so that `add_table` calls are written by a background thread.
+
+    Appends are queued in order to a single writer thread, once maxsize appends are pending `add_table` blocks until
+    the writer catches up. Reads of a table wait until all pending appends to that table are written, all other calls
+    wait until every pending append is written. Exceptions raised by the writer are raised by the next call. The data
+    passed to `add_table` must not be modified afterwards.
+
+    Chunked reads (`iter_table` or `read_table` with a chunksize keyword) hold the store until the iterator is
+    exhausted or closed, so that the writer never writes between chunks. The reading thread cannot add tables while
+    its chunked read is open.
+
+    Parameters
+    ----------
+    store : BaseStore
+        The store to write to
+    maxsize : int, optional
+        The maximum number of pending appends
+    """
+
+    def __init__(self, store, maxsize=16):
+
+        self.store = store
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._error = None
+
+        # Open chunked reads by thread
+        self._readers = {}
+
+        # Serializes access to the wrapped store, which is not thread safe. Reentrant so that the thread of an open
+        # chunked read can still use the store.
+        self._lock = threading.RLock()
+
+        self._thread = threading.Thread(target=self._writer, name="eex-store-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            key, data = item
+            try:
+                with self._lock:
+                    self.store.add_table(key, data)
+            except Exception as exc:
+                with self._condition:
+                    if self._error is None:
+                        self._error = exc
+            finally:
+                with self._condition:
+                    self._pending[key] -= 1
+                    if self._pending[key] == 0:
+                        del self._pending[key]
+                    self._condition.notify_all()
+
+    def _take_error(self):
+        with self._condition:
+            error = self._error
+            self._error = None
+
+        return error
+
+    def _raise_error(self):
+        error = self._take_error()
+        if error is not None:
+            raise error
+
+    def _reading(self):
+        """
+        Checks if the calling thread holds an open chunked read.
+        """
+
+        with self._condition:
+            return threading.current_thread().ident in self._readers
+
+    def _locked_chunks(self, method, key, *args, **kwargs):
+        """
+        Yields the chunks of a chunked read while holding the wrapped store.
+        """
+
+        self.flush(key)
+        with self._lock:
+            ident = threading.current_thread().ident
+            with self._condition:
+                self._readers[ident] = self._readers.get(ident, 0) + 1
+
+            try:
+                for chunk in method(key, *args, **kwargs):
+                    yield chunk
+            finally:
+                with self._condition:
+                    self._readers[ident] -= 1
+                    if self._readers[ident] == 0:
+                        del self._readers[ident]
+
+    def flush(self, key=None):
+        """
+        Waits until the pending appends of a table, or of all tables if key is None, are written.
+
+        The writer cannot run while the calling thread holds a chunked read, appends queued by other threads in the
+        meantime are written once the read closes.
+        """
+
+        if not self._reading():
+            with self._condition:
+                while (self._pending if key is None else (key in self._pending)):
+                    self._condition.wait()
+
+        self._raise_error()
+
+    def add_table(self, key, data):
+        """
+        Queues an append to a table
+        """
+
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("AsyncStore: The writer thread has been stopped.")
+
+        if self._reading():
+            raise RuntimeError("AsyncStore: Cannot add tables while a chunked read of this thread is open.")
+
+        with self._condition:
+            self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put((key, data))
+
+        return True
+
+    def read_table(self, key, *args, **kwargs):
+
+        if kwargs.get("chunksize", None) is not None:
+            return self._locked_chunks(self.store.read_table, key, *args, **kwargs)
+
+        self.flush(key)
+        with self._lock:
+            return self.store.read_table(key, *args, **kwargs)
+
+    def remove_table(self, key, index=None):
+
+        self.flush()
+        with self._lock:
+            return self.store.remove_table(key, index)
+
+    def copy_table(self, from_key, to_key, columns_rename=None):
+
+        self.flush()
+        with self._lock:
+            return self.store.copy_table(from_key, to_key, columns_rename=columns_rename)
+
+    def list_tables(self):
+
+        self.flush()
+        return self.store.list_tables()
+
+    def stop(self, raise_error=True):
+        """
+        Writes all pending appends and stops the writer thread, the wrapped store is left open.
+
+        Parameters
+        ----------
+        raise_error : bool, optional
+            If False an exception raised by the writer is returned instead of raised.
+        """
+
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+        if not raise_error:
+            return self._take_error()
+
+        self._raise_error()
+
+    def close(self):
+        """
+        Stops the writer thread and closes the wrapped store.
+        """
+
+        try:
+            self.stop()
+        finally:
+            self.store.close()
+
+    def __getattr__(self, name):
+
+        # Avoid recursion before the wrapped store is set
+        if name == "store":
+            raise AttributeError(name)
+
+        if name == "iter_table":
+            return functools.partial(self._locked_chunks, getattr(self.store, name))
+
+        self.flush()
+        return getattr(self.store, name)
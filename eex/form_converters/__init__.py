@@ -1 +1 @@
-from .convert_form import convert_form
+from .convert_form import convert_form, convert_form_arrays
@@ -1,7 +1,9 @@
 """
 A helper function to access EEX converteres easier
 """
-from .converter_registry import REGISTERED_CONVERTERS
+import numpy as np
+
+from .converter_registry import REGISTERED_CONVERTERS, REGISTERED_ARRAY_CONVERTERS
 from .. import metadata
 from . import dihedral_converters
 from . import angle_converters
@@ -38,3 +40,50 @@ def convert_form(order, coeffs, origin, final):
     canonical_coeffs = REGISTERED_CONVERTERS[order][to_canonical](coeffs)
     ret = REGISTERED_CONVERTERS[order][from_canonical](canonical_coeffs)
     return ret
+
+
+def convert_form_arrays(order, coeffs, origin, final):
+    """
+    Converts arrays of term parameters between functional forms, see `convert_form`.
+
+    Conversions with array converters on both sides of the canonical form are evaluated on whole columns, all other
+    conversions fall back to converting row by row.
+
+    Parameters
+    ----------
+    order : int
+        The order of the functional form (2, 3, 4, ...)
+    coeffs : dict
+        Dictionary of {parameter_name : array} in the origin form
+    origin : str
+        The form of the input parameters (ex 'opls')
+    final : str
+        The requested form (ex 'RB')
+
+    Returns
+    -------
+    ret : dict
+        Dictionary of {parameter_name : array_like} in the final form
+    """
+
+    order = metadata.md_helper.sanitize_term_order_name(order)
+
+    if order not in (2, 3, 4):
+        raise KeyError("EEX: Term order %s not recognized." % str(order))
+
+    if origin == final:
+        return coeffs
+
+    term_md = metadata.get_term_metadata(order, "forms")
+
+    to_canonical = ('_' + origin + '_to_' + term_md[origin]["canonical_form"]).lower()
+    from_canonical = ('_' + term_md[final]["canonical_form"] + '_to_' + final).lower()
+
+    array_converters = REGISTERED_ARRAY_CONVERTERS[order]
+    if (to_canonical in array_converters) and (from_canonical in array_converters):
+        coeffs = {k: np.asarray(v, dtype=np.float64) for k, v in coeffs.items()}
+        return array_converters[from_canonical](array_converters[to_canonical](coeffs))
+
+    nrows = len(next(iter(coeffs.values()))) if len(coeffs) else 0
+    rows = [convert_form(order, {k: v[num] for k, v in coeffs.items()}, origin, final) for num in range(nrows)]
+    return {k: [row[k] for row in rows] for k in term_md[final]["parameters"]}
@@ -2,15 +2,22 @@ from .. import metadata
 
 REGISTERED_CONVERTERS = {}
 
+# Converters of dictionaries of parameter arrays, registered under the name of the scalar converter
+REGISTERED_ARRAY_CONVERTERS = {}
+
 for order in (2, 3, 4):
     REGISTERED_CONVERTERS[order] = {}
+    REGISTERED_ARRAY_CONVERTERS[order] = {}
 
 
-def register_converter(order=None):
+def register_converter(order=None, arrays=False):
     order = metadata.md_helper.sanitize_term_order_name(order)
 
     def decorator_function(fn):
-        REGISTERED_CONVERTERS[order][fn.__name__.lower()] = fn
+        if arrays:
+            REGISTERED_ARRAY_CONVERTERS[order][fn.__name__.lower().replace("_array", "")] = fn
+        else:
+            REGISTERED_CONVERTERS[order][fn.__name__.lower()] = fn
 
         def wrapper_function(*args, **kwargs):
             return fn(*args, **kwargs)
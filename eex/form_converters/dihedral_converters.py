@@ -125,6 +125,70 @@ def _RB_to_opls(coeffs):
     return ret
 
 
+@register_converter(order=4, arrays=True)
+def _RB_to_RB_array(coeffs):
+
+    return coeffs
+
+
+@register_converter(order=4, arrays=True)
+def _opls_to_RB_array(coeffs):
+    """
+        Converts arrays of opls coefficients to RB coefficients, see _opls_to_RB.
+    """
+
+    k_1 = coeffs['K_1']
+    k_2 = coeffs['K_2']
+    k_3 = coeffs['K_3']
+    k_4 = coeffs['K_4']
+
+    if np.any((k_1 == 0.0) & (k_2 == 0.0) & (k_3 == 0.0) & (k_4 == 0.0)):
+        raise ValueError(
+            'OPLS to RB dihedral conversion not possible. All the coefficients of this dihedral are zero.'
+        )
+
+    ret = dict()
+    ret['A_0'] = k_2 + 0.5 * (k_1 + k_3)
+    ret['A_1'] = 0.5 * (k_1 - 3.0 * k_3)
+    ret['A_2'] = -k_2 + 4.0 * k_4
+    ret['A_3'] = 2.0 * k_3
+    ret['A_4'] = -4.0 * k_4
+    ret['A_5'] = np.zeros_like(k_1)
+
+    return ret
+
+
+@register_converter(order=4, arrays=True)
+def _RB_to_opls_array(coeffs):
+    """
+        Converts arrays of RB coefficients to opls coefficients, see _RB_to_opls.
+    """
+
+    a_0 = coeffs['A_0']
+    a_1 = coeffs['A_1']
+    a_2 = coeffs['A_2']
+    a_3 = coeffs['A_3']
+    a_4 = coeffs['A_4']
+    a_5 = coeffs['A_5']
+
+    if np.any((a_0 == 0.0) & (a_1 == 0.0) & (a_2 == 0.0) & (a_3 == 0.0) & (a_4 == 0.0) & (a_5 == 0.0)):
+        raise ValueError(
+            'OPLS to RB dihedral conversion not possible. All the coefficients of this dihedral are zero.'
+        )
+
+    if np.any((a_5 != 0.0) & (a_1 + a_2 + a_3 + a_4 != 0.0)):
+        raise ValueError(
+            "RB to OPLS dihedral conversion not possible. This RB dihedral is inconsistent with OPLS style"
+        )
+
+    ret = dict()
+    ret['K_1'] = 2.0 * a_1 + 3.0 * a_3 / 2.0
+    ret['K_2'] = -a_2 - a_4
+    ret['K_3'] = a_3 / 2.0
+    ret['K_4'] = -a_4 / 4.0
+    return ret
+
+
 @register_converter(order=4)
 def _charmmfsw_to_RB(coeffs):
 
@@ -4,6 +4,8 @@ Converts various NB forms to other equivalents. In addtion, programs combining r
 
 import sys
 
+import numpy as np
+
 from .metadata import nb_metadata
 from .metadata import mixing_rules
 
@@ -81,6 +83,35 @@ def _LJ_ab_to_epsilonrmin(coeffs):
     return {"Rmin": Rmin, "epsilon": Eps}
 
 
+# Array versions of the conversions from the AB representation. Conversions to AB are plain arithmetic and work on
+# arrays as is.
+def _LJ_ab_to_ab_array(A, B):
+    """
+    Convert arrays of AB parameters to AB representation of the LJ potential
+    """
+    return {"A": A, "B": B}
+
+
+def _LJ_ab_to_epsilonsigma_array(A, B):
+    """
+    Convert arrays of AB parameters to epsilon/sigma representation of the LJ
+    potential
+    """
+    sigma = (A / B)**(1.0 / 6.0)
+    epsilon = B**2.0 / (4.0 * A)
+    return {"sigma": sigma, "epsilon": epsilon}
+
+
+def _LJ_ab_to_epsilonrmin_array(A, B):
+    """
+    Convert arrays of AB parameters to Rmin/epsilon representation of the LJ
+    potential
+    """
+    Rmin = (2.0 * A / B)**(1.0 / 6.0)
+    Eps = B**2.0 / (4.0 * A)
+    return {"Rmin": Rmin, "epsilon": Eps}
+
+
 # Get possible LJ forms from metadata
 LJ_forms = nb_metadata["forms"]["LJ"]
 
@@ -98,7 +129,8 @@ for form_name, entry in LJ_forms.items():
         _LJ_conversion_matrix[form_name] = [
             entry["parameters"],
             getattr(nb_converter, func_internal),
-            getattr(nb_converter, func_external)
+            getattr(nb_converter, func_external),
+            getattr(nb_converter, func_external + "_array")
         ]
 
 
@@ -121,6 +153,60 @@ def convert_LJ_coeffs(coeffs, origin, final):
     return external
 
 
+def convert_LJ_arrays(coeffs, origin, final):
+    """
+    Converts arrays of LJ coefficients between forms, see `convert_LJ_coeffs`.
+
+    Parameters
+    ----------
+    coeffs : dict
+        Dictionary of {parameter_name : array} in the origin form
+    origin : str
+        The form of the input coefficients (ex 'epsilon/sigma')
+    final : str
+        The requested form (ex 'AB')
+
+    Returns
+    -------
+    ret : dict
+        Dictionary of {parameter_name : array} in the final form
+    """
+
+    difference = set([origin, final]) - set(_LJ_conversion_matrix.keys())
+    if (difference):
+        raise KeyError(
+            "Conversion cannot be made since %s is not in conversion matrix %s"
+            % (difference, _LJ_conversion_matrix.keys()))
+
+    difference = set(coeffs.keys()) - set(_LJ_conversion_matrix[origin][0])
+    if (difference):
+        raise KeyError(
+            "The key %s in the coefficient dictionary is not in the list of allowed keys %s"
+            % (difference, _LJ_conversion_matrix[origin][0]))
+
+    coeffs = {k: np.asarray(v, dtype=np.float64) for k, v in coeffs.items()}
+    internal = _LJ_conversion_matrix[origin][1](coeffs)
+    if final == "AB":
+        return internal
+
+    A = internal["A"]
+    B = internal["B"]
+
+    # Zero interactions stay zero, anything else with a zero coefficient cannot be converted
+    zero = (A == 0.0) & (B == 0.0)
+    if np.any(((A == 0.0) | (B == 0.0)) & ~zero):
+        raise ZeroDivisionError(
+            "Lennard Jones functional form conversion not possible, division by zero found."
+        )
+
+    ret = _LJ_conversion_matrix[final][3](np.where(zero, 1.0, A),
+                                          np.where(zero, 1.0, B))
+    for k in ret:
+        ret[k] = np.where(zero, 0.0, ret[k])
+
+    return ret
+
+
 ## LJ combining rules
 
 
@@ -198,6 +284,56 @@ def mix_LJ(coeff_i, coeff_j, mixing_rule, origin="AB", final="AB"):
     return convert_params
 
 
+def mix_LJ_table(coeffs, mixing_rule, origin="AB", final="AB"):
+    """
+    Builds all pair interactions between a set of atom types at once based on the specified mixing rule.
+
+    Parameters
+    ----------
+    coeffs : dict
+        Dictionary of {parameter_name : array} with the parameters of each atom type in the origin form
+    mixing_rule : str
+        The mixing rule to combine parameters with
+    origin : str
+        The form of the input coefficients (ex 'epsilon/sigma')
+    final : str
+        The form of the returned coefficients (ex 'AB')
+
+    Returns
+    -------
+    ret : dict
+        Dictionary of {parameter_name : (ntypes, ntypes) array} where element [i, j] is the mixed interaction between
+        atom types i and j. Pairs with a type whose epsilon or sigma is zero have no interaction.
+    """
+
+    # Mixing rule check. In case this is called from somewhere that is not the datalayer.
+    if mixing_rule not in mixing_rules:
+        raise ValueError(
+            "Mixing rule %s is not a valid mixing rule in EEX metadata" %
+            mixing_rule)
+
+    # Convert from input form to epsilon/sigma
+    sigma_epsilon = convert_LJ_arrays(coeffs, origin=origin, final="epsilon/sigma")
+
+    # Types without LJ interactions do not interact with any type, they are mixed with placeholder parameters so that
+    # the mixing functions never divide by zero
+    zero = (sigma_epsilon["epsilon"] == 0.0) | (sigma_epsilon["sigma"] == 0.0)
+    pair_zero = zero[:, None] | zero[None, :]
+    sigma_epsilon = {k: np.where(zero, 1.0, v) for k, v in sigma_epsilon.items()}
+
+    # The mixing functions are plain arithmetic, broadcast rows against columns to build the full matrix
+    sigma_epsilon_i = {k: v[:, None] for k, v in sigma_epsilon.items()}
+    sigma_epsilon_j = {k: v[None, :] for k, v in sigma_epsilon.items()}
+
+    mixing_rule = mixing_rule.lower()
+    new_params = LJ_mixing_functions[mixing_rule](sigma_epsilon_i,
+                                                  sigma_epsilon_j)
+    new_params = {k: np.where(pair_zero, 0.0, v) for k, v in new_params.items()}
+
+    # Convert from epsilon-sigma to the final specified form
+    return convert_LJ_arrays(new_params, origin="epsilon/sigma", final=final)
+
+
 # Build mixing rules conversion. Each mixing function should have the name "_mixing_rule" where mixing_rule is set in
 # metadata/additional_metadata.
 
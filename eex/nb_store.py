@@ -0,0 +1,328 @@
+"""
+A columnar store for the nonbonded parameters held by the DataLayer.
+"""
+
+import numpy as np
+
+from . import metadata
+
+# Python 2/3 compat
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+class NBParameterStore(Mapping):
+    """
+    Stores nonbonded parameters as dense arrays per functional form.
+
+    Each form holds an (ntypes, nparameters) array for single atom type parameters and an
+    (ntypes, ntypes, nparameters) matrix for pair parameters, all in internal units and the default model of the form.
+    The store also behaves as a read-only dictionary of the form
+
+        { (atom_type1, atom_type2) : {'form' : nb_name, 'parameters' : {parameter_name : value, ...}} }
+
+    where atom_type2 is None for single atom type parameters.
+    """
+
+    def __init__(self):
+
+        # form_name -> dense tables
+        self._forms = {}
+
+        # (atom_type1, atom_type2) -> form_name, in insertion order
+        self._keys = {}
+
+    def __getitem__(self, key):
+        form_name = self._keys[key]
+        table = self._forms[form_name]
+
+        idx = table["types"][key[0]]
+        if key[1] is None:
+            values = table["single"][idx]
+        else:
+            values = table["pair"][idx, table["types"][key[1]]]
+
+        return {
+            "form": form_name,
+            "parameters": {k: float(v) for k, v in zip(table["parameters"], values)}
+        }
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _get_table(self, form_name):
+        if form_name not in self._forms:
+            nparams = len(metadata.get_nb_metadata(form_name, "parameters"))
+            self._forms[form_name] = {
+                "parameters": metadata.get_nb_metadata(form_name, "parameters"),
+                "types": {},
+                "type_list": [],
+                "single": np.zeros((0, nparams)),
+                "single_set": np.zeros(0, dtype=bool),
+                "pair": None,
+                "pair_set": None,
+            }
+        return self._forms[form_name]
+
+    def _type_index(self, table, atom_types):
+        """
+        Maps atom types to dense indices, growing the arrays for any new atom types.
+        """
+
+        for atype in atom_types:
+            if atype not in table["types"]:
+                table["types"][atype] = len(table["type_list"])
+                table["type_list"].append(atype)
+
+        ntypes = len(table["type_list"])
+        capacity = table["single"].shape[0]
+        if ntypes > capacity:
+            capacity = max(ntypes, 2 * capacity)
+            nparams = len(table["parameters"])
+
+            tmp = np.zeros((capacity, nparams))
+            tmp[:table["single"].shape[0]] = table["single"]
+            table["single"] = tmp
+
+            tmp = np.zeros(capacity, dtype=bool)
+            tmp[:table["single_set"].shape[0]] = table["single_set"]
+            table["single_set"] = tmp
+
+            if table["pair"] is not None:
+                old = table["pair_set"].shape[0]
+
+                tmp = np.zeros((capacity, capacity, nparams))
+                tmp[:old, :old] = table["pair"]
+                table["pair"] = tmp
+
+                tmp = np.zeros((capacity, capacity), dtype=bool)
+                tmp[:old, :old] = table["pair_set"]
+                table["pair_set"] = tmp
+
+        return np.array([table["types"][x] for x in atom_types], dtype=np.int64)
+
+    def _unset(self, key):
+        """
+        Removes a key stored under a different functional form.
+        """
+
+        table = self._forms[self._keys.pop(key)]
+        idx = table["types"][key[0]]
+        if key[1] is None:
+            table["single_set"][idx] = False
+        else:
+            idx2 = table["types"][key[1]]
+            table["pair_set"][idx, idx2] = False
+            table["pair_set"][idx2, idx] = False
+
+    def set(self, form_name, atom_type, values, atom_type2=None):
+        """
+        Sets parameters for many atom types or atom type pairs at once.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form (eg - "LJ", "Buckingham")
+        atom_type : array_like
+            The first atom type of each interaction
+        values : array_like
+            A (n, nparameters) array of parameters in internal units and the default model of the form
+        atom_type2 : array_like, optional
+            The second atom type of each interaction, otherwise single atom type parameters are set.
+        """
+
+        table = self._get_table(form_name)
+
+        atom_type = list(atom_type)
+        values = np.asarray(values, dtype=np.float64).reshape(len(atom_type), len(table["parameters"]))
+
+        if atom_type2 is None:
+            keys = [(x, None) for x in atom_type]
+        else:
+            atom_type2 = list(atom_type2)
+            keys = [tuple(sorted(x)) for x in zip(atom_type, atom_type2)]
+
+        for key in keys:
+            if self._keys.get(key, form_name) != form_name:
+                self._unset(key)
+            self._keys[key] = form_name
+
+        idx = self._type_index(table, atom_type)
+        if atom_type2 is None:
+            table["single"][idx] = values
+            table["single_set"][idx] = True
+            return
+
+        idx2 = self._type_index(table, atom_type2)
+        if table["pair"] is None:
+            capacity = table["single"].shape[0]
+            table["pair"] = np.zeros((capacity, capacity, len(table["parameters"])))
+            table["pair_set"] = np.zeros((capacity, capacity), dtype=bool)
+
+        table["pair"][idx, idx2] = values
+        table["pair"][idx2, idx] = values
+        table["pair_set"][idx, idx2] = True
+        table["pair_set"][idx2, idx] = True
+
+    def list_forms(self):
+        """
+        Lists the functional forms currently stored.
+        """
+
+        return sorted(set(self._keys.values()))
+
+    def get_arrays(self, form_name, itype="single"):
+        """
+        Returns the stored parameters of a functional form as arrays.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form (eg - "LJ", "Buckingham")
+        itype : str
+            Either "single" for (atom_type1, None) interactions or "pair" for (atom_type1, atom_type2) interactions.
+
+        Returns
+        -------
+        ret : dict
+            Dictionary of the form {"atom_type": types, ["atom_type2": types2,] parameter_name: values, ...} sorted by
+            atom type.
+        """
+
+        if itype not in ["single", "pair"]:
+            raise KeyError("NBParameterStore: itype '%s' not understood." % str(itype))
+
+        nparams = len(metadata.get_nb_metadata(form_name, "parameters"))
+        if form_name not in self._forms:
+            types = np.zeros(0, dtype=np.int64)
+            idx = np.zeros(0, dtype=np.int64)
+            values = np.zeros((0, nparams))
+            idx2 = idx
+        else:
+            table = self._forms[form_name]
+            types = np.array(table["type_list"])
+            ntypes = types.shape[0]
+
+            if itype == "single":
+                idx = np.where(table["single_set"][:ntypes])[0]
+                values = table["single"][idx]
+            elif table["pair"] is None:
+                idx = np.zeros(0, dtype=np.int64)
+                idx2 = idx
+                values = np.zeros((0, nparams))
+            else:
+                # Only the upper triangle by atom type
+                mask = table["pair_set"][:ntypes, :ntypes] & (types[:, None] <= types[None, :])
+                idx, idx2 = np.where(mask)
+                values = table["pair"][idx, idx2]
+
+        if itype == "single":
+            ret = {"atom_type": types[idx]}
+            order = np.argsort(ret["atom_type"], kind="mergesort")
+        else:
+            ret = {"atom_type": types[idx], "atom_type2": types[idx2]}
+            order = np.lexsort((ret["atom_type2"], ret["atom_type"]))
+
+        for k in list(ret):
+            ret[k] = ret[k][order]
+
+        for num, name in enumerate(metadata.get_nb_metadata(form_name, "parameters")):
+            ret[name] = values[order, num]
+
+        return ret
+
+    def get_pair_matrix(self, form_name, atom_types):
+        """
+        Returns the pair parameters of a functional form as dense matrices.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form (eg - "LJ", "Buckingham")
+        atom_types : array_like
+            The atom types labeling the rows and columns of the matrices.
+
+        Returns
+        -------
+        ret : dict
+            Dictionary of {parameter_name : (ntypes, ntypes) array}
+        found : np.ndarray
+            A (ntypes, ntypes) boolean array that is True where a pair parameter is stored.
+        """
+
+        params = metadata.get_nb_metadata(form_name, "parameters")
+        atom_types = list(atom_types)
+        ntypes = len(atom_types)
+
+        table = self._forms.get(form_name, None)
+        if (table is None) or (table["pair"] is None):
+            return {k: np.zeros((ntypes, ntypes)) for k in params}, np.zeros((ntypes, ntypes), dtype=bool)
+
+        known = np.array([x in table["types"] for x in atom_types], dtype=bool)
+        idx = np.array([table["types"].get(x, 0) for x in atom_types], dtype=np.int64)
+
+        found = table["pair_set"][idx[:, None], idx[None, :]] & known[:, None] & known[None, :]
+        values = table["pair"][idx[:, None], idx[None, :]]
+
+        ret = {}
+        for num, name in enumerate(params):
+            ret[name] = np.where(found, values[:, :, num], 0.0)
+
+        return ret, found
+
+    def get_state(self):
+        """
+        Returns the stored parameters as a flat dictionary of arrays, see `set_state`.
+
+        Returns
+        -------
+        ret : dict
+            Dictionary of {form_name + "__" + table : array}
+        """
+
+        ret = {}
+        for form_name, table in self._forms.items():
+            ntypes = len(table["type_list"])
+            ret[form_name + "__types"] = np.array(table["type_list"])
+            ret[form_name + "__single"] = table["single"][:ntypes]
+            ret[form_name + "__single_set"] = table["single_set"][:ntypes]
+
+            if table["pair"] is not None:
+                ret[form_name + "__pair"] = table["pair"][:ntypes, :ntypes]
+                ret[form_name + "__pair_set"] = table["pair_set"][:ntypes, :ntypes]
+
+        return ret
+
+    def set_state(self, state):
+        """
+        Adds the parameters of a dictionary returned by `get_state`.
+        """
+
+        for key in state:
+            if not key.endswith("__types"):
+                continue
+
+            form_name = key[:-len("__types")]
+            types = np.asarray(state[key]).tolist()
+
+            mask = np.asarray(state[form_name + "__single_set"], dtype=bool)
+            idx = np.where(mask)[0]
+            if idx.shape[0]:
+                self.set(form_name, [types[x] for x in idx], state[form_name + "__single"][idx])
+
+            if form_name + "__pair" not in state:
+                continue
+
+            mask = np.triu(np.asarray(state[form_name + "__pair_set"], dtype=bool))
+            idx, idx2 = np.where(mask)
+            if idx.shape[0]:
+                self.set(form_name, [types[x] for x in idx], state[form_name + "__pair"][idx, idx2],
+                         atom_type2=[types[x] for x in idx2])
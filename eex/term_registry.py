@@ -0,0 +1,514 @@
+"""
+A hash-indexed registry for the term parameters stored in the DataLayer.
+"""
+
+import itertools
+import math
+
+import numpy as np
+
+from . import metadata
+
+# Python 2/3 compat
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+# Width of a bucket in units of rtol and the fraction of a bucket near each edge where neighbors are also searched.
+# Two parameters that pass `np.allclose` are at most ~rtol apart on the bucket axis.
+_BUCKET_WIDTH = 10.0
+_NEIGHBOR_WINDOW = 0.15
+
+
+def _unique_rows(values):
+    """
+    Returns the first index and the inverse of the unique rows of a 2D array, in order of first appearance.
+    """
+
+    if values.shape[1] == 0:
+        return np.zeros(min(values.shape[0], 1), dtype=np.int64), np.zeros(values.shape[0], dtype=np.int64)
+
+    _, first, inverse = np.unique(values, axis=0, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+    return first[order], rank[inverse.reshape(-1)]
+
+
+def _row_codes(keys):
+    """
+    Returns an integer code for each row of a 2D integer array, equal rows share a code.
+    """
+
+    if keys.shape[1] == 0:
+        return np.zeros(keys.shape[0], dtype=np.int64)
+
+    return np.unique(keys, axis=0, return_inverse=True)[1].reshape(-1)
+
+
+class TermRegistry(Mapping):
+    """
+    Stores the parameters of a single term order as {uid : [form_name, parameters...]}.
+
+    Parameters are indexed by (form_name, quantized parameters) so that duplicates are found without scanning all
+    stored terms. Parameters are quantized on the axis sign(x) * log(1 + |x| * rtol / atol) where the `np.allclose`
+    tolerance is roughly uniform, neighboring buckets are only searched for values that lie close to a bucket edge.
+    """
+
+    def __init__(self, order, rtol=1.e-5, atol=1.e-8):
+
+        if (rtol <= 0) or (atol <= 0):
+            raise ValueError("TermRegistry: rtol and atol must be positive.")
+
+        self.order = metadata.sanitize_term_order_name(order)
+        self.rtol = rtol
+        self.atol = atol
+
+        self._shift = atol / rtol
+        self._step = _BUCKET_WIDTH * rtol
+
+        # uid -> [form_name, parameters...]
+        self._parameters = {}
+
+        # Hash index, bucket key -> uids in insertion order
+        self._buckets = {}
+        self._uid_keys = {}
+        self._insert_count = {}
+        self._counter = 0
+
+        # All uids below _lowest_hole are in use
+        self._lowest_hole = 0
+
+        # Columnar views and per form arrays of the hash index, built on demand
+        self._array_cache = {}
+        self._index_cache = {}
+
+    def __getitem__(self, uid):
+        return self._parameters[uid]
+
+    def __iter__(self):
+        return iter(self._parameters)
+
+    def __len__(self):
+        return len(self._parameters)
+
+    def __contains__(self, uid):
+        return uid in self._parameters
+
+    def _scale(self, value):
+        return math.copysign(math.log1p(abs(value) / self._shift), value) / self._step
+
+    def _bucket_key(self, form_name, parameters):
+        return (form_name, ) + tuple(int(math.floor(self._scale(x))) for x in parameters)
+
+    def _scale_array(self, parameters):
+        return np.sign(parameters) * np.log1p(np.abs(parameters) / self._shift) / self._step
+
+    def _invalidate(self, form_name):
+        self._array_cache.pop(form_name, None)
+        self._index_cache.pop(form_name, None)
+
+    def _form_index(self, form_name):
+        """
+        Returns the uids, insertion counts, bucket keys and parameters of a functional form as arrays sorted by uid.
+        """
+
+        if form_name in self._index_cache:
+            return self._index_cache[form_name]
+
+        nparams = len(metadata.get_term_metadata(self.order, "forms", form_name)["parameters"])
+
+        uids = np.array(sorted(k for k, v in self._parameters.items() if v[0] == form_name), dtype=np.int64)
+        ret = {
+            "uid": uids,
+            "count": np.array([self._insert_count[uid] for uid in uids], dtype=np.int64),
+            "keys": np.array([self._uid_keys[uid][1:] for uid in uids], dtype=np.int64).reshape(-1, nparams),
+            "parameters": np.array([self._parameters[uid][1:] for uid in uids], dtype=np.float64).reshape(-1, nparams)
+        }
+
+        self._index_cache[form_name] = ret
+        return ret
+
+    def _match(self, parameters, keys, values):
+        """
+        Finds all (row, stored row) pairs where the stored values are np.allclose to the parameters, only stored rows
+        whose bucket keys are candidates of the parameters are compared.
+        """
+
+        scaled = self._scale_array(parameters)
+        bucket = np.floor(scaled)
+        frac = scaled - bucket
+        shift = np.where(frac < _NEIGHBOR_WINDOW, -1, np.where(frac > (1.0 - _NEIGHBOR_WINDOW), 1, 0))
+
+        # Expand each row into its candidate bucket keys, one dimension at a time
+        rows = np.arange(parameters.shape[0])
+        candidates = bucket.astype(np.int64)
+        for dim in range(parameters.shape[1]):
+            near_edge = shift[rows, dim] != 0
+            extra = candidates[near_edge]
+            extra[:, dim] += shift[rows[near_edge], dim]
+            rows = np.concatenate((rows, rows[near_edge]))
+            candidates = np.concatenate((candidates, extra))
+
+        # Join the candidate keys with the stored keys
+        codes = _row_codes(np.concatenate((candidates, keys)))
+        query_codes = codes[:candidates.shape[0]]
+        sorter = np.argsort(codes[candidates.shape[0]:], kind="mergesort")
+        stored_codes = codes[candidates.shape[0]:][sorter]
+
+        lower = np.searchsorted(stored_codes, query_codes, side="left")
+        counts = np.searchsorted(stored_codes, query_codes, side="right") - lower
+        offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        rows = np.repeat(rows, counts)
+        stored = sorter[np.repeat(lower, counts) + offsets]
+
+        # Same comparison as np.allclose(stored, parameters)
+        close = np.all(np.isclose(values[stored], parameters[rows], rtol=self.rtol, atol=self.atol), axis=1)
+
+        return rows[close], stored[close]
+
+    def _candidate_keys(self, form_name, parameters):
+        """
+        Yields the bucket of the parameters and any neighboring buckets a matching parameter could be in.
+        """
+
+        candidates = []
+        for x in parameters:
+            scaled = self._scale(x)
+            bucket = int(math.floor(scaled))
+            frac = scaled - bucket
+
+            tmp = [bucket]
+            if frac < _NEIGHBOR_WINDOW:
+                tmp.append(bucket - 1)
+            elif frac > (1.0 - _NEIGHBOR_WINDOW):
+                tmp.append(bucket + 1)
+            candidates.append(tmp)
+
+        for key in itertools.product(*candidates):
+            yield (form_name, ) + key
+
+    def find(self, form_name, parameters):
+        """
+        Finds the uid of a previously stored parameter set.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : list
+            The parameters in the order of the functional form
+
+        Returns
+        -------
+        uid : {int, None}
+            The first added uid matching the parameters, None if not found.
+        """
+
+        found_key = None
+        found_count = None
+        for key in self._candidate_keys(form_name, parameters):
+            if key not in self._buckets:
+                continue
+
+            for uid in self._buckets[key]:
+                if (found_count is not None) and (self._insert_count[uid] > found_count):
+                    continue
+                if np.allclose(self._parameters[uid][1:], parameters, rtol=self.rtol, atol=self.atol):
+                    found_key = uid
+                    found_count = self._insert_count[uid]
+
+        return found_key
+
+    def find_many(self, form_name, parameters):
+        """
+        Finds the uids of previously stored parameter sets for many rows at once.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : array_like
+            A (nrows, nparameters) array of parameters in the order of the functional form
+
+        Returns
+        -------
+        uids : np.ndarray
+            The first added uid matching each row, -1 if not found.
+        """
+
+        parameters = np.asarray(parameters, dtype=np.float64)
+        ret = np.full(parameters.shape[0], -1, dtype=np.int64)
+
+        index = self._form_index(form_name)
+        if (parameters.shape[0] == 0) or (index["uid"].shape[0] == 0):
+            return ret
+
+        rows, stored = self._match(parameters, index["keys"], index["parameters"])
+
+        # The first added match of each row
+        order = np.lexsort((index["count"][stored], rows))
+        rows, stored = rows[order], stored[order]
+        first = np.ones(rows.shape[0], dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        ret[rows[first]] = index["uid"][stored[first]]
+
+        return ret
+
+    def compare_many(self, form_name, parameters, uids):
+        """
+        Compares many parameter sets against the parameters stored under the given uids.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : array_like
+            A (nrows, nparameters) array of parameters in the order of the functional form
+        uids : array_like
+            The uid of each row
+
+        Returns
+        -------
+        exists : np.ndarray
+            If each uid is stored
+        match : np.ndarray
+            If each uid is stored with the same functional form and np.allclose parameters
+        """
+
+        parameters = np.asarray(parameters, dtype=np.float64)
+        uids = np.asarray(uids, dtype=np.int64)
+
+        exists = np.in1d(uids, np.fromiter(self._parameters, dtype=np.int64, count=len(self._parameters)))
+        match = np.zeros(uids.shape[0], dtype=bool)
+
+        index = self._form_index(form_name)
+        if index["uid"].shape[0]:
+            pos = np.minimum(np.searchsorted(index["uid"], uids), index["uid"].shape[0] - 1)
+            same_form = index["uid"][pos] == uids
+            close = np.isclose(index["parameters"][pos], parameters, rtol=self.rtol, atol=self.atol)
+            match = same_form & np.all(close, axis=1)
+
+        return exists, match
+
+    def next_uid(self):
+        """
+        Returns the lowest uid that is not currently in use.
+        """
+
+        while self._lowest_hole in self._parameters:
+            self._lowest_hole += 1
+        return self._lowest_hole
+
+    def add(self, form_name, parameters, uid=None):
+        """
+        Stores a new set of parameters, no duplicate checks are performed.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : list
+            The parameters in the order of the functional form
+        uid : int, optional
+            The uid to store the parameters under, otherwise the lowest free uid is used.
+
+        Returns
+        -------
+        uid : int
+            The uid the parameters were stored under.
+        """
+
+        if uid is None:
+            uid = self.next_uid()
+        elif uid in self._parameters:
+            raise KeyError("TermRegistry: uid '%s' already exists." % str(uid))
+
+        key = self._bucket_key(form_name, parameters)
+        self._parameters[uid] = [form_name] + list(parameters)
+        self._buckets.setdefault(key, []).append(uid)
+        self._uid_keys[uid] = key
+        self._insert_count[uid] = self._counter
+        self._counter += 1
+
+        self._invalidate(form_name)
+        return uid
+
+    def add_many(self, form_name, parameters, uids=None):
+        """
+        Stores many new sets of parameters at once, no duplicate checks are performed.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : array_like
+            A (nrows, nparameters) array of parameters in the order of the functional form
+        uids : array_like, optional
+            The uids to store the parameters under, otherwise the lowest free uids are used in order.
+
+        Returns
+        -------
+        uids : np.ndarray
+            The uids the parameters were stored under.
+        """
+
+        parameters = np.asarray(parameters, dtype=np.float64)
+        nrows = parameters.shape[0]
+
+        if uids is None:
+            used = np.fromiter(self._parameters, dtype=np.int64, count=len(self._parameters))
+            uids = np.arange(self._lowest_hole, self._lowest_hole + nrows + used.shape[0])
+            uids = np.setdiff1d(uids, used, assume_unique=True)[:nrows]
+        else:
+            uids = np.asarray(uids, dtype=np.int64)
+            if np.unique(uids).shape[0] != nrows:
+                raise KeyError("TermRegistry: uids must be unique.")
+            exists = np.in1d(uids, np.fromiter(self._parameters, dtype=np.int64, count=len(self._parameters)))
+            if np.any(exists):
+                raise KeyError("TermRegistry: uid '%s' already exists." % str(uids[exists][0]))
+
+        keys = np.floor(self._scale_array(parameters)).astype(np.int64)
+        counts = np.arange(self._counter, self._counter + nrows)
+        self._counter += nrows
+
+        uid_list = uids.tolist()
+        key_list = [(form_name, ) + tuple(k) for k in keys.tolist()]
+        self._parameters.update(zip(uid_list, ([form_name] + p for p in parameters.tolist())))
+        self._uid_keys.update(zip(uid_list, key_list))
+        self._insert_count.update(zip(uid_list, counts.tolist()))
+        for uid, key in zip(uid_list, key_list):
+            self._buckets.setdefault(key, []).append(uid)
+
+        # Extend the index arrays rather than rebuilding them
+        self._array_cache.pop(form_name, None)
+        if form_name in self._index_cache:
+            index = self._index_cache[form_name]
+            new = {"uid": uids, "count": counts, "keys": keys, "parameters": parameters}
+            index = {k: np.concatenate((index[k], new[k])) for k in index}
+            order = np.argsort(index["uid"], kind="mergesort")
+            self._index_cache[form_name] = {k: v[order] for k, v in index.items()}
+
+        return uids
+
+    def add_unique(self, form_name, parameters):
+        """
+        Finds or stores many parameter sets at once. Rows matching a stored parameter set, or an earlier row of
+        parameters, share its uid and only the remaining rows are stored.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+        parameters : array_like
+            A (nrows, nparameters) array of parameters in the order of the functional form
+
+        Returns
+        -------
+        uids : np.ndarray
+            The uid of each row.
+        """
+
+        parameters = np.asarray(parameters, dtype=np.float64)
+
+        # Exact duplicates are resolved once
+        first, inverse = _unique_rows(parameters)
+        values = parameters[first]
+
+        ret = self.find_many(form_name, values)
+        new = np.where(ret < 0)[0]
+        if new.shape[0] == 0:
+            return ret[inverse]
+
+        # New rows close to an earlier new row follow it, unless that row follows another row itself
+        values = values[new]
+        keys = np.floor(self._scale_array(values)).astype(np.int64)
+        rows, stored = self._match(values, keys, values)
+        earlier = stored < rows
+        rows, stored = rows[earlier], stored[earlier]
+
+        leader = np.ones(new.shape[0], dtype=bool)
+        follows = np.arange(new.shape[0])
+        if rows.shape[0]:
+            order = np.lexsort((stored, rows))
+            rows, stored = rows[order], stored[order]
+            bounds = np.flatnonzero(np.diff(rows)) + 1
+
+            # Only rows with near duplicates are visited, in order
+            for row, candidates in zip(rows[np.r_[0, bounds]], np.split(stored, bounds)):
+                candidates = candidates[leader[candidates]]
+                if candidates.shape[0]:
+                    leader[row] = False
+                    follows[row] = candidates[0]
+
+        uids = np.zeros(new.shape[0], dtype=np.int64)
+        uids[leader] = self.add_many(form_name, values[leader])
+        ret[new] = uids[follows]
+
+        return ret[inverse]
+
+    def remove(self, uid):
+        """
+        Removes the parameters stored under uid.
+        """
+
+        if uid not in self._parameters:
+            raise KeyError("TermRegistry: uid '%s' not found." % str(uid))
+
+        form_name = self._parameters[uid][0]
+        key = self._uid_keys.pop(uid)
+        self._buckets[key].remove(uid)
+        if not self._buckets[key]:
+            del self._buckets[key]
+
+        del self._parameters[uid]
+        del self._insert_count[uid]
+
+        if uid < self._lowest_hole:
+            self._lowest_hole = uid
+
+        self._invalidate(form_name)
+
+    def list_forms(self):
+        """
+        Lists the functional forms currently stored.
+        """
+
+        return sorted(set(k[0] for k in self._buckets))
+
+    def get_arrays(self, form_name):
+        """
+        Returns a columnar view of all parameters of a given functional form sorted by uid.
+
+        Parameters
+        ----------
+        form_name : str
+            The name of the functional form
+
+        Returns
+        -------
+        ret : dict
+            Dictionary of read-only arrays of the form {"uid": uids, parameter_name: values, ...}
+        """
+
+        if form_name in self._array_cache:
+            return self._array_cache[form_name]
+
+        param_names = metadata.get_term_metadata(self.order, "forms", form_name)["parameters"]
+
+        uids = sorted(k for k, v in self._parameters.items() if v[0] == form_name)
+        data = np.array([self._parameters[uid][1:] for uid in uids], dtype=np.float64)
+        data = data.reshape(len(uids), len(param_names))
+
+        ret = {"uid": np.array(uids, dtype=np.int64)}
+        for num, name in enumerate(param_names):
+            ret[name] = data[:, num].copy()
+
+        for v in ret.values():
+            v.flags.writeable = False
+
+        self._array_cache[form_name] = ret
+        return ret
@@ -6,7 +6,7 @@ import copy
 from . import eex_find_files
 
 
-@pytest.fixture(scope="function", params=["HDF5", "Memory"])
+@pytest.fixture(scope="function", params=["HDF5", "Memory", "Columnar", "NPY", "SQLite"])
 def butane_dl(request):
     # Build the topology for UA butane. Force Field parameters can be set to defaults by using
     # ff=True, nb=True, or scale=True (defaults)
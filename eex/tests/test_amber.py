@@ -6,6 +6,9 @@ import numpy as np
 import pytest
 import pandas as pd
 import copy
+import json
+import os
+import shutil
 from . import eex_find_files
 
 
@@ -118,6 +121,68 @@ def test_amber_read_butane():
     assert eex.testing.dict_compare(box_info, ref_box)
 
 
+def test_amber_read_sections():
+    fname = eex_find_files.get_example_filename("amber", "water", "spce.prmtop")
+
+    index = eex.translators.amber.build_section_index(fname)
+    assert index[0]["category"] == "TITLE"
+    assert index[1]["category"] == "POINTERS"
+    assert index[1]["format"] == "%FORMAT(10I8)"
+
+    charges = eex.translators.amber.read_amber_section(fname, "CHARGE", index=index)
+    assert charges.shape[0] == 648
+
+    with pytest.raises(KeyError):
+        eex.translators.amber.read_amber_section(fname, "NOT_A_SECTION", index=index)
+
+    # Only the requested sections are loaded
+    dl = eex.datalayer.DataLayer("test_amber_sections", backend="memory")
+    eex.translators.amber.read_amber_file(dl, fname, sections=["CHARGE", "ATOM_TYPE_INDEX", "BONDS_INC_HYDROGEN"])
+    assert set(dl.list_tables()) == {"atom_type", "charge", "term2"}
+    assert dl.get_atom_count("charge") == 648
+    assert dl.get_bond_count() == 648
+
+    with pytest.raises(KeyError):
+        eex.translators.amber.read_amber_file(dl, fname, sections=["NOT_A_SECTION"])
+
+    # Cached indices are reused until the file changes
+    copy_name = eex_find_files.get_scratch_directory("test_amber_sections.prmtop")
+    shutil.copy(fname, copy_name)
+    assert eex.translators.amber.build_section_index(copy_name, cache=True) == index
+    assert os.path.exists(copy_name + ".eexindex")
+
+    with open(copy_name + ".eexindex", "r") as handle:
+        cached = json.load(handle)
+    cached["sections"] = []
+    with open(copy_name + ".eexindex", "w") as handle:
+        json.dump(cached, handle)
+    assert eex.translators.amber.build_section_index(copy_name, cache=True) == []
+
+    with open(copy_name, "a") as handle:
+        handle.write("\n")
+    assert len(eex.translators.amber.build_section_index(copy_name, cache=True)) == len(index)
+
+    os.unlink(copy_name)
+    os.unlink(copy_name + ".eexindex")
+
+
+@pytest.mark.parametrize("pool_type", ["thread", "process"])
+def test_amber_read_parallel(pool_type):
+    fname = eex_find_files.get_example_filename("amber", "water", "spce.prmtop")
+
+    dl = eex.datalayer.DataLayer("test_amber_serial", backend="memory")
+    eex.translators.amber.read_amber_file(dl, fname)
+
+    dl_new = eex.datalayer.DataLayer("test_amber_parallel", backend="memory")
+    eex.translators.amber.read_amber_file(dl_new, fname, blocksize=55, workers=3, pool_type=pool_type)
+
+    assert eex.testing.dl_compare(dl, dl_new)
+    assert dl.list_nb_parameters(nb_name="LJ") == dl_new.list_nb_parameters(nb_name="LJ")
+
+    with pytest.raises(KeyError):
+        eex.translators.amber.read_amber_file(dl_new, fname, workers=2, pool_type="cluster")
+
+
 @pytest.mark.parametrize("backend", ["HDF5", "Memory"])
 @pytest.mark.parametrize("molecule", [
     "trappe_butane_single_molecule.prmtop",
@@ -255,3 +320,247 @@ def test_amber_compatibility_no_scaling(butane_dl):
 
     with pytest.raises(ValueError):
         eex.translators.amber.write_amber_file(dl, oname)
+
+
+def test_amber_decode_section():
+    from eex.translators.amber.amber_read import _decode_section
+    from eex.translators.amber import amber_metadata as amd
+
+    # Integers, the last line is short
+    data = b"".join(b"%8d" % x for x in range(12))
+    data = data[:80] + b"\n" + data[80:] + b"\n"
+    values = _decode_section(data, amd.parse_format("%FORMAT(10I8)"))
+    assert values.dtype == np.int64
+    assert np.all(values == np.arange(12))
+
+    # Full width fields without separators
+    data = b"-1234567" + b"12345678" + b"       3\n"
+    values = _decode_section(data, amd.parse_format("%FORMAT(10I8)"))
+    assert list(values) == [-1234567, 12345678, 3]
+
+    data = b"  1.00000000E+00 -2.50000000E-01\n"
+    values = _decode_section(data, amd.parse_format("%FORMAT(5E16.8)"))
+    assert np.allclose(values, [1.0, -0.25])
+
+    # Strings keep their position when trailing whitespace is cut
+    data = b"C1  CH3 H".ljust(80) + b"\n" + b"O   \n"
+    values = _decode_section(data, amd.parse_format("%FORMAT(20a4)"))
+    assert list(values[:3]) == ["C1", "CH3", "H"]
+    assert values[20] == "O"
+
+    data = b"WAT " * 19 + b"WAT\n" + b"ACE NME\n"
+    values = _decode_section(data, amd.parse_format("%FORMAT(20a4)"))
+    assert list(values[-3:]) == ["WAT", "ACE", "NME"]
+
+    assert _decode_section(b"\n", amd.parse_format("%FORMAT(10I8)")).shape[0] == 0
+
+
+@pytest.mark.parametrize("fmt, data", [
+    ("%FORMAT(10I8)", np.arange(-1050, 1053) * 947),
+    ("%FORMAT(10I8)", np.array([0, -1, 999999, -999999, 12345678, 3])),
+    ("%FORMAT(10I8)", np.array([1000000, 99999999, -1234567, -12345678, 100000000])),
+    ("%FORMAT(10I8)", np.array([2.0, 7.0, -3.0])),
+    ("%FORMAT(5E16.8)", np.linspace(-5.e4, 5.e4, 1003)),
+    ("%FORMAT(20a4)", np.array(["C1", "CH3", "H"] * 15)),
+])
+def test_amber_format_1d(fmt, data):
+    from eex.translators.amber.amber_write import _format_1d
+    from eex.translators.amber import amber_metadata as amd
+
+    fmt_data = amd.parse_format(fmt)
+    ncols = fmt_data[0]
+    fmt = amd.build_format(fmt_data)
+
+    # Matches row by row formatting
+    nrows = data.shape[0] // ncols
+    ref = "".join((fmt * ncols) % tuple(row) + "\n" for row in data[:nrows * ncols].reshape(-1, ncols))
+    if data.shape[0] % ncols:
+        ref += (fmt * (data.shape[0] % ncols)) % tuple(data[nrows * ncols:]) + "\n"
+
+    assert _format_1d(data, ncols, fmt) == ref.encode()
+    assert _format_1d(data[:0], ncols, fmt) == b"\n"
+
+
+def test_amber_exclusion_lists():
+    from eex.translators.amber.amber_write import _build_exclusion_lists
+
+    # Atoms 2 and 5 have no exclusions, pairs keep their order within an atom
+    atom1 = np.array([3, 1, 1, 4, 3, 1])
+    atom2 = np.array([4, 3, 2, 5, 5, 4])
+    number, excluded = _build_exclusion_lists(np.arange(1, 6), atom1, atom2)
+
+    assert list(number) == [3, 1, 2, 1, 1]
+    assert list(excluded) == [3, 2, 4, 0, 4, 5, 5, 0]
+
+    number, excluded = _build_exclusion_lists(np.arange(1, 3), atom1[:0], atom2[:0])
+    assert list(number) == [1, 1]
+    assert list(excluded) == [0, 0]
+
+
+def _write_amber_netcdf(netcdf, fname, xyz, lengths, angles, restart=False):
+    handle = netcdf.netcdf_file(fname, "w", version=2)
+    handle.Conventions = "AMBERRESTART" if restart else "AMBER"
+    handle.ConventionVersion = "1.0"
+
+    if not restart:
+        handle.createDimension("frame", None)
+    handle.createDimension("spatial", 3)
+    handle.createDimension("atom", xyz.shape[-2])
+    handle.createDimension("cell_spatial", 3)
+    handle.createDimension("cell_angular", 3)
+
+    frame = () if restart else ("frame", )
+    for name, dims, dtype, units, data in [
+        ("time", frame, "f4", "picosecond", np.arange(xyz.shape[0]) * 2.0),
+        ("coordinates", frame + ("atom", "spatial"), "f4", "angstrom", xyz),
+        ("cell_lengths", frame + ("cell_spatial", ), "f8", "angstrom", lengths),
+        ("cell_angles", frame + ("cell_angular", ), "f8", "degree", angles),
+    ]:
+        var = handle.createVariable(name, dtype, dims)
+        var.units = units
+        if restart and name == "time":
+            var[...] = 0.0
+        else:
+            var[:] = data
+
+    handle.close()
+
+
+def test_amber_netcdf():
+    netcdf = pytest.importorskip("scipy.io")
+
+    fname = eex_find_files.get_example_filename("amber", "alkanes", "trappe_butane_single_molecule.prmtop")
+    dl = eex.datalayer.DataLayer("test_amber_netcdf", backend="memory")
+    eex.translators.amber.read_amber_file(dl, fname)
+
+    xyz = dl.get_atoms("xyz").values
+    energy = dl.evaluate()
+
+    frames = np.array([xyz * (1.0 + 0.01 * x) for x in range(5)])
+    lengths = np.array([[100.0 + x] * 3 for x in range(5)])
+    angles = np.full((5, 3), 90.0)
+
+    oname = eex_find_files.get_scratch_directory("test_amber_netcdf.nc")
+    _write_amber_netcdf(netcdf, oname, frames, lengths, angles)
+
+    # Strides and units
+    read = list(eex.translators.amber.read_amber_netcdf(oname, start=1, step=2, utype={"length": "nanometer"}))
+    assert [x["frame"] for x in read] == [1, 3]
+    assert [x["time"] for x in read] == [2.0, 6.0]
+    assert np.allclose(read[1]["xyz"], frames[3] / 10.0, atol=1.e-6)
+    assert np.allclose(read[0]["box"]["a"], 10.1)
+    assert read[0]["box"]["gamma"] == 90.0
+
+    # Frames are set in the DataLayer
+    energies = []
+    for frame in eex.translators.amber.read_amber_netcdf(oname, stop=2, dl=dl):
+        assert np.allclose(dl.get_atoms("xyz").values, frames[frame["frame"]], atol=1.e-5)
+        energies.append(dl.evaluate())
+    assert len(energies) == 2
+    assert np.allclose(energies[0]["total"], energy["total"], atol=1.e-4)
+    assert energies[1]["total"] != energies[0]["total"]
+    assert dl.get_atom_count("xyz") == xyz.shape[0]
+    assert np.allclose(dl.get_box_size()["a"], 101.0)
+
+    with pytest.raises(KeyError):
+        list(eex.translators.amber.read_amber_netcdf(oname, utype={"energy": "kcal"}))
+
+    # Restarts hold a single frame
+    rname = eex_find_files.get_scratch_directory("test_amber_netcdf.ncrst")
+    _write_amber_netcdf(netcdf, rname, frames[2], lengths[2], angles[2], restart=True)
+    read = list(eex.translators.amber.read_amber_netcdf(rname))
+    assert len(read) == 1
+    assert np.allclose(read[0]["xyz"], frames[2], atol=1.e-5)
+    assert read[0]["box"]["c"] == 102.0
+
+    os.unlink(oname)
+    os.unlink(rname)
+
+
+def test_amber_restart():
+    fname = eex_find_files.get_example_filename("amber", "water", "spce.inpcrd")
+    restart = eex.translators.amber.read_amber_restart(fname, utype={"length": "nanometer"})
+
+    assert restart["title"] == "WATERBOX18"
+    assert restart["xyz"].shape == (648, 3)
+    assert np.allclose(restart["xyz"].min(axis=0), [-0.0757235, -0.0519927, -0.0872856])
+    assert np.allclose(restart["box"]["a"], 1.8774349)
+    assert restart["velocities"] is None
+
+    # Time, velocities and a box, the last coordinate line is short
+    xyz = np.arange(9).reshape(3, 3) - 4.5
+    vel = np.ones((3, 3))
+    oname = eex_find_files.get_scratch_directory("test_amber_restart.rst7")
+    with open(oname, "w") as handle:
+        handle.write("restart\n%6d%15.7e\n" % (3, 10.0))
+        for data in [xyz, vel]:
+            values = "".join("%12.7f" % x for x in data.ravel())
+            handle.write(values[:72] + "\n" + values[72:] + "\n")
+        handle.write("".join("%12.7f" % x for x in [30.0, 30.0, 30.0, 90.0, 90.0, 90.0]) + "\n")
+
+    restart = eex.translators.amber.read_amber_restart(oname)
+    assert restart["time"] == 10.0
+    assert np.allclose(restart["xyz"], xyz)
+    assert np.allclose(restart["velocities"], vel * 20.455)
+    assert restart["box"]["gamma"] == 90.0
+
+    os.unlink(oname)
+
+
+def _write_amber_mdcrd(fname, frames, boxes=None):
+    with open(fname, "w") as handle:
+        handle.write("trajectory\n")
+        for num, frame in enumerate(frames):
+            values = ["%8.3f" % x for x in frame.ravel()]
+            for pos in range(0, len(values), 10):
+                handle.write("".join(values[pos:pos + 10]) + "\n")
+            if boxes is not None:
+                handle.write("".join("%8.3f" % x for x in boxes[num]) + "\n")
+
+
+@pytest.mark.parametrize("box", [True, False])
+def test_amber_mdcrd(box):
+    fname = eex_find_files.get_example_filename("amber", "alkanes", "trappe_butane_single_molecule.prmtop")
+    dl = eex.datalayer.DataLayer("test_amber_mdcrd", backend="memory")
+    eex.translators.amber.read_amber_file(dl, fname)
+
+    xyz = dl.get_atoms("xyz").values
+    energy = dl.evaluate()
+
+    frames = np.array([xyz * (1.0 + 0.01 * x) for x in range(6)])
+    boxes = np.array([[100.0 + x] * 3 for x in range(6)]) if box else None
+
+    oname = eex_find_files.get_scratch_directory("test_amber_mdcrd.mdcrd")
+    _write_amber_mdcrd(oname, frames, boxes)
+
+    index = eex.translators.amber.build_mdcrd_index(oname, 4)
+    assert index["box"] == box
+    assert index["offsets"].shape[0] == 7
+
+    # Random access and strides
+    read = list(eex.translators.amber.read_amber_mdcrd(oname, 4, start=4, stop=5, index=index))
+    assert len(read) == 1
+    assert np.allclose(read[0]["xyz"], frames[4], atol=1.e-3)
+
+    read = list(eex.translators.amber.read_amber_mdcrd(oname, 4, step=-2, utype={"length": "nanometer"}))
+    assert [x["frame"] for x in read] == [5, 3, 1]
+    assert np.allclose(read[0]["xyz"], frames[5] / 10, atol=1.e-4)
+    if box:
+        assert np.allclose(read[1]["box"]["a"], 10.3)
+    else:
+        assert read[1]["box"] is None
+
+    # Frames are set in the DataLayer
+    energies = [dl.evaluate() for frame in eex.translators.amber.read_amber_mdcrd(oname, 4, stop=2, dl=dl)]
+    assert np.allclose(energies[0]["total"], energy["total"], rtol=1.e-3)
+    assert energies[1]["total"] != energies[0]["total"]
+    assert np.allclose(dl.get_atoms("xyz").values, frames[1], atol=1.e-3)
+    if box:
+        box_size = dl.get_box_size(utype={"a": "angstrom", "b": "angstrom", "c": "angstrom", "alpha": "degree",
+                                          "beta": "degree", "gamma": "degree"})
+        assert np.allclose([box_size["a"], box_size["alpha"]], [101.0, 90.0])
+
+    with pytest.raises(ValueError):
+        eex.translators.amber.build_mdcrd_index(oname, 5)
+
+    os.unlink(oname)
@@ -2,6 +2,8 @@
 Tests the datalayer object for EEX
 """
 
+import shutil
+
 import eex
 import pytest
 import pandas as pd
@@ -10,12 +12,13 @@ import numpy as np
 from eex.testing import df_compare, dict_compare
 
 from eex import nb_converter
+from . import eex_find_files
 
 # Set the Seed
 np.random.seed(0)
 
 # Any parameters to loop over
-_backend_list = ["HDF5", "Memory"]
+_backend_list = ["HDF5", "Memory", "Columnar", "NPY", "SQLite"]
 
 
 def _build_atom_df(nmols):
@@ -86,6 +89,62 @@ def test_misc(backend):
     assert (dl.list_other_tables() == [])
 
 
+@pytest.mark.parametrize("backend", _backend_list)
+def test_set_coordinates(backend):
+    dl = eex.datalayer.DataLayer("test_set_coordinates", backend=backend)
+
+    with pytest.raises(KeyError):
+        dl.set_coordinates(np.zeros((3, 3)))
+
+    atoms = _build_atom_df(3)
+    dl.add_atoms(atoms[["atom_name", "charge"]])
+
+    # Coordinates are added by the stored atom index
+    xyz = np.random.rand(9, 3)
+    dl.set_coordinates(xyz)
+    assert np.allclose(dl.get_atoms("xyz").values, xyz)
+    assert list(dl.get_atoms("xyz").index) == list(atoms.index)
+
+    # Coordinates are replaced and converted
+    dl.set_coordinates(xyz, utype="nanometer")
+    assert np.allclose(dl.get_atoms("xyz").values, xyz * 10)
+    assert dl.get_atom_count("xyz") == 9
+
+    with pytest.raises(ValueError):
+        dl.set_coordinates(xyz[:5])
+
+
+@pytest.mark.parametrize("backend", _backend_list)
+def test_chunked_reads(backend):
+    dl = eex.datalayer.DataLayer("test_chunked_reads", backend=backend)
+
+    atoms = _build_atom_df(5)
+    dl.add_atoms(atoms.iloc[:7], by_value=True)
+    dl.add_atoms(atoms.iloc[7:], by_value=True)
+
+    bonds = pd.DataFrame({"atom1": np.arange(0, 14), "atom2": np.arange(1, 15), "term_index": np.ones(14, dtype=int)})
+    dl.add_bonds(bonds)
+
+    # Chunks match a full read, by index and by value
+    for by_value in [True, False]:
+        props = ["molecule_index", "charge", "xyz"]
+        full = dl.get_atoms(props, by_value=by_value, utype={"xyz": "nanometer"})
+        chunks = list(dl.get_atoms(props, by_value=by_value, utype={"xyz": "nanometer"}, chunksize=4))
+        assert [x.shape[0] for x in chunks] == [4, 4, 4, 3]
+        assert df_compare(full, pd.concat(chunks))
+
+    chunks = list(dl.get_terms("bonds", chunksize=6))
+    assert [x.shape[0] for x in chunks] == [6, 6, 2]
+    assert df_compare(dl.get_terms("bonds"), pd.concat(chunks))
+
+    assert list(dl.get_terms("angles", chunksize=6)) == []
+
+    with pytest.raises(ValueError):
+        dl.get_terms("bonds", chunksize=0)
+
+    dl.close()
+
+
 def test_add_atom_parameter():
     dl = eex.datalayer.DataLayer("test_add_atom_parameters")
 
@@ -338,6 +397,95 @@ def test_get_term_parameters_units():
         dl.get_term_parameter(2, 0, utype=utype, ftype="harmonic")
 
 
+def test_add_get_term_parameters_bulk():
+    """
+    Test adding and obtaining many parameters at once
+    """
+
+    dl = eex.datalayer.DataLayer("test_term_parameters_bulk")
+
+    utype_2b = {"K": "(kJ / mol) * angstrom ** -2", "R0": "angstrom"}
+    df = pd.DataFrame({"K": [4.0, 6.0, 4.0], "R0": [5.0, 7.0, 5.0]})
+    uids = dl.add_term_parameters(2, df, term_name="harmonic", utype=utype_2b)
+    assert [0, 1, 0] == list(uids)
+
+    # Must match the single parameter path
+    assert 1 == dl.add_term_parameter(2, "harmonic", {"K": 6.0, "R0": 7.0}, utype=utype_2b)
+
+    # Explicit uids and term names
+    df = pd.DataFrame({"uid": [5, 1], "term_name": ["harmonic", "harmonic"], "K": [8.0, 6.0], "R0": [9.0, 7.0]})
+    assert [5, 1] == list(dl.add_term_parameters(2, df, utype=utype_2b))
+
+    utype_2scale = {"K": "2.0 * (kJ / mol) * angstrom ** -2", "R0": "2.0 * angstrom"}
+    data = dl.get_term_parameters(2, utype=utype_2scale, ftype="harmonic")
+    assert [0, 1, 5] == list(data.index)
+    assert {"harmonic"} == set(data["term_name"])
+    assert np.allclose([2.0, 3.0, 4.0], data["K"])
+    assert np.allclose([2.5, 3.5, 4.5], data["R0"])
+
+    data = dl.get_term_parameters(2, [5, 0])
+    for uid, row in data.iterrows():
+        parm = dl.get_term_parameter(2, uid)
+        assert dict_compare(parm[1], row[["K", "R0"]].to_dict())
+
+    with pytest.raises(KeyError):
+        dl.get_term_parameters(2, [0, 1231234123])
+
+    with pytest.raises(KeyError):
+        dl.add_term_parameters(2, df[["K", "R0"]])
+
+    with pytest.raises(KeyError):
+        dl.add_term_parameters(2, df[["uid", "K"]], term_name="harmonic")
+
+    with pytest.raises(KeyError):
+        df = pd.DataFrame({"uid": [5], "K": [1.0], "R0": [2.0]})
+        dl.add_term_parameters(2, df, term_name="harmonic")
+
+    with pytest.raises(KeyError):
+        df = pd.DataFrame({"uid": [7, 7], "K": [1.0, 3.0], "R0": [2.0, 2.0]})
+        dl.add_term_parameters(2, df, term_name="harmonic")
+
+    # Form conversion of whole columns matches the single parameter path
+    df = pd.DataFrame(np.random.RandomState(0).uniform(-5, 5, size=(6, 4)), columns=["K_1", "K_2", "K_3", "K_4"])
+    uids = dl.add_term_parameters(4, df, term_name="opls")
+    data = dl.get_term_parameters(4, ftype="RB")
+    assert {"RB"} == set(data["term_name"])
+    for uid in uids:
+        parm = dl.get_term_parameter(4, uid, ftype="RB")
+        assert dict_compare(parm[1], data.loc[uid, parm[1].keys()].to_dict())
+
+
+def test_add_term_parameters_bulk_duplicates():
+    """
+    Test that bulk adds find the same uids as adding one parameter at a time
+    """
+
+    dl_single = eex.datalayer.DataLayer("test_term_parameters_single")
+    dl_bulk = eex.datalayer.DataLayer("test_term_parameters_bulk")
+
+    # Exact and near duplicates within the rows and of stored parameters, including chains of near duplicates
+    base = np.random.uniform(-100, 100, size=(10, 2))
+    values = base[np.random.randint(0, 10, size=200)]
+    values *= 1.0 + np.random.choice([0.0, 0.3e-5, 0.6e-5, -0.6e-5, 1.2e-5], size=values.shape)
+    values[::17] = 0.0
+
+    for v in base[:4] * (1.0 + 0.4e-5):
+        dl_single.add_term_parameter(2, "harmonic", list(v))
+        dl_bulk.add_term_parameter(2, "harmonic", list(v))
+    dl_single.remove_term_parameter(2, 1)
+    dl_bulk.remove_term_parameter(2, 1)
+
+    single = [dl_single.add_term_parameter(2, "harmonic", list(v)) for v in values]
+    bulk = dl_bulk.add_term_parameters(2, pd.DataFrame(values, columns=["K", "R0"]), term_name="harmonic")
+    assert single == list(bulk)
+
+    for v in values[:20] * (1.0 + 0.1e-5):
+        single_uid = dl_single.add_term_parameter(2, "harmonic", list(v))
+        assert single_uid == dl_bulk.add_term_parameter(2, "harmonic", list(v))
+
+    assert sorted(dl_single.list_term_uids(2)) == sorted(dl_bulk.list_term_uids(2))
+
+
 def test_list_parameters():
     """
     Test listing parameters uids
@@ -365,6 +513,60 @@ def test_list_parameters():
     assert {0, 1, 9} == set(bond_list)
 
 
+def test_term_parameter_buckets():
+    """
+    Test duplicate detection across tolerance bucket edges
+    """
+
+    dl = eex.datalayer.DataLayer("test_term_parameter_buckets")
+
+    values = np.random.uniform(-100, 100, size=(50, 2))
+    for num, v in enumerate(values):
+        assert num == dl.add_term_parameter(2, "harmonic", list(v))
+
+    # Anything np.allclose to a stored value must be found, regardless of bucket
+    for num, v in enumerate(values):
+        for shift in [0.0, 0.5e-5, -0.5e-5]:
+            assert num == dl.add_term_parameter(2, "harmonic", list(v * (1.0 + shift)))
+
+    # Zero and tiny values
+    assert 50 == dl.add_term_parameter(2, "harmonic", [0.0, 0.0])
+    assert 50 == dl.add_term_parameter(2, "harmonic", [1.e-9, -1.e-9])
+    assert 51 == dl.add_term_parameter(2, "harmonic", [0.0, 1.e-6])
+
+    # Removed uids are reused first
+    dl.remove_term_parameter(2, 3)
+    assert 3 == dl.add_term_parameter(2, "harmonic", [1234.0, 5678.0])
+    assert 52 == dl.add_term_parameter(2, "harmonic", [1235.0, 5678.0])
+
+
+def test_term_parameter_arrays():
+    """
+    Test the columnar view of the term parameters
+    """
+
+    dl = eex.datalayer.DataLayer("test_term_parameter_arrays")
+
+    dl.add_term_parameter(2, "harmonic", [4.0, 5.0], uid=3)
+    dl.add_term_parameter(2, "harmonic", [6.0, 7.0], uid=1)
+    dl.add_term_parameter(3, "harmonic", [1.0, 2.0])
+
+    data = dl.get_term_parameter_arrays(2)
+    assert {"harmonic"} == set(data)
+    assert np.allclose([1, 3], data["harmonic"]["uid"])
+    assert np.allclose([6.0, 4.0], data["harmonic"]["K"])
+    assert np.allclose([7.0, 5.0], data["harmonic"]["R0"])
+
+    with pytest.raises(ValueError):
+        data["harmonic"]["K"][0] = 1.0
+
+    # Arrays are rebuilt after modification
+    dl.add_term_parameter(2, "harmonic", [8.0, 9.0])
+    data = dl.get_term_parameter_arrays(2, "harmonic")
+    assert np.allclose([0, 1, 3], data["harmonic"]["uid"])
+    assert np.allclose([8.0, 6.0, 4.0], data["harmonic"]["K"])
+
+
 def test_atom_units():
     """
     Tests adding bonds as a DataFrame
@@ -706,6 +908,50 @@ def test_get_nb_parameter():
     assert dict_compare(result, comp)
 
 
+def test_add_get_nb_parameters_bulk():
+    dl = eex.datalayer.DataLayer("test_nb_parameters_bulk", backend="memory")
+
+    utype = {'epsilon': 'kcal * mol ** -1', 'sigma': 'angstrom'}
+    df = pd.DataFrame({"atom_type": [3, 1, 2], "epsilon": [0.1, 0.2, 0.3], "sigma": [2.0, 3.0, 4.0]})
+    dl.add_nb_parameters(df, nb_name="LJ", nb_model="epsilon/sigma", utype=utype)
+
+    # Pairs are stored with atom_type <= atom_type2
+    df = pd.DataFrame({"atom_type": [2, 1], "atom_type2": [1, 1], "epsilon": [0.5, 0.6], "sigma": [1.0, 1.5]})
+    dl.add_nb_parameters(df, nb_name="LJ", nb_model="epsilon/sigma", utype=utype)
+
+    single = dl.get_nb_parameters("LJ", nb_model="epsilon/sigma", utype=utype)
+    assert [1, 2, 3] == list(single["atom_type"])
+    assert np.allclose([0.2, 0.3, 0.1], single["epsilon"])
+    assert np.allclose([3.0, 4.0, 2.0], single["sigma"])
+
+    pair = dl.get_nb_parameters("LJ", nb_model="epsilon/sigma", utype=utype, itype="pair")
+    assert [1, 1] == list(pair["atom_type"])
+    assert [1, 2] == list(pair["atom_type2"])
+    assert np.allclose([0.6, 0.5], pair["epsilon"])
+
+    # Must match the single parameter path
+    for num, atype in enumerate(single["atom_type"]):
+        params = dl.get_nb_parameter(int(atype), nb_model="AB")
+        comp = dl.get_nb_parameters("LJ", nb_model="AB")
+        assert np.isclose(params["A"], comp["A"][num])
+        assert np.isclose(params["B"], comp["B"][num])
+
+    params = dl.get_nb_parameter(1, atom_type2=2, nb_model="epsilon/sigma", utype=utype)
+    assert dict_compare(params, {"epsilon": 0.5, "sigma": 1.0})
+
+    nb_list = dl.list_nb_parameters("LJ", nb_model="epsilon/sigma", utype=utype)
+    assert {(1, None), (2, None), (3, None), (1, 1), (1, 2)} == set(nb_list)
+
+    # Overwriting with another form
+    df = pd.DataFrame({"atom_type": [3], "A": [1.0], "rho": [1.0], "C": [1.0]})
+    dl.add_nb_parameters(df, nb_name="Buckingham")
+    assert [1, 2] == list(dl.get_nb_parameters("LJ")["atom_type"])
+    assert [3] == list(dl.get_nb_parameters("Buckingham")["atom_type"])
+
+    with pytest.raises(KeyError):
+        dl.add_nb_parameters(df[["atom_type", "A"]], nb_name="Buckingham")
+
+
 def test_mixing_rule():
     dl = eex.datalayer.DataLayer("test_add_nb_parameters", backend="memory")
 
@@ -1188,6 +1434,110 @@ def test_remove_terms_by_index_nonconsecutive_propagate(butane_dl):
     return True
 
 
+@pytest.mark.parametrize("backend", _backend_list)
+def test_remove_terms_chain_propagate(backend):
+    dl = eex.datalayer.DataLayer("test_remove_terms_chain", backend=backend)
+
+    # Linear chain with two bond types, angles and dihedrals
+    natoms = 50
+    atoms = np.arange(natoms)
+    bonds = pd.DataFrame({"atom1": atoms[:-1], "atom2": atoms[1:], "term_index": atoms[:-1] % 2})
+    angles = pd.DataFrame({"atom1": atoms[:-2], "atom2": atoms[1:-1], "atom3": atoms[2:], "term_index": 0})
+    dihedrals = pd.DataFrame({
+        "atom1": atoms[:-3],
+        "atom2": atoms[1:-2],
+        "atom3": atoms[2:-1],
+        "atom4": atoms[3:],
+        "term_index": 0
+    })
+    dl.add_bonds(bonds)
+    dl.add_angles(angles)
+    dl.add_dihedrals(dihedrals)
+
+    # Remove bonds (0, 1), (10, 11) and (11, 12)
+    dl.remove_terms(2, index=[0, 10, 11], propagate=True)
+
+    assert dl.get_term_count(2)["total"] == natoms - 4
+    assert dl.get_term_count(2)[0] == (natoms - 1) // 2 + 1 - 2
+    assert dl.get_term_count(2)[1] == (natoms - 1) // 2 - 1
+
+    # Angles and dihedrals spanning the removed bonds are gone
+    remaining = dl.get_terms(3)
+    assert dl.get_term_count(3)["total"] == natoms - 2 - 4
+    assert set(remaining["atom2"]) == set(range(1, natoms - 1)) - {1, 10, 11, 12}
+
+    remaining = dl.get_terms(4)
+    assert dl.get_term_count(4)["total"] == natoms - 3 - 5
+    assert set(remaining["atom1"]) == set(range(0, natoms - 3)) - {0, 8, 9, 10, 11}
+
+    # Removing again from the updated tables
+    dl.remove_terms(3, index=[0], propagate=True)
+    assert dl.get_term_count(3)["total"] == natoms - 2 - 5
+    assert dl.get_term_count(4)["total"] == natoms - 3 - 6
+
+
+@pytest.mark.parametrize("backend", _backend_list)
+def test_remove_terms_interleaved(backend):
+    dl = eex.datalayer.DataLayer("test_remove_terms_interleaved", backend=backend)
+
+    bonds = pd.DataFrame({"atom1": np.arange(0, 20), "atom2": np.arange(1, 21), "term_index": 0})
+    dl.add_bonds(bonds.iloc[:10])
+    dl.remove_terms(2, index=[2])
+
+    # The reverse index is updated in place by later adds and removes
+    reverse_index = dl._get_atom_term_index(2)
+    dl.add_bonds(bonds.iloc[10:])
+    dl.add_bonds(pd.DataFrame({"atom1": [3, 4], "atom2": [3, 2], "term_index": 1}))
+    dl.remove_terms(2, index=[5, 18])
+    dl.remove_terms(2, index=[0, 1, 2])
+    dl.add_bonds(pd.DataFrame({"atom1": [30], "atom2": [31], "term_index": 1}))
+    assert dl._get_atom_term_index(2) is reverse_index
+
+    remaining = dl.get_terms(2)
+    assert list(remaining["atom1"]) == [4, 5, 7, 8, 9] + list(range(10, 19)) + [3, 4, 30]
+    assert list(remaining["atom2"]) == [5, 6, 8, 9, 10] + list(range(11, 20)) + [3, 2, 31]
+    assert dl.get_term_count(2) == {"total": 17, 0: 14, 1: 3}
+
+    # Matches a freshly built index, with stable ids replaced by row positions
+    keys = reverse_index["keys"]
+    rows = np.searchsorted(reverse_index["ids"], keys & eex.datalayer._TERM_ID_MASK)
+    del dl._atom_term_index[2]
+    fresh = dl._get_atom_term_index(2)
+    assert np.array_equal(fresh["keys"], ((keys >> eex.datalayer._TERM_ID_BITS) << eex.datalayer._TERM_ID_BITS) | rows)
+    assert np.array_equal(fresh["atoms"], reverse_index["atoms"])
+    assert np.array_equal(fresh["term_index"], reverse_index["term_index"])
+
+
+def test_get_terms_read_only(butane_dl):
+    dl = butane_dl()
+
+    bonds = dl.get_terms(2)
+    view = dl.get_terms(2, copy=False)
+    assert df_compare(bonds, view)
+
+    # In place modification of the view is not allowed
+    with pytest.raises(ValueError):
+        view.loc[view.index[0], "atom1"] = 10
+
+    with pytest.raises(ValueError):
+        view["atom1"].values[0] = 10
+
+    # Assigning a column replaces it in the view only, older pandas refuses the assignment instead
+    try:
+        view["atom1"] = 10
+    except ValueError:
+        pass
+    assert df_compare(bonds, dl.get_terms(2, copy=False))
+
+    # New columns only belong to this view
+    view["turtle"] = 10
+    assert df_compare(bonds, dl.get_terms(2, copy=False))
+
+    # Copies are writeable and do not touch the store
+    bonds.loc[bonds.index[0], "atom1"] = 10
+    assert dl.get_terms(2)["atom1"].iloc[0] == 0
+
+
 def test_remove_and_add_terms(butane_dl):
     dl = butane_dl()
 
@@ -1289,3 +1639,88 @@ def test_remove_term_parameters_two(butane_dl):
         })
 
     print("The uids are", uid, uid2)
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_save_open(butane_dl, lazy):
+    dl = butane_dl()
+    dl.set_box_size({"a": 10, "b": 11, "c": 12, "alpha": 90, "beta": 90, "gamma": 90},
+                    utype={"a": "angstrom", "b": "angstrom", "c": "angstrom",
+                           "alpha": "degree", "beta": "degree", "gamma": "degree"})
+    dl.build_LJ_mixing_table()
+    dl.add_other("notes", pd.DataFrame({"value": [1.5, 2.5]}))
+
+    path = eex_find_files.get_scratch_directory("test_save_open_%s_%s" % (dl.store.__class__.__name__, lazy))
+    dl.save(path)
+
+    dl2 = eex.datalayer.DataLayer.open(path, lazy=lazy)
+    assert set(dl.list_tables()) == set(dl2.list_tables())
+    assert df_compare(dl.get_atoms(None, by_value=True), dl2.get_atoms(None, by_value=True))
+    assert df_compare(dl.get_atoms(None), dl2.get_atoms(None))
+    assert df_compare(dl.get_other("notes"), dl2.get_other("notes"))
+    for order in [2, 3, 4]:
+        assert df_compare(dl.get_terms(order), dl2.get_terms(order))
+        assert dict_compare(dl.get_term_count(order), dl2.get_term_count(order))
+        assert dl.list_term_parameters(order) == dl2.list_term_parameters(order)
+
+    assert dict_compare(dl.list_nb_parameters("LJ"), dl2.list_nb_parameters("LJ"))
+    assert dict_compare(dl.list_nb_parameters("LJ", itype="pair"), dl2.list_nb_parameters("LJ", itype="pair"))
+    assert dict_compare(dl.get_nb_scaling_factors(), dl2.get_nb_scaling_factors())
+    assert dict_compare(dl.get_box_size(), dl2.get_box_size())
+    assert dl.get_mixing_rule() == dl2.get_mixing_rule()
+
+    # New parameters do not collide with reopened ones
+    uid = dl2.add_term_parameter(2, "harmonic", {'K': 300.9, 'R0': 1.540},
+                                 utype={'K': "kcal * mol **-1 * angstrom ** -2", 'R0': "angstrom"})
+    assert uid == 0
+
+    dl2.close()
+    shutil.rmtree(path)
+
+
+def test_save_chunked(butane_dl, monkeypatch):
+    dl = butane_dl()
+
+    # Tables are copied a row at a time
+    monkeypatch.setattr(eex.datalayer, "_SAVE_CHUNKSIZE", 1)
+    path = eex_find_files.get_scratch_directory("test_save_chunked_%s" % dl.store.__class__.__name__)
+    dl.save(path)
+
+    dl2 = eex.datalayer.DataLayer.open(path)
+    assert set(dl.list_tables()) == set(dl2.list_tables())
+    assert df_compare(dl.get_atoms(None, by_value=True), dl2.get_atoms(None, by_value=True))
+    for order in [2, 3, 4]:
+        assert df_compare(dl.get_terms(order), dl2.get_terms(order))
+
+    dl2.close()
+    shutil.rmtree(path)
+
+
+def test_background_writes_memory():
+    dl = eex.datalayer.DataLayer("test_background_writes_memory", backend="Memory")
+
+    # In memory stores are written directly
+    store = dl.store
+    with dl.background_writes():
+        assert dl.store is store
+    dl.close()
+
+
+def test_background_writes_error():
+    dl = eex.datalayer.DataLayer("test_background_writes", backend="NPY")
+
+    # Failed writes are raised on exit
+    with pytest.raises(KeyError):
+        with dl.background_writes():
+            dl.store.add_table("notes", pd.DataFrame({"a": [1]}))
+            dl.store.add_table("notes", pd.DataFrame({"b": [1]}))
+
+    # Exceptions of the context are not replaced by a failed write
+    with pytest.raises(ZeroDivisionError):
+        with dl.background_writes():
+            dl.store.add_table("notes", pd.DataFrame({"b": [1]}))
+            1 / 0
+
+    assert not isinstance(dl.store, eex.filelayer.AsyncStore)
+    assert df_compare(pd.DataFrame({"a": [1]}), dl.store.read_table("notes"))
+    dl.close()
@@ -108,6 +108,38 @@ def test_opls_to_rb_loop():
     assert np.allclose(e_opls, e_rb)
 
 
+def test_opls_to_rb_arrays():
+
+    const = 10.0 * (2 * np.random.RandomState(0).random_sample((4, 20)) - 1.0)
+    opls_coeffs = {'K_' + str(idx + 1): const[idx] for idx in range(4)}
+
+    # Matches the scalar conversion row by row
+    rb_coeffs = eex.form_converters.convert_form_arrays(4, opls_coeffs, 'opls', 'RB')
+    back = eex.form_converters.convert_form_arrays(4, rb_coeffs, 'RB', 'opls')
+    for num in range(20):
+        row = eex.form_converters.convert_form(4, {k: v[num] for k, v in opls_coeffs.items()}, 'opls', 'RB')
+        for k, v in row.items():
+            assert np.isclose(rb_coeffs[k][num], v)
+    for k, v in opls_coeffs.items():
+        assert np.allclose(back[k], v)
+
+    # Conversions without array converters are converted row by row
+    rb_coeffs = {'A_' + str(idx): np.array([1.0, 2.0]) * (idx == 0) for idx in range(6)}
+    rb_coeffs['A_2'] = np.array([3.0, 1.0])
+    charmm_coeffs = eex.form_converters.convert_form_arrays(4, rb_coeffs, 'RB', 'charmmfsw')
+    assert len(charmm_coeffs['K']) == 2
+    assert np.allclose(charmm_coeffs['K'][1],
+                       eex.form_converters.convert_form(4, {k: v[1] for k, v in rb_coeffs.items()}, 'RB',
+                                                        'charmmfsw')['K'])
+
+    opls_coeffs['K_1'][3:5] = 0.0
+    opls_coeffs['K_2'][3:5] = 0.0
+    opls_coeffs['K_3'][3:5] = 0.0
+    opls_coeffs['K_4'][4] = 0.0
+    with pytest.raises(ValueError):
+        eex.form_converters.convert_form_arrays(4, opls_coeffs, 'opls', 'RB')
+
+
 @pytest.mark.parametrize("coeffs", [
     (0.0, 0.0, 0.0, 0.0),
 ])
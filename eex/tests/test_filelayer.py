@@ -0,0 +1,393 @@
+"""
+Tests the filelayer stores for EEX
+"""
+
+import eex
+import pytest
+import threading
+import pandas as pd
+import numpy as np
+
+from eex.testing import df_compare
+from . import eex_find_files
+
+
+def _build_table(nrows, start=0):
+    df = pd.DataFrame()
+    df["atom1"] = np.arange(start, start + nrows)
+    df["atom2"] = np.arange(start, start + nrows) + 1
+    df["term_index"] = np.arange(nrows) % 3
+    df.index = np.arange(start, start + nrows)
+    return df
+
+
+def test_columnar_store_append():
+    store = eex.filelayer.build_store("Columnar", "test_columnar_append", eex_find_files.get_scratch_directory(""),
+                                      False)
+
+    frags = [_build_table(n, start) for n, start in [(5, 0), (100, 5), (1, 105), (1000, 106)]]
+    for frag in frags:
+        store.add_table("term2", frag)
+
+    assert store.list_tables() == ["term2"]
+    assert df_compare(pd.concat(frags), store.read_table("term2"))
+
+    # Arrays are views of the store
+    arrays = store.read_arrays("term2", ["atom1"])
+    assert np.allclose(arrays["atom1"], np.arange(1106))
+    with pytest.raises(ValueError):
+        arrays["atom1"][0] = 5
+
+    # Mismatched columns
+    with pytest.raises(KeyError):
+        store.add_table("term2", pd.DataFrame({"atom1": [1]}))
+
+    # Dtypes are promoted
+    tmp = _build_table(2, 2000)
+    tmp["atom1"] = [0.5, 1.5]
+    store.add_table("term2", tmp)
+    assert store.read_table("term2")["atom1"].dtype == np.float64
+    assert store.read_table("term2")["atom2"].dtype == np.int64
+
+
+def test_columnar_store_remove():
+    store = eex.filelayer.build_store("Columnar", "test_columnar_remove", eex_find_files.get_scratch_directory(""),
+                                      False)
+
+    data = _build_table(50)
+    store.add_table("term2", data)
+
+    # Positions refer to the remaining rows
+    store.remove_table("term2", [0, 10, 11])
+    store.remove_table("term2", [0])
+    assert df_compare(data.drop([0, 1, 10, 11]), store.read_table("term2"))
+
+    # Appends after removal
+    store.remove_table("term2", np.arange(5))
+    store.add_table("term2", _build_table(3, 100))
+    comp = pd.concat([data.drop([0, 1, 10, 11]).iloc[5:], _build_table(3, 100)])
+    assert df_compare(comp, store.read_table("term2"))
+
+    # Read-only reads
+    view = store.read_table("term2", copy=False)
+    with pytest.raises(ValueError):
+        view.iloc[0, 0] = 5
+
+    store.remove_table("term2")
+    assert store.list_tables() == []
+    with pytest.raises(KeyError):
+        store.read_table("term2")
+
+
+def test_npy_store_append():
+    scratch = eex_find_files.get_scratch_directory("")
+    store = eex.filelayer.build_store("NPY", "test_npy_append", scratch, True)
+
+    frags = [_build_table(n, start) for n, start in [(5, 0), (100, 5), (1000, 105)]]
+    for frag in frags:
+        store.add_table("term2", frag)
+
+    names = pd.DataFrame({"atom_name": ["C", "CH3", "H"]}, index=[0, 1, 2])
+    store.add_table("atom_name", names)
+    store.add_table("atom_name", pd.DataFrame({"atom_name": ["CH2"]}, index=[3]))
+
+    assert set(store.list_tables()) == {"term2", "atom_name"}
+    assert df_compare(pd.concat(frags), store.read_table("term2"))
+    assert list(store.read_table("atom_name")["atom_name"]) == ["C", "CH3", "H", "CH2"]
+
+    # Arrays are read-only memory maps
+    arrays = store.read_arrays("term2", ["atom1"])
+    assert isinstance(arrays["atom1"], np.memmap)
+    assert np.allclose(arrays["atom1"], np.arange(1105))
+    with pytest.raises(ValueError):
+        arrays["atom1"][0] = 5
+
+    # Mismatched columns
+    with pytest.raises(KeyError):
+        store.add_table("term2", pd.DataFrame({"atom1": [1]}))
+
+    # A reopened store in the same location reads the same tables
+    reader = eex.filelayer.build_store("NPY", "test_npy_append", scratch, True, reopen=True)
+    assert df_compare(pd.concat(frags), reader.read_table("term2"))
+
+    # A new store in the same location starts empty
+    store = eex.filelayer.build_store("NPY", "test_npy_append", scratch, False)
+    assert store.list_tables() == []
+    store.close()
+
+    with pytest.raises(KeyError):
+        eex.filelayer.build_store("NPY", "test_npy_append", scratch, False, reopen=True)
+    reader.save_data = False
+
+
+def test_npy_store_remove():
+    store = eex.filelayer.build_store("NPY", "test_npy_remove", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(50)
+    store.add_table("term2", data)
+
+    store.remove_table("term2", [0, 10, 11])
+    store.add_table("term2", _build_table(2, 100))
+    comp = pd.concat([data.drop([0, 10, 11]), _build_table(2, 100)])
+    assert df_compare(comp, store.read_table("term2"))
+
+    store.remove_table("term2")
+    assert store.list_tables() == []
+    with pytest.raises(KeyError):
+        store.read_table("term2")
+
+
+def test_npy_store_mapped_rewrite():
+    store = eex.filelayer.build_store("NPY", "test_npy_mapped", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(100000)
+    store.add_table("term2", data)
+
+    # Arrays mapped before a rewrite keep their values
+    arrays = store.read_arrays("term2")
+    store.remove_table("term2", np.arange(1000, 100000))
+    assert arrays["atom1"].sum() == data["atom1"].sum()
+    assert np.array_equal(store.read_arrays("term2")["atom1"], data["atom1"].values[:1000])
+
+    # Dtype promotion rewrites the columns as well
+    arrays = store.read_arrays("term2")
+    promoted = _build_table(5, 1000)
+    promoted["atom1"] = promoted["atom1"].astype(np.float64)
+    store.add_table("term2", promoted)
+    assert arrays["atom1"].sum() == data["atom1"].values[:1000].sum()
+    assert store.read_arrays("term2")["atom1"].dtype == np.float64
+
+    store.close()
+
+
+def test_sqlite_store_where():
+    store = eex.filelayer.build_store("SQLite", "test_sqlite_where", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(1000)
+    data.index.name = "term_index2"
+    store.add_table("term2", data.iloc[:500])
+    store.add_table("term2", data.iloc[500:])
+    assert df_compare(data, store.read_table("term2"))
+
+    # Atom columns are indexed
+    indices = [x[0] for x in store.connection.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'term2'")]
+    assert set(indices) == {"term2", "term2__atom1", "term2__atom2", "term2__term_index"}
+
+    # Dictionary and SQL filters
+    tmp = store.read_table("term2", where={"atom1": [5, 7, 900], "term_index": 0})
+    assert list(tmp.index) == [900]
+
+    tmp = store.read_table("term2", where="atom1 < 10 OR atom2 = 500", columns=["atom2"])
+    assert list(tmp.columns) == ["atom2"]
+    assert df_compare(data.loc[list(range(10)) + [499], ["atom2"]], tmp)
+
+    with pytest.raises(KeyError):
+        store.read_table("term2", columns=["atom5"])
+
+    # Chunked reads
+    chunks = list(store.iter_table("term2", 300, where={"term_index": 1}))
+    assert [x.shape[0] for x in chunks] == [300, 33]
+    assert df_compare(data[data["term_index"] == 1], pd.concat(chunks))
+
+    store.remove_table("term2", [0, 1, 2])
+    assert df_compare(data.iloc[3:], store.read_table("term2"))
+    store.close()
+
+
+def test_sqlite_store_reopen():
+    scratch = eex_find_files.get_scratch_directory("")
+    store = eex.filelayer.build_store("SQLite", "test_sqlite_reopen", scratch, True)
+    store.add_table("term2", _build_table(10))
+    store.close()
+
+    # A reopened store reads the same tables
+    reader = eex.filelayer.build_store("SQLite", "test_sqlite_reopen", scratch, True, reopen=True)
+    assert df_compare(_build_table(10), reader.read_table("term2"))
+    reader.close()
+
+    # A new store in the same location starts empty
+    store = eex.filelayer.build_store("SQLite", "test_sqlite_reopen", scratch, False)
+    assert store.list_tables() == []
+    store.close()
+
+    with pytest.raises(KeyError):
+        eex.filelayer.build_store("SQLite", "test_sqlite_reopen", scratch, False, reopen=True)
+
+
+def test_hdf_store_where():
+    store = eex.filelayer.build_store("HDF5", "test_hdf_where", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(1000)
+    data.index.name = "term_index2"
+    store.add_table("term2", data.iloc[:500])
+    store.add_table("term2", data.iloc[500:])
+    assert df_compare(data, store.read_table("term2"))
+
+    # Dictionary and PyTables filters
+    tmp = store.read_table("term2", where={"atom1": [5, 7, 900], "term_index": 0})
+    assert list(tmp.index) == [900]
+
+    tmp = store.read_table("term2", where="(atom1 < 10) | (atom2 == 500)", columns=["atom2"])
+    assert list(tmp.columns) == ["atom2"]
+    assert df_compare(data.loc[list(range(10)) + [499], ["atom2"]], tmp)
+
+    # Row positions
+    tmp = store.read_table("term2", rows=[3, 4, 600, 601])
+    assert list(tmp.index) == [3, 4, 600, 601]
+
+    tmp = store.read_table("term2", rows=[3, 4, 600, 601], where="atom1 > 3")
+    assert list(tmp.index) == [4, 600, 601]
+
+    # Chunked reads
+    chunks = list(store.iter_table("term2", 300, where={"term_index": 1}))
+    assert [x.shape[0] for x in chunks] == [300, 33]
+    assert df_compare(data[data["term_index"] == 1], pd.concat(chunks))
+    assert len(list(store.read_table("term2", chunksize=400))) == 3
+
+    store.close()
+
+
+def test_hdf_store_buffer():
+    store = eex.filelayer.build_store("HDF5", "test_hdf_buffer", eex_find_files.get_scratch_directory(""), False,
+                                      complevel=5, complib="zlib", expectedrows=10000)
+
+    frags = [_build_table(110, 110 * x) for x in range(20)]
+    for frag in frags:
+        store.add_table("term2", frag)
+
+    # Appends are held until the table is read
+    assert store.list_tables() == ["term2"]
+    assert "/term2" not in store.store.keys()
+    assert df_compare(pd.concat(frags), store.read_table("term2"))
+    assert store.store.get_storer("term2").table.filters.complevel == 5
+
+    # Buffers are flushed once they exceed the buffer size
+    store.buffer_size = 0
+    store.add_table("term2", _build_table(5, 5000))
+    assert store.buffers == {}
+    assert store.store.get_storer("term2").nrows == 2205
+
+    store.close()
+
+
+def test_hdf_store_remove():
+    store = eex.filelayer.build_store("HDF5", "test_hdf_remove", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(1000)
+    store.add_table("term2", data)
+
+    # Random rows are removed in a single rewrite
+    np.random.seed(0)
+    index = np.random.choice(1000, 300, replace=False)
+    store.remove_table("term2", index)
+    comp = data.drop(index)
+    assert store.nrows["term2"] == 700
+    assert df_compare(comp, store.read_table("term2"))
+
+    # Queried columns are kept
+    tmp = store.read_table("term2", where={"term_index": 2})
+    assert df_compare(comp[comp["term_index"] == 2], tmp)
+
+    # Buffered rows can be removed
+    store.add_table("term2", _build_table(5, 2000))
+    store.remove_table("term2", [700, 704])
+    assert df_compare(pd.concat([comp, _build_table(5, 2000).iloc[1:4]]), store.read_table("term2"))
+
+    store.remove_table("term2", np.arange(703))
+    assert store.list_tables() == []
+
+    store.close()
+
+
+def test_hdf_store_cache():
+    store = eex.filelayer.build_store("HDF5", "test_hdf_cache", eex_find_files.get_scratch_directory(""), False)
+
+    data = _build_table(100)
+    store.add_table("term2", data)
+    store.add_table("term3", data)
+
+    assert df_compare(data, store.read_table("term2"))
+    assert df_compare(data, store.read_table("term2", copy=False))
+    assert (store.cache_hits, store.cache_misses) == (1, 1)
+
+    # Copies do not modify the cache
+    tmp = store.read_table("term2")
+    tmp["atom1"] = 5
+    assert df_compare(data, store.read_table("term2"))
+
+    # Filtered reads bypass the cache
+    store.read_table("term2", where={"term_index": 0})
+    assert (store.cache_hits, store.cache_misses) == (3, 1)
+
+    # Modifications invalidate
+    store.add_table("term2", _build_table(5, 100))
+    assert df_compare(_build_table(105), store.read_table("term2"))
+    store.remove_table("term2", [0])
+    assert df_compare(_build_table(105).iloc[1:], store.read_table("term2"))
+    assert store.cache_misses == 3
+
+    # Least recently used tables are evicted
+    store.cache_size = store.cache_bytes + 10
+    store.read_table("term3")
+    assert list(store.cache) == ["term3"]
+    assert store.cache_bytes == eex.filelayer._nbytes(store.cache["term3"])
+
+    store.close()
+
+
+def test_async_store():
+    base = eex.filelayer.build_store("Columnar", "test_async", eex_find_files.get_scratch_directory(""), False)
+    store = eex.filelayer.AsyncStore(base, maxsize=2)
+
+    # Appends are written in order
+    frags = [_build_table(10, 10 * x) for x in range(50)]
+    for frag in frags:
+        store.add_table("term2", frag)
+    assert df_compare(pd.concat(frags), store.read_table("term2"))
+
+    # Writer exceptions are raised by the next call
+    store.add_table("term2", pd.DataFrame({"atom1": [1]}))
+    with pytest.raises(KeyError):
+        store.flush()
+    assert store.read_table("term2").shape[0] == 500
+
+    # Attributes of the wrapped store
+    assert store.read_arrays("term2", ["atom1"])["atom1"].shape[0] == 500
+
+    store.stop()
+    with pytest.raises(RuntimeError):
+        store.add_table("term2", frags[0])
+    store.close()
+
+
+def test_async_store_chunks():
+    base = eex.filelayer.build_store("SQLite", "test_async_chunks", eex_find_files.get_scratch_directory(""), False)
+    store = eex.filelayer.AsyncStore(base, maxsize=2)
+
+    data = _build_table(500)
+    store.add_table("term2", data)
+
+    # The writer waits until the chunked read is closed
+    chunks = store.read_table("term2", chunksize=200)
+    first = next(chunks)
+    writer = threading.Thread(target=store.add_table, args=("term3", _build_table(5)))
+    writer.start()
+    writer.join()
+    assert "term3" not in base.list_tables()
+
+    # The reading thread can still read but not add
+    assert df_compare(data, store.read_table("term2"))
+    with pytest.raises(RuntimeError):
+        store.add_table("term3", _build_table(5))
+
+    assert df_compare(data, pd.concat([first] + list(chunks)))
+    assert df_compare(_build_table(5), store.read_table("term3"))
+
+    assert [x.shape[0] for x in store.iter_table("term2", 300)] == [300, 200]
+    store.close()
+
+    # Stores without chunked reads
+    base = eex.filelayer.build_store("Memory", "test_async_memory", eex_find_files.get_scratch_directory(""), False)
+    store = eex.filelayer.AsyncStore(base)
+    assert not hasattr(store, "iter_table")
+    store.close()
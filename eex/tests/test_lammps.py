@@ -92,6 +92,48 @@ def test_lammps_read_angles(spce_dl):
     assert np.allclose(np.unique(angles["term_index"]), [1])
 
 
+def test_lammps_read_sections():
+    fname = eex_find_files.get_example_filename("lammps", "SPCE", "data.spce")
+    sim_data = {
+        'units': 'real',
+        'bond_style': 'harmonic',
+        'angle_style': 'harmonic',
+        'atom_style': 'full'
+    }
+
+    index = eex.translators.lammps.build_section_index(fname)
+    assert [x["category"] for x in index] == [
+        "Masses", "Pair Coeffs", "Bond Coeffs", "Angle Coeffs", "Atoms", "Bonds", "Angles"
+    ]
+
+    with open(fname, "rb") as handle:
+        handle.seek(index[4]["start"])
+        assert handle.readline().strip() == b"Atoms"
+
+    # Blocked reads match a single read of each section
+    dl = eex.datalayer.DataLayer("test_lammps_sections", backend="memory")
+    eex.translators.lammps.read_lammps_data_file(dl, fname, sim_data)
+
+    dl_block = eex.datalayer.DataLayer("test_lammps_sections_block", backend="memory")
+    eex.translators.lammps.read_lammps_data_file(dl_block, fname, sim_data, blocksize=7)
+
+    assert eex.testing.dl_compare(dl, dl_block)
+    assert dl.list_atom_uids("mass") == [1, 2]
+
+    # Sections shorter than their header count are an error
+    short_name = eex_find_files.get_scratch_directory("test_lammps_sections.data")
+    with open(fname, "rb") as handle:
+        data = handle.read()
+    with open(short_name, "wb") as handle:
+        cut = data.index(b"\n", index[4]["offset"] + 100) + 1
+        handle.write(data[:cut] + data[index[5]["start"]:])
+
+    dl_short = eex.datalayer.DataLayer("test_lammps_sections_short", backend="memory")
+    with pytest.raises(IOError):
+        eex.translators.lammps.read_lammps_data_file(dl_short, short_name, sim_data)
+    os.unlink(short_name)
+
+
 @pytest.mark.parametrize("molecule", ["butane", "propane", "ethane"])
 def test_lammps_reader(molecule):
 
@@ -135,3 +177,185 @@ def test_lammps_writer(butane_dl):
 
     eex.translators.lammps.write_lammps_file(
         dl, oname, input_filename, unit_style="real")
+
+    with open(oname, "r") as handle:
+        data = handle.read()
+
+    # Streamed tables are written identically
+    eex.translators.lammps.write_lammps_file(
+        dl, oname, input_filename, unit_style="real", blocksize=3)
+
+    with open(oname, "r") as handle:
+        assert handle.read() == data
+
+    # Charges, coordinates and parameters follow the precision
+    eex.translators.lammps.write_lammps_file(
+        dl, oname, input_filename, unit_style="real", precision=3)
+
+    with open(oname, "r") as handle:
+        lines = handle.read().splitlines()
+
+    atom_line = lines[lines.index(" Atoms") + 2].split()
+    assert atom_line[3:] == ["0.000", "0.000", "-0.460", "-1.530"]
+
+
+def _write_lammps_dump(fname, frames, columns, bounds, box_flags="pp pp pp"):
+    with open(fname, "w") as handle:
+        for num, frame in enumerate(frames):
+            handle.write("ITEM: TIMESTEP\n%d\n" % (num * 100))
+            handle.write("ITEM: NUMBER OF ATOMS\n%d\n" % len(frame))
+            handle.write("ITEM: BOX BOUNDS %s\n" % box_flags)
+            for line in bounds:
+                handle.write(" ".join("%.10f" % x for x in line) + "\n")
+            handle.write("ITEM: ATOMS %s\n" % " ".join(columns))
+            for row in frame:
+                handle.write(" ".join(str(x) for x in row) + "\n")
+
+
+def test_lammps_dump():
+    fname = eex_find_files.get_example_filename("lammps", "SPCE", "data.spce")
+    sim_data = {
+        'units': 'real',
+        'bond_style': 'harmonic',
+        'angle_style': 'harmonic',
+        'atom_style': 'full'
+    }
+    dl = eex.datalayer.DataLayer("test_lammps_dump", backend="memory")
+    eex.translators.lammps.read_lammps_data_file(dl, fname, sim_data)
+
+    atoms = dl.get_atoms(["atom_type", "xyz"], by_value=True)
+    xyz = atoms[["X", "Y", "Z"]].values
+    energy = dl.evaluate()
+
+    # Atoms are dumped out of order
+    order = np.random.RandomState(0).permutation(xyz.shape[0])
+    frames = []
+    for num in range(4):
+        frame_xyz = xyz * (1.0 + 0.01 * num)
+        frames.append([(idx, atoms["atom_type"].iloc[idx - 1]) + tuple(frame_xyz[idx - 1])
+                       for idx in atoms.index[order]])
+
+    bounds = [[-12.362, 12.362], [-12.358, 12.358], [-12.361, 12.361]]
+    oname = eex_find_files.get_scratch_directory("test_lammps_dump.lammpstrj")
+    _write_lammps_dump(oname, frames, ["id", "type", "x", "y", "z"], bounds)
+
+    index = eex.translators.lammps.build_dump_index(oname, cache=True)
+    assert list(index["timesteps"]) == [0, 100, 200, 300]
+    assert list(index["natoms"]) == [600] * 4
+    assert os.path.exists(oname + ".eexindex")
+
+    cached = eex.translators.lammps.build_dump_index(oname, cache=True)
+    assert all(np.array_equal(index[k], cached[k]) for k in index)
+
+    # Random access and strides
+    read = list(eex.translators.lammps.read_lammps_dump(oname, start=2, stop=3, index=cached))
+    assert len(read) == 1
+    assert read[0]["timestep"] == 200
+    assert list(read[0]["atoms"].index) == list(atoms.index)
+    assert np.allclose(read[0]["xyz"], xyz * 1.02)
+
+    read = list(eex.translators.lammps.read_lammps_dump(oname, step=-2, utype={"length": "nanometer"}))
+    assert [x["frame"] for x in read] == [3, 1]
+    assert np.allclose(read[0]["xyz"], xyz * 0.103)
+    assert np.allclose(read[0]["box"]["a"], 2.4724)
+    assert np.allclose(read[0]["box"]["gamma"], 90.0)
+
+    # Frames are set in the DataLayer
+    energies = [dl.evaluate() for frame in eex.translators.lammps.read_lammps_dump(oname, stop=2, dl=dl)]
+    assert np.allclose(energies[0]["total"], energy["total"])
+    assert not np.allclose(energies[1]["total"], energy["total"])
+    assert np.allclose(dl.get_atoms("xyz").values, xyz * 1.01)
+
+    with pytest.raises(ValueError):
+        list(eex.translators.lammps.read_lammps_dump(oname, step=0))
+
+    with pytest.raises(KeyError):
+        list(eex.translators.lammps.read_lammps_dump(oname, unit_style="lj"))
+
+    os.unlink(oname)
+    os.unlink(oname + ".eexindex")
+
+
+def test_lammps_dump_triclinic():
+
+    # Scaled coordinates in a tilted box, with a non-numeric column
+    xy, xz, yz = 1.0, -0.5, 0.25
+    lo = np.array([-2.0, -3.0, -4.0])
+    lengths = np.array([10.0, 12.0, 14.0])
+    h = np.array([[lengths[0], 0.0, 0.0], [xy, lengths[1], 0.0], [xz, yz, lengths[2]]])
+
+    fractional = np.array([[0.1, 0.2, 0.3], [0.5, 0.5, 0.5], [0.9, 0.1, 0.7]])
+    ref_xyz = lo + np.dot(fractional, h)
+
+    frame = [(3 - num, "C") + tuple(fractional[2 - num]) for num in range(3)]
+
+    hi = lo + lengths
+    bounds = [
+        [lo[0] + min(0.0, xy, xz, xy + xz), hi[0] + max(0.0, xy, xz, xy + xz), xy],
+        [lo[1] + min(0.0, yz), hi[1] + max(0.0, yz), xz],
+        [lo[2], hi[2], yz],
+    ]
+
+    oname = eex_find_files.get_scratch_directory("test_lammps_dump_triclinic.lammpstrj")
+    _write_lammps_dump(oname, [frame], ["id", "element", "xs", "ys", "zs"], bounds, box_flags="xy xz yz pp pp pp")
+
+    read = list(eex.translators.lammps.read_lammps_dump(oname))
+    assert len(read) == 1
+    assert list(read[0]["atoms"]["element"]) == ["C", "C", "C"]
+    assert np.allclose(read[0]["xyz"], ref_xyz)
+
+    ref_box = eex.translators.lammps.lammps_utility.compute_lattice_constants({
+        "x": 10.0,
+        "y": 12.0,
+        "z": 14.0
+    }, {
+        "xy": xy,
+        "xz": xz,
+        "yz": yz
+    })
+    assert np.allclose(read[0]["box"]["c"], ref_box["c"])
+    assert np.allclose(read[0]["box"]["beta"], np.degrees(ref_box["beta"]))
+
+    os.unlink(oname)
+
+
+def test_lammps_dump_unwrapped():
+
+    # Atoms that crossed the faces of a tilted box
+    xy, xz, yz = 1.0, -0.5, 0.25
+    lo = np.array([-2.0, -3.0, -4.0])
+    lengths = np.array([10.0, 12.0, 14.0])
+    h = np.array([[lengths[0], 0.0, 0.0], [xy, lengths[1], 0.0], [xz, yz, lengths[2]]])
+
+    fractional = np.array([[0.1, 0.2, 0.3], [0.5, 0.5, 0.5], [0.9, 0.1, 0.7]])
+    images = np.array([[1, 0, -1], [0, 0, 0], [-2, 3, 1]])
+    wrapped = lo + np.dot(fractional, h)
+    ref_xyz = wrapped + np.dot(images, h)
+
+    hi = lo + lengths
+    bounds = [
+        [lo[0] + min(0.0, xy, xz, xy + xz), hi[0] + max(0.0, xy, xz, xy + xz), xy],
+        [lo[1] + min(0.0, yz), hi[1] + max(0.0, yz), xz],
+        [lo[2], hi[2], yz],
+    ]
+
+    oname = eex_find_files.get_scratch_directory("test_lammps_dump_unwrapped.lammpstrj")
+    for columns, values in [
+        (["xu", "yu", "zu"], ref_xyz),
+        (["x", "y", "z", "ix", "iy", "iz"], np.hstack((wrapped, images))),
+        (["xs", "ys", "zs", "ix", "iy", "iz"], np.hstack((fractional, images))),
+        (["x", "y", "z", "xu", "yu", "zu"], np.hstack((wrapped, ref_xyz))),
+    ]:
+        frame = [(num + 1, ) + tuple(row) for num, row in enumerate(values)]
+        _write_lammps_dump(oname, [frame], ["id"] + columns, bounds, box_flags="xy xz yz pp pp pp")
+
+        read = list(eex.translators.lammps.read_lammps_dump(oname))
+        assert np.allclose(read[0]["xyz"], ref_xyz)
+
+    # Without image flags wrapped coordinates are returned as dumped
+    frame = [(num + 1, ) + tuple(row) for num, row in enumerate(wrapped)]
+    _write_lammps_dump(oname, [frame], ["id", "x", "y", "z"], bounds, box_flags="xy xz yz pp pp pp")
+    read = list(eex.translators.lammps.read_lammps_dump(oname))
+    assert np.allclose(read[0]["xyz"], wrapped)
+
+    os.unlink(oname)
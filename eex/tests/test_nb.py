@@ -69,3 +69,74 @@ def test_LJ_mixing(mixing_rule):
         final='epsilon/sigma')
 
     assert (eex.testing.dict_compare(new_coeffs, mixed_coeffs[mixing_rule]))
+
+
+@pytest.mark.parametrize("form", ["epsilon/sigma", "epsilon/Rmin", "AB"])
+def test_convert_LJ_arrays(form):
+
+    coeffs = {"A": np.array([2.0, 0.0, 5.0]), "B": np.array([4.0, 0.0, 1.0])}
+    new_coeffs = eex.nb_converter.convert_LJ_arrays(coeffs, "AB", form)
+
+    for num in range(3):
+        single = {k: v[num] for k, v in coeffs.items()}
+        if num == 1:
+            assert all(v[num] == 0.0 for v in new_coeffs.values())
+            continue
+
+        comp = eex.nb_converter.convert_LJ_coeffs(single, "AB", form)
+        for k, v in comp.items():
+            assert np.isclose(new_coeffs[k][num], v)
+
+    back = eex.nb_converter.convert_LJ_arrays(new_coeffs, form, "AB")
+    assert np.allclose(back["A"], coeffs["A"])
+    assert np.allclose(back["B"], coeffs["B"])
+
+    with pytest.raises(ZeroDivisionError):
+        eex.nb_converter.convert_LJ_arrays({"A": [3.48, 1.0], "B": [0.0, 1.0]}, "AB", "epsilon/sigma")
+
+
+@pytest.mark.parametrize("mixing_rule",
+                         ["lorentz_berthelot", "arithmetic", "geometric", "sixthpower"])
+def test_LJ_mixing_table(mixing_rule):
+    coeffs = {'epsilon': np.array([1.0, 2.0, 0.5]), 'sigma': np.array([1.0, 2.0, 3.0])}
+
+    table = eex.nb_converter.mix_LJ_table(
+        coeffs, mixing_rule, origin="epsilon/sigma", final="epsilon/sigma")
+
+    for i in range(3):
+        for j in range(3):
+            coeff_i = {k: v[i] for k, v in coeffs.items()}
+            coeff_j = {k: v[j] for k, v in coeffs.items()}
+            comp = eex.nb_converter.mix_LJ(
+                coeff_i, coeff_j, mixing_rule, origin="epsilon/sigma", final="epsilon/sigma")
+            for k, v in comp.items():
+                assert np.isclose(table[k][i, j], v)
+
+    with pytest.raises(ValueError):
+        eex.nb_converter.mix_LJ_table(coeffs, "turtle", origin="epsilon/sigma")
+
+
+@pytest.mark.parametrize("mixing_rule",
+                         ["lorentz_berthelot", "arithmetic", "geometric", "sixthpower"])
+def test_LJ_mixing_table_zero(mixing_rule):
+
+    # Hydrogens without LJ parameters, given as A/B or epsilon/sigma
+    coeffs = {'A': np.array([1.e6, 0.0, 2.e5]), 'B': np.array([1.e3, 0.0, 5.e2])}
+    with np.errstate(divide="raise", invalid="raise"):
+        table = eex.nb_converter.mix_LJ_table(coeffs, mixing_rule, origin="AB", final="AB")
+
+    assert np.all(np.isfinite(table["A"])) and np.all(np.isfinite(table["B"]))
+    assert np.all(table["A"][1] == 0.0) and np.all(table["A"][:, 1] == 0.0)
+    assert np.all(table["B"][1] == 0.0) and np.all(table["B"][:, 1] == 0.0)
+
+    coeffs = {'epsilon': np.array([1.0, 0.0, 0.5]), 'sigma': np.array([1.0, 0.4, 3.0])}
+    table = eex.nb_converter.mix_LJ_table(coeffs, mixing_rule, origin="epsilon/sigma", final="epsilon/sigma")
+    assert np.all(table["epsilon"][1] == 0.0) and np.all(table["sigma"][:, 1] == 0.0)
+
+    # Other pairs are unchanged
+    for i, j in [(0, 0), (0, 2), (2, 2)]:
+        coeff_i = {k: v[i] for k, v in coeffs.items()}
+        coeff_j = {k: v[j] for k, v in coeffs.items()}
+        comp = eex.nb_converter.mix_LJ(coeff_i, coeff_j, mixing_rule, origin="epsilon/sigma", final="epsilon/sigma")
+        for k, v in comp.items():
+            assert np.isclose(table[k][i, j], v)
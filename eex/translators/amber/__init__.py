@@ -1,3 +1,5 @@
-from .amber_read import read_amber_file
+from .amber_read import read_amber_file, read_amber_section, build_section_index
+from .amber_netcdf import read_amber_netcdf
+from .amber_ascii import read_amber_restart, read_amber_mdcrd, build_mdcrd_index
 from .amber_write import write_amber_file
 from .amber_utility import get_energies
@@ -0,0 +1,341 @@
+"""
+AMBER ASCII coordinate readers, inpcrd/rst7 restarts and mdcrd trajectories
+"""
+
+import math
+import mmap
+import os
+import numpy as np
+
+import eex
+
+from .amber_utility import _box_keys, _frame_slice, _frame_utype, _set_frame
+
+# Restarts are written as 6F12.7, trajectories as 10F8.3 with an optional 3F8.3 box line per frame
+_restart_format = (6, float, 12)
+_mdcrd_format = (10, float, 8)
+
+# Restart velocities are in angstrom per 1/20.455 picoseconds
+_velocity_scale = 20.455
+
+# Bytes scanned at once while building a trajectory index
+_INDEX_CHUNK = 64 * 1024 * 1024
+
+
+def _decode_section(data, data_type):
+    """
+    Decodes fixed-width data lines, such as a prmtop section, in one pass.
+
+    Parameters
+    ----------
+    data : bytes
+        The data lines
+    data_type : list
+        The parsed %FORMAT of the lines, see `amber_metadata.parse_format`
+
+    Returns
+    -------
+    values : np.ndarray
+        The 1D array of values
+    """
+
+    ncols, dtype, width = data_type[:3]
+
+    # Join the lines into a single fixed-width buffer, only the last line may be short
+    lines = data.splitlines()
+    line_width = ncols * width
+    if any(len(line) != line_width for line in lines[:-1]):
+        lines = [line.ljust(line_width) for line in lines[:-1]] + lines[-1:]
+    buf = b"".join(lines)
+
+    if dtype == str:
+        nvalues = int(math.ceil(len(buf) / float(width)))
+        buf = buf.ljust(nvalues * width)
+        values = np.frombuffer(buf, dtype="S%d" % width)
+        return np.char.strip(np.char.decode(values, "ascii"))
+
+    np_dtype = np.int64 if dtype == int else np.float64
+
+    # Numeric fields are right aligned
+    buf = buf.rstrip()
+    if len(buf) == 0:
+        return np.zeros(0, dtype=np_dtype)
+
+    nvalues = int(math.ceil(len(buf) / float(width)))
+    buf = buf.rjust(nvalues * width)
+
+    # Whitespace separated fields can use the fast tokenizer, full width fields are sliced
+    fields = np.frombuffer(buf, dtype=np.uint8).reshape(nvalues, width)
+    if np.all(fields[:, 0] == ord(" ")):
+        values = np.fromstring(buf, dtype=np_dtype, sep=" ")
+        if values.shape[0] == nvalues:
+            return values
+
+    return np.frombuffer(buf, dtype="S%d" % width).astype(np_dtype)
+
+
+def _unit_factors(utype):
+    """
+    Conversion factors from the units of the ASCII formats.
+    """
+
+    return {
+        "length": eex.units.conversion_factor("angstrom", utype["length"]),
+        "angle": eex.units.conversion_factor("degree", utype["angle"]),
+        "time": eex.units.conversion_factor("picosecond", utype["time"]),
+    }
+
+
+def read_amber_restart(filename, utype=None, dl=None):
+    """
+    Reads an AMBER ASCII restart (.inpcrd, .rst7) with optional velocities and box.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the restart file
+    utype : dict, optional
+        The units of the returned data as a dictionary with optional "length", "angle" and "time" keys, defaults to
+        angstrom, degree and picosecond. Velocities are returned in length / time.
+    dl : eex.DataLayer, optional
+        If given the coordinates and box size are set in the DataLayer.
+
+    Returns
+    -------
+    frame : dict
+        Dictionary of the form {"title": str, "time": float or None, "xyz": (natoms, 3) array,
+        "velocities": (natoms, 3) array or None, "box": {"a", "b", "c", "alpha", "beta", "gamma"} or None}
+    """
+
+    utype = _frame_utype(utype)
+    factors = _unit_factors(utype)
+
+    with open(filename, "rb") as handle:
+        lines = handle.read().splitlines()
+
+    if len(lines) < 2:
+        raise ValueError("AMBER Read: Restart file '%s' is missing its header." % filename)
+
+    header = lines[1].split()
+    natoms = int(header[0])
+    nlines = int(math.ceil(3 * natoms / 6.0))
+
+    # Coordinates, velocities and the box are each written on their own lines
+    body = [x for x in lines[2:] if x.strip()]
+    if len(body) not in [nlines, nlines + 1, 2 * nlines, 2 * nlines + 1]:
+        raise ValueError("AMBER Read: Restart file '%s' has %d data lines, expected coordinates for %d atoms." %
+                         (filename, len(body), natoms))
+
+    ret = {"title": lines[0].decode("ascii").strip(), "time": None, "velocities": None, "box": None}
+    if len(header) > 1:
+        ret["time"] = float(header[1]) * factors["time"]
+
+    if nlines > 1:
+        has_velocities = len(body) >= 2 * nlines
+        has_box = (len(body) % nlines) == 1
+    else:
+        # A lone second line is a box unless it holds the three velocities of a single atom
+        has_box = (len(body) == 3) or ((len(body) == 2) and (len(body[1].rstrip()) > 3 * _restart_format[2]))
+        has_velocities = (len(body) == 3) or ((len(body) == 2) and not has_box)
+
+    xyz = _decode_section(b"\n".join(body[:nlines]), _restart_format)
+    ret["xyz"] = xyz.reshape(natoms, 3) * factors["length"]
+
+    if has_velocities:
+        velocities = _decode_section(b"\n".join(body[nlines:2 * nlines]), _restart_format)
+        ret["velocities"] = velocities.reshape(natoms, 3) * (_velocity_scale * factors["length"] / factors["time"])
+
+    if has_box:
+        box = _decode_section(body[-1], _restart_format)
+        if box.shape[0] < 6:
+            raise ValueError("AMBER Read: Could not understand the box line of restart file '%s'." % filename)
+
+        ret["box"] = {}
+        for key, value in zip(_box_keys[0], box[:3]):
+            ret["box"][key] = float(value) * factors["length"]
+        for key, value in zip(_box_keys[1], box[3:6]):
+            ret["box"][key] = float(value) * factors["angle"]
+
+    if dl is not None:
+        _set_frame(dl, ret, utype)
+
+    return ret
+
+
+def build_mdcrd_index(filename, natoms, box=None):
+    """
+    Scans an AMBER ASCII trajectory (.mdcrd, .crd) once for the byte offset of every frame.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the trajectory file
+    natoms : int
+        The number of atoms in each frame
+    box : bool, optional
+        If each frame ends with a box line, otherwise detected from the file.
+
+    Returns
+    -------
+    index : dict
+        Dictionary of the form {"natoms": int, "box": bool, "offsets": np.ndarray} where offsets holds the start of
+        every frame followed by the end of the last frame.
+    """
+
+    natoms = int(natoms)
+    if natoms < 1:
+        raise ValueError("AMBER Read: The number of atoms must be positive.")
+
+    nlines = int(math.ceil(3 * natoms / 10.0))
+    size = os.path.getsize(filename)
+    if size == 0:
+        raise ValueError("AMBER Read: Trajectory file '%s' is empty." % filename)
+
+    with open(filename, "rb") as handle:
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # The title line
+            start = data.find(b"\n") + 1
+            if start == 0:
+                raise ValueError("AMBER Read: Trajectory file '%s' does not contain any frames." % filename)
+
+            # Newline positions, in chunks to bound the memory footprint
+            newlines = []
+            for pos in range(start, size, _INDEX_CHUNK):
+                chunk = np.frombuffer(data[pos:pos + _INDEX_CHUNK], dtype=np.uint8)
+                newlines.append(np.flatnonzero(chunk == ord("\n")) + pos)
+            newlines = np.concatenate(newlines) if newlines else np.zeros(0, dtype=np.int64)
+
+            # A file without a trailing newline ends in a partial line
+            if (size > start) and (data[size - 1:size] != b"\n"):
+                newlines = np.append(newlines, size)
+
+            line_starts = np.concatenate([[start], newlines + 1])[:newlines.shape[0]]
+            line_ends = newlines
+
+            # Drop blank trailing lines
+            line_lengths = line_ends - line_starts
+            nonblank = np.flatnonzero(line_lengths > 0)
+            nfile_lines = (nonblank[-1] + 1) if nonblank.shape[0] else 0
+
+            # The last coordinate line of a frame holds the remainder of the 3 * natoms values
+            if nfile_lines >= nlines:
+                last_line = data[line_starts[nlines - 1]:line_ends[nlines - 1]].rstrip()
+                nlast = (3 * natoms) % _mdcrd_format[0] or _mdcrd_format[0]
+                if len(last_line) != nlast * _mdcrd_format[2]:
+                    raise ValueError("AMBER Read: The first frame of trajectory file '%s' does not match %d atoms." %
+                                     (filename, natoms))
+
+            if box is None:
+                box = _detect_mdcrd_box(data, line_starts, line_ends, nfile_lines, nlines, natoms)
+
+        finally:
+            data.close()
+
+    frame_lines = nlines + int(box)
+    if (nfile_lines == 0) or (nfile_lines % frame_lines):
+        raise ValueError("AMBER Read: Trajectory file '%s' has %d lines which is not a multiple of the %d lines of a "
+                         "frame of %d atoms." % (filename, nfile_lines, frame_lines, natoms))
+
+    offsets = np.append(line_starts[:nfile_lines:frame_lines], line_ends[nfile_lines - 1] + 1)
+
+    return {"natoms": natoms, "box": bool(box), "offsets": offsets.astype(np.int64)}
+
+
+def _detect_mdcrd_box(data, line_starts, line_ends, nfile_lines, nlines, natoms):
+    """
+    Box lines hold three values while a following frame starts with a line of min(10, 3 * natoms) values.
+    """
+
+    with_box = (nfile_lines % (nlines + 1)) == 0
+    without_box = (nfile_lines % nlines) == 0
+    if with_box != without_box:
+        return with_box
+
+    if nfile_lines <= nlines:
+        return False
+
+    line = data[line_starts[nlines]:line_ends[nlines]].rstrip()
+    return (len(line) <= 3 * _mdcrd_format[2]) and (natoms > 1)
+
+
+def _decode_mdcrd_frame(data, natoms, box):
+    """
+    Decodes the raw lines of a single trajectory frame.
+    """
+
+    nvalues = 3 * natoms + 3 * int(box)
+
+    # Full width lines form a single fixed-width record of the whole frame
+    buf = data.replace(b"\r", b"").replace(b"\n", b"")
+    if len(buf) == nvalues * _mdcrd_format[2]:
+        values = np.frombuffer(buf, dtype="S%d" % _mdcrd_format[2]).astype(np.float64)
+    else:
+        lines = data.splitlines()
+        nlines = int(math.ceil(3 * natoms / 10.0))
+        values = _decode_section(b"\n".join(lines[:nlines]), _mdcrd_format)
+        if box:
+            values = np.concatenate([values, _decode_section(lines[nlines], _mdcrd_format)])
+
+    if values.shape[0] != nvalues:
+        raise ValueError("AMBER Read: Expected %d values in a trajectory frame, found %d." %
+                         (nvalues, values.shape[0]))
+
+    return values
+
+
+def read_amber_mdcrd(filename, natoms, start=None, stop=None, step=None, utype=None, dl=None, index=None):
+    """
+    Lazily reads the frames of an AMBER ASCII trajectory (.mdcrd, .crd).
+
+    Only the selected frames are decoded, each through a single fixed-width buffer.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the trajectory file
+    natoms : int
+        The number of atoms in each frame
+    start, stop, step : int, optional
+        The frames to read, following Python slice semantics.
+    utype : dict, optional
+        The units of the returned frames as a dictionary with optional "length" and "angle" keys, defaults to
+        angstrom and degree.
+    dl : eex.DataLayer, optional
+        If given the coordinates and box size of each frame are set in the DataLayer before the frame is yielded, so
+        that `dl.evaluate()` evaluates the current frame.
+    index : dict, optional
+        The frame index of the file, otherwise built with `build_mdcrd_index`.
+
+    Yields
+    ------
+    frame : dict
+        Dictionary of the form {"frame": frame number, "time": None, "xyz": (natoms, 3) array,
+        "box": {"a", "b", "c"} or None}
+    """
+
+    utype = _frame_utype(utype)
+    factors = _unit_factors(utype)
+
+    if index is None:
+        index = build_mdcrd_index(filename, natoms)
+    elif index["natoms"] != natoms:
+        raise ValueError("AMBER Read: The index was built for %d atoms, not %d." % (index["natoms"], natoms))
+
+    offsets = index["offsets"]
+    nframes = offsets.shape[0] - 1
+
+    with open(filename, "rb") as handle:
+        for num in _frame_slice(nframes, start, stop, step):
+            handle.seek(offsets[num])
+            values = _decode_mdcrd_frame(handle.read(offsets[num + 1] - offsets[num]), natoms, index["box"])
+
+            frame = {"frame": num, "time": None, "box": None}
+            frame["xyz"] = values[:3 * natoms].reshape(natoms, 3) * factors["length"]
+            if index["box"]:
+                frame["box"] = {k: float(v) * factors["length"] for k, v in zip(_box_keys[0], values[3 * natoms:])}
+
+            if dl is not None:
+                _set_frame(dl, frame, utype)
+
+            yield frame
@@ -252,7 +252,8 @@ def build_format(fmt):
     elif fmt[1] == float:
         fmt = " % " + str(fmt[2] - 1) + "." + str(fmt[4]) + "E"
     elif fmt[1] == int:
-        fmt = " % " + str(fmt[2] - 1) + "d"
+        # Fills the whole field so that counts of a million or more still fit
+        fmt = "%" + str(fmt[2]) + "d"
     else:
         raise TypeError("Type (%s) not recognized" % type(fmt[1]))
     return fmt
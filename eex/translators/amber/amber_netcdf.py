@@ -0,0 +1,125 @@
+"""
+AMBER NetCDF trajectory and restart readers
+"""
+
+import numpy as np
+
+import eex
+from .amber_utility import _box_keys, _frame_slice, _frame_utype, _set_frame
+
+# Units of the AMBER NetCDF conventions, used when a variable does not carry a units attribute
+_netcdf_units = {
+    "coordinates": "angstrom",
+    "cell_lengths": "angstrom",
+    "cell_angles": "degree",
+    "time": "picosecond",
+}
+
+
+def _variable_factor(variable, name, to_unit):
+    """
+    Returns the conversion factor from the units of a NetCDF variable.
+    """
+
+    from_unit = getattr(variable, "units", _netcdf_units[name])
+    if isinstance(from_unit, bytes):
+        from_unit = from_unit.decode("ascii")
+
+    return eex.units.conversion_factor(from_unit.strip(), to_unit)
+
+
+def read_amber_netcdf(filename, start=None, stop=None, step=None, utype=None, dl=None):
+    """
+    Lazily reads the frames of an AMBER NetCDF trajectory (.nc) or restart (.ncrst).
+
+    The file is memory mapped and only a single frame is held in memory at a time.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the NetCDF file
+    start, stop, step : int, optional
+        The frames to read, following Python slice semantics. A restart holds a single frame.
+    utype : dict, optional
+        The units of the returned frames as a dictionary with optional "length", "angle" and "time" keys, defaults to
+        angstrom, degree and picosecond.
+    dl : eex.DataLayer, optional
+        If given the coordinates and box size of each frame are set in the DataLayer before the frame is yielded, so
+        that `dl.evaluate()` evaluates the current frame.
+
+    Yields
+    ------
+    frame : dict
+        Dictionary of the form {"frame": frame number, "time": float or None, "xyz": (natoms, 3) array,
+        "box": {"a", "b", "c", "alpha", "beta", "gamma"} or None}
+
+    Example
+    -------
+    dl = eex.datalayer.DataLayer("trajectory")
+    eex.translators.amber.read_amber_file(dl, "system.prmtop")
+
+    energies = [dl.evaluate() for frame in read_amber_netcdf("system.nc", step=10, dl=dl)]
+    """
+
+    # SciPy is only required to read NetCDF files
+    import scipy.io
+
+    utype = _frame_utype(utype)
+
+    handle = scipy.io.netcdf_file(filename, "r", mmap=True)
+    try:
+        variables = handle.variables
+        if "coordinates" not in variables:
+            raise KeyError("AMBER NetCDF: Did not find coordinates in '%s'." % filename)
+
+        # Restarts do not have a frame dimension
+        coordinates = variables["coordinates"]
+        is_restart = len(coordinates.shape) == 2
+        nframes = 1 if is_restart else coordinates.shape[0]
+
+        xyz_factor = _variable_factor(coordinates, "coordinates", utype["length"])
+
+        has_box = ("cell_lengths" in variables) and ("cell_angles" in variables)
+        if has_box:
+            length_factor = _variable_factor(variables["cell_lengths"], "cell_lengths", utype["length"])
+            angle_factor = _variable_factor(variables["cell_angles"], "cell_angles", utype["angle"])
+
+        has_time = "time" in variables
+        if has_time:
+            time_factor = _variable_factor(variables["time"], "time", utype["time"])
+
+        for num in _frame_slice(nframes, start, stop, step):
+            if is_restart:
+                frame = {"frame": num, "xyz": coordinates.data.astype(np.float64)}
+            else:
+                frame = {"frame": num, "xyz": coordinates.data[num].astype(np.float64)}
+            frame["xyz"] *= xyz_factor
+
+            frame["time"] = None
+            if has_time:
+                time = variables["time"].data
+                frame["time"] = float(time if is_restart else time[num]) * time_factor
+
+            frame["box"] = None
+            if has_box:
+                lengths = variables["cell_lengths"].data
+                angles = variables["cell_angles"].data
+                if not is_restart:
+                    lengths = lengths[num]
+                    angles = angles[num]
+
+                frame["box"] = {}
+                for key, value in zip(_box_keys[0], lengths):
+                    frame["box"][key] = float(value) * length_factor
+                for key, value in zip(_box_keys[1], angles):
+                    frame["box"][key] = float(value) * angle_factor
+
+            if dl is not None:
+                _set_frame(dl, frame, utype)
+
+            yield frame
+
+    finally:
+        # Release the references to the memory map before closing
+        variables = coordinates = lengths = angles = time = None
+        handle.close()
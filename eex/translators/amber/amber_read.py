@@ -3,345 +3,243 @@ AMBER EEX I/O
 """
 
 import pandas as pd
-import math
+import functools
+import json
+import mmap
+import multiprocessing
+import multiprocessing.pool
+import os
+import re
 import numpy as np
 
-# Python 2/3 compat
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
-
 import eex
 import logging
 
 # AMBER local imports
 from . import amber_metadata as amd
+from .amber_ascii import _decode_section, read_amber_restart
 
 logger = logging.getLogger(__name__)
 
+# Section index cache written next to the prmtop
+_INDEX_VERSION = 1
+_INDEX_SUFFIX = ".eexindex"
 
-def _data_flatten(data, column_name, category_index, df_index_name):
-    # Reorganize the data 2D -> 1D packing
-    flat_data = data.values.flatten()
-    index = np.arange(category_index, flat_data.shape[0] + category_index)
-    dl_col_name = column_name
-
-    # Build and curate the data
-    df = pd.DataFrame({df_index_name: index, dl_col_name: flat_data})
-    df.dropna(axis=0, how="any", inplace=True)
-    df.set_index(df_index_name, inplace=True)
-    return df
+_FLAG_REGEX = re.compile(br"^%FLAG[ \t]+(\S+)[^\n]*\n", re.MULTILINE)
 
 
-def read_amber_file(dl, filename, inpcrd=None, blocksize=5000):
+def build_section_index(filename, cache=False):
     """
+    Scans a prmtop file for the byte offset, size and format of every %FLAG section.
 
     Parameters
     ----------
-    dl : eex.DataLayer
-        The datalayer to add data to
     filename : str
         The name of the prmtop file
-    inpcrd : str, optional
-        If None, attempts to read the file filename.replace("prmtop", "inpcrd") otherwise passes.
-
-
+    cache : bool, optional
+        If True the index is read from and written to filename + ".eexindex", the cache is rebuilt when the size or
+        modification time of the prmtop changes.
+
+    Returns
+    -------
+    index : list
+        A list of {"category", "offset", "size", "format"} in file order, where offset and size are the location in
+        bytes of the data lines of the section.
     """
-    # First we need to figure out system dimensions
-    max_rows = 100  # How many lines do we attempt to search?
-    header_data = eex.utility.read_lines(filename, max_rows)
 
-    sizes_dict = {}
-    ret_data = {}
-    found_sizes = False
-    found_version = False
-    for num, line in enumerate(header_data):
+    stat = os.stat(filename)
+    cache_filename = filename + _INDEX_SUFFIX
 
-        # First try to figure out the version
-        if "VERSION" in line:
-            sline = line.strip().split()
-            if "VERSION_STAMP" == sline[1]:
-                ret_data["VERSION"] = sline[3]
-                if ret_data["VERSION"] != "V0001.000":
-                    raise ValueError(
-                        "AMBER Read: Did not recognize version '%s'." %
-                        ret_data["VERSION"])
-                found_version = True
-            else:
-                raise ValueError(
-                    "AMBER Read: Could not understand version line.")
-
-        # Get size_information - read in "FLAG POINTERS"
-        elif "FLAG POINTERS" in line:
-            ncols, dtype, width = amd.parse_format(header_data[num + 1])
-
-            parsed_sizes = []
-            for shift in range(4):
-                dline = header_data[num + 2 + shift]
-                # Make sure the leading white space is not being cut off each line
-                if shift < 3:
-                    dline = dline.rjust(80)
-                dline = [
-                    dtype(dline[i:(i + width)])
-                    for i in range(0, len(dline), width)
-                ]
-                parsed_sizes.extend(dline)
-
-            if len(parsed_sizes) != len(amd.size_keys):
-                raise IndexError(
-                    "AMBER Read: The size of the FLAG POINTERS does not match the FLAG NAMES."
-                )
+    if cache and os.path.exists(cache_filename):
+        try:
+            with open(cache_filename, "r") as handle:
+                cached = json.load(handle)
+            if (cached["version"] == _INDEX_VERSION) and (cached["size"] == stat.st_size) and (
+                    cached["mtime"] == stat.st_mtime):
+                return cached["sections"]
+        except (ValueError, KeyError, OSError, IOError):
+            pass
+
+    index = []
+    if stat.st_size:
+        with open(filename, "rb") as handle:
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                flags = list(_FLAG_REGEX.finditer(data))
+                for num, match in enumerate(flags):
+                    end = flags[num + 1].start() if (num + 1) < len(flags) else len(data)
+
+                    # Skip the %FORMAT and %COMMENT lines
+                    data_type = None
+                    pos = match.end()
+                    while (pos < end) and (data[pos:pos + 1] == b"%"):
+                        line_end = data.find(b"\n", pos, end)
+                        line_end = end if line_end == -1 else line_end + 1
+                        line = data[pos:line_end].strip().decode("ascii")
+                        if line.startswith("%FORMAT"):
+                            data_type = line
+                        pos = line_end
+
+                    index.append({
+                        "category": match.group(1).decode("ascii"),
+                        "offset": pos,
+                        "size": end - pos,
+                        "format": data_type
+                    })
+            finally:
+                data.close()
 
-            for k, v in zip(amd.size_keys, parsed_sizes):
-                sizes_dict[k] = v
+    if cache:
+        cached = {"version": _INDEX_VERSION, "size": stat.st_size, "mtime": stat.st_mtime, "sections": index}
+        try:
+            with open(cache_filename, "w") as handle:
+                json.dump(cached, handle)
+        except (OSError, IOError):
+            logger.debug("AMBER Read: Could not write the section index cache '%s'." % cache_filename)
 
-            found_sizes = True
+    return index
 
-    if not found_sizes:
-        raise KeyError("AMBER Read: Did not find FLAG POINTERS data.")
 
-    if not found_version:
-        raise KeyError("AMBER Read: Did not find VERSION_STAMP data.")
+def _read_section(filename, section):
+    """
+    Reads and decodes a single section of a prmtop file, see `build_section_index`.
+    """
 
-    # Iterate over the primary data portion of the object
+    with open(filename, "rb") as handle:
+        handle.seek(section["offset"])
+        data = handle.read(section["size"])
 
-    # Figure out the size of each label
-    label_sizes = {}
-    for k, v in amd.data_labels.items():
-        # If section always has same size
-        if isinstance(v[0], int):
-            label_sizes[k] = v[0]
-        # Section is variable size (eg NATOMS)
-        elif v[0] in list(sizes_dict):
-            label_sizes[k] = sizes_dict[v[0]]
-        # Section is variable size and has to be evaluated, (eg "(NTYPES * (NTYPES + 1)) / 2")
-        else:
-            # print("%30s %40s %d" % (k, v[0], int(eval(v[0], sizes_dict))))
-            label_sizes[k] = int(eval(v[0], sizes_dict))
-
-    # Find the start
-    current_data_category = None
-    current_data_type = None
-    file_handle = open(filename, "r")
-    counter = 0
-    for line in file_handle:
-        if counter > 100:
-            raise KeyError(
-                "AMBER Read: Could not find the line a data category in the first 100 lines."
-            )
-        matched, name = eex.utility.fuzzy_list_match(line,
-                                                     list(amd.data_labels))
-        if matched:
-            current_data_category = name
-            current_data_type = amd.parse_format(next(file_handle))
-
-            break
-        counter += 1
-
-    # Build any required temporaries
-    _current_topology_indices = {
-        "bonds": [3, 0, np.array([])],
-        "angles": [4, 0, np.array([])],
-        "dihedrals": [5, 0, np.array([])],
-    }
-
-    # Iterate over the file
-    while True:
-        # Type out the sizes and types
-        nsize = label_sizes[current_data_category]
-        nrows = int(math.ceil(nsize / float(current_data_type[0])))
-        dtypes = [current_data_type[1]] * current_data_type[0]
-        widths = [current_data_type[2]] * current_data_type[0]
-        # print(current_data_category)
-
-        # Read in the data, in chunks
-        remaining_read = nrows
-        num_blocks = int(math.ceil(nrows / float(blocksize)))
-        category_index = 1
-        for block in range(num_blocks):
-
-            # Figure out the size of the read
-            read_size = blocksize
-            if remaining_read < blocksize:
-                read_size = remaining_read
-
-            # read_fwf will push the file pointer *at least 4* so lets just read it in
-            tmp_handle = None
-            if read_size < 4:
-                data = []
-                for x in range(read_size):
-                    data.append(next(file_handle))
-                    tmp_handle = StringIO("".join(data))
-            else:
-                tmp_handle = file_handle
-
-            # Read in the data
-            data = pd.read_fwf(
-                tmp_handle,
-                nrows=read_size,
-                widths=widths,
-                dtypes=dtypes,
-                header=None)
-            # 1D atom properties
-            if current_data_category in list(amd.atom_property_names):
-                df = _data_flatten(
-                    data, amd.atom_property_names[current_data_category],
-                    category_index, "atom_index")
-                category_index += df.shape[0]
-
-                # Add the data to DL
-                dl.add_atoms(df, by_value=True, utype=amd.atom_data_units)
-            # Store forcefield parameters as "other" for later processing
-            elif current_data_category in amd.store_other and len(data) != 0:
-                df = _data_flatten(data, current_data_category, category_index,
-                                   "index")
-                # Force certain categories to be type int
-                if current_data_category in [
-                        "RESIDUE_POINTER", "NUMBER_EXCLUDED_ATOMS",
-                        "EXCLUDED_ATOMS_LIST"
-                ]:
-                    df = df.astype(int)
-                category_index += df.shape[0]
-
-                # Add the data to DL
-                dl.add_other(current_data_category, df)
-
-            # Store bond, angle, dihedrals
-            elif current_data_category in list(amd.topology_store_names):
-                category = current_data_category.split("_")[0].lower()
-
-                mod_size, current_size, remaining_data = _current_topology_indices[
-                    category]
-
-                data = data.values.ravel()
-                data = data[np.isfinite(data)]
-
-                # Prepend remaining data
-                if remaining_data.size:
-                    data = np.hstack((remaining_data, data))
-
-                # Get current remaining and
-                remaining = data.size % mod_size
-                if remaining:
-                    data = data[:-remaining]
-                    _current_topology_indices[category][-1] = data[
-                        -remaining:].copy()
-                else:
-                    _current_topology_indices[category][-1] = np.array([])
-
-                data = data.reshape(-1, mod_size).astype(int)
-
-                # A negative indexed value in position 3 indicates 1-4 NB interactions for this dihedral
-                # should not be counted (multi-term dihedral or cyclic system). Store as
-                # dihedral for now, neglecting negative sign
-
-                data = np.absolute(data)
-
-                # Weird AMBER indexing, we have: atom1, atom2, ..., term_index
-                # Atom indices are (index / 3 + 1)
-                data[:, :-1] = data[:, :-1] / 3 + 1
-
-                # Build column names and atom sizes
-                col_name = ["atom" + str(x) for x in range(1, mod_size)]
-                col_name.append("term_index")
-
-                index = np.arange(
-                    current_size, data.shape[0] + current_size, dtype=int)
-
-                # Build and curate the data
-                df_dict = {}
-                for num, name in enumerate(col_name):
-                    df_dict[name] = data[:, num]
-
-                # Form the DF and add!
-                df = pd.DataFrame(df_dict, index=index)
-                dl.add_terms(mod_size - 1, df)
-
-            # Get box information from prmtop if here. Will be overwritten by inpcrd if information is provided.
-            elif current_data_category == "BOX_DIMENSIONS":
-                box_size = {}
-                box_center = []
-                a = data[1].values[0]
-                b = data[2].values[0]
-                c = data[3].values[0]
-
-                box_size["alpha"] = data[0].values[0]
-                box_size["beta"] = data[0].values[0]
-                box_size["gamma"] = data[0].values[0]
-
-                for v in amd.box_units["center"]:
-                    box_center.append(eval(v))
-
-                box_center = dict(zip(['x', 'y', 'z'], box_center))
-
-                box_size["a"] = a
-                box_size["b"] = b
-                box_size["c"] = c
-
-                dl.set_box_size(
-                    box_size,
-                    utype={
-                        "a": amd.box_units["length"],
-                        "b": amd.box_units["length"],
-                        "c": amd.box_units["length"],
-                        "alpha": amd.box_units["angle"],
-                        "beta": amd.box_units["angle"],
-                        "gamma": amd.box_units["angle"],
-                    })
+    return _decode_section(data, amd.parse_format(section["format"]))
 
-                dl.set_box_center(
-                    box_center,
-                    utype={
-                        "x": amd.box_units["length"],
-                        "y": amd.box_units["length"],
-                        "z": amd.box_units["length"]
-                    })
 
-            else:
-                # logger.debug("Did not understand data category.. passing")
-                pass
-            # elif current_data_category == "ATOM_NAME":
+def read_amber_section(filename, category, index=None):
+    """
+    Reads a single %FLAG section of a prmtop file without reading the remainder of the file.
 
-            # Update remaining
-            remaining_read -= blocksize
+    Parameters
+    ----------
+    filename : str
+        The name of the prmtop file
+    category : str
+        The name of the section (eg - "CHARGE")
+    index : list, optional
+        The section index of the file, otherwise built with `build_section_index`.
+
+    Returns
+    -------
+    values : np.ndarray
+        The 1D array of the section values
+    """
 
-        # If we are doing nothing, we still have a blank line
-        if nrows == 0:
-            next(file_handle)
+    if index is None:
+        index = build_section_index(filename)
 
-        # Figure out the next category to read
-        try:
-            category_line = next(file_handle)
-            format_line = next(file_handle)
-        except StopIteration:
-            break
-
-        # Bad hack for solvent pointers
-        if "SOLVENT_POINTERS" in category_line:
-            dline = next(file_handle).rstrip()
-            data = [int(dline[i:i + 8]) for i in range(0, len(dline), 8)]
-            label_sizes["ATOMS_PER_MOLECULE"] = data[1]
-            try:
-                category_line = next(file_handle)
-                format_line = next(file_handle)
-            except StopIteration:
-                break
+    for section in index:
+        if section["category"] == category:
+            return _read_section(filename, section)
 
-        matched, current_data_category = eex.utility.fuzzy_list_match(
-            category_line, list(amd.data_labels))
-        if not matched:
-            raise KeyError("AMBER Read: Data category '%s' not understood" %
-                           category_line)
+    raise KeyError("AMBER Read: Data category '%s' not found in '%s'." % (category, filename))
 
-        current_data_type = amd.parse_format(format_line)
 
-    # Close out the file handle
-    file_handle.close()
+def _add_section(dl, category, values, data_type, blocksize):
+    """
+    Adds the decoded values of a prmtop section to the DataLayer.
+    """
 
-    # Handle any data we added to the other columns
+    # Number of values added at once
+    block_values = max(blocksize * data_type[0], 1)
+
+    # 1D atom properties
+    if category in list(amd.atom_property_names):
+        for start in range(0, values.shape[0], block_values):
+            block = values[start:start + block_values]
+            df = pd.DataFrame({amd.atom_property_names[category]: block},
+                              index=pd.Index(np.arange(start + 1, start + 1 + block.shape[0]), name="atom_index"))
+
+            dl.add_atoms(df, by_value=True, utype=amd.atom_data_units)
+
+    # Store forcefield parameters as "other" for later processing
+    elif category in amd.store_other and values.shape[0] != 0:
+        # Force certain categories to be type int
+        if category in ["RESIDUE_POINTER", "NUMBER_EXCLUDED_ATOMS", "EXCLUDED_ATOMS_LIST"]:
+            values = values.astype(int)
+
+        for start in range(0, values.shape[0], block_values):
+            block = values[start:start + block_values]
+            df = pd.DataFrame({category: block},
+                              index=pd.Index(np.arange(start + 1, start + 1 + block.shape[0]), name="index"))
+            dl.add_other(category, df)
+
+    # Store bond, angle, dihedrals
+    elif category in list(amd.topology_store_names):
+        mod_size = {"BONDS": 3, "ANGLES": 4, "DIHEDRALS": 5}[category.split("_")[0]]
+
+        # A negative indexed value in position 3 indicates 1-4 NB interactions for this dihedral
+        # should not be counted (multi-term dihedral or cyclic system). Store as
+        # dihedral for now, neglecting negative sign
+        data = np.absolute(values.reshape(-1, mod_size)).astype(int)
+
+        # Weird AMBER indexing, we have: atom1, atom2, ..., term_index
+        # Atom indices are (index / 3 + 1)
+        data[:, :-1] = data[:, :-1] // 3 + 1
+
+        # Build column names and atom sizes
+        col_name = ["atom" + str(x) for x in range(1, mod_size)]
+        col_name.append("term_index")
+
+        block_terms = max(block_values // mod_size, 1)
+        for start in range(0, data.shape[0], block_terms):
+            block = data[start:start + block_terms]
+            df = pd.DataFrame({name: block[:, num] for num, name in enumerate(col_name)},
+                              index=np.arange(start, start + block.shape[0]))
+            dl.add_terms(mod_size - 1, df)
+
+    # Get box information from prmtop if here. Will be overwritten by inpcrd if information is provided.
+    elif category == "BOX_DIMENSIONS":
+        box_size = {}
+        box_center = []
+        a = values[1]
+        b = values[2]
+        c = values[3]
+
+        box_size["alpha"] = values[0]
+        box_size["beta"] = values[0]
+        box_size["gamma"] = values[0]
+
+        for v in amd.box_units["center"]:
+            box_center.append(eval(v))
+
+        box_center = dict(zip(['x', 'y', 'z'], box_center))
+
+        box_size["a"] = a
+        box_size["b"] = b
+        box_size["c"] = c
+
+        dl.set_box_size(
+            box_size,
+            utype={
+                "a": amd.box_units["length"],
+                "b": amd.box_units["length"],
+                "c": amd.box_units["length"],
+                "alpha": amd.box_units["angle"],
+                "beta": amd.box_units["angle"],
+                "gamma": amd.box_units["angle"],
+            })
+
+        dl.set_box_center(
+            box_center,
+            utype={
+                "x": amd.box_units["length"],
+                "y": amd.box_units["length"],
+                "z": amd.box_units["length"]
+            })
+
+
+def _add_residues(dl, sizes_dict):
+    """
+    Expands the residue sections to per atom residue values.
+    """
 
-    # Expand residue values
     res_df = dl.get_other(amd.residue_store_names)
 
     sizes = np.diff(res_df["RESIDUE_POINTER"])
@@ -360,13 +258,19 @@ def read_amber_file(dl, filename, inpcrd=None, blocksize=5000):
     res_df.index.name = "atom_index"
     dl.add_atoms(res_df, by_value=True)
 
+
+def _add_molecules(dl, sizes_dict):
+    """
+    Expands the molecule sections to per atom molecule values.
+    """
+
     # Expand molecule values - if periodic simulation information will be given. If not, we assign all atoms the same
     # molecule number.
     if sizes_dict["IFBOX"] > 0:
         molecule_df = dl.get_other(amd.molecule_store_names)
 
-        # This is only set if SOLVENT_POINTERS is present in the prmtop (ie - a periodic simulation)
-        number_of_molecules = label_sizes["ATOMS_PER_MOLECULE"]
+        # ATOMS_PER_MOLECULE is only present in the prmtop for periodic simulations
+        number_of_molecules = molecule_df.shape[0]
 
         molecule_range = np.arange(1, number_of_molecules + 1)
 
@@ -396,76 +300,11 @@ def read_amber_file(dl, filename, inpcrd=None, blocksize=5000):
 
     dl.add_atoms(molecule_df, by_value=True)
 
-    # Handle forcefield parameters
-    other_tables = set(dl.list_other_tables())
-
-    for key, param_data in amd.forcefield_parameters.items():
-        param_col_names = list(param_data["column_names"])
-
-        # if the needed parameters are stored, this will result in an empty set. If set is not empty, parameters are not
-        # stored and do not need to be put in data layer
-        if (set(param_col_names) - other_tables):
-            continue
 
-        # Bond parameters (bond, angle, dihedral) will have an "order", the order for nonbond parameters is None
-        if param_data["order"] is not None:
-            cnt = 1  # Start counting from one
-            for ind, row in dl.get_other(param_col_names).iterrows():
-                params = {}
-                for k, v in param_data["column_names"].items():
-                    params[v] = row[k]
-                dl.add_term_parameter(
-                    param_data["order"],
-                    param_data["form"],
-                    params,
-                    uid=cnt,
-                    utype=param_data["units"])
-                cnt += 1
-        else:
-            # Get info for grabbing LJ parameters
-            nb_parm_index = dl.get_other("NONBONDED_PARM_INDEX")
-            A_coeff_list = dl.get_other("LENNARD_JONES_ACOEF")
-            B_coeff_list = dl.get_other("LENNARD_JONES_BCOEF")
-            stored_atom_types = np.unique(dl.get_atoms('atom_type'))
-            ntypes = len(stored_atom_types)
-
-            # Need relevant atom types. Should go 1...n where n is number of atom_types. Loop through stored to
-            # get all combinations
-
-            for x in range(len(stored_atom_types)):
-                for y in range(x + 1):
-                    # For amber, section NONBOND_PARM_INDEX gives pointer to LENNARD_JONES_ACOEF and _BCOEF sections.
-                    # The atom types are used to compute NB_PARM_INDEX index, which is used to get ACOEF and BCOEF
-
-                    # Get atom types - nb_key is (atom_type1, atom_type2)
-                    nb_key = (stored_atom_types[y], stored_atom_types[x])
-
-                    # Calcuate index into NB_PARM_INDEX
-                    ind_nb_parm_index = ntypes * (nb_key[0] - 1) + nb_key[1]
-
-                    # Get index into LENNARDJONES_ACOEF and LENNARDJONES_BCOEF
-                    # Subtract 1 because Amber indexes from 1, but python indexes from 0
-                    nb_index = nb_parm_index.iloc[ind_nb_parm_index - 1]
-
-                    # Grab values
-                    A_coeff = A_coeff_list.iloc[
-                        nb_index - 1]['LENNARD_JONES_ACOEF'].values[0]
-                    B_coeff = B_coeff_list.iloc[
-                        nb_index - 1]['LENNARD_JONES_BCOEF'].values[0]
-
-                    # Store in datalayer
-                    dl.add_nb_parameter(
-                        atom_type=nb_key[0],
-                        atom_type2=nb_key[1],
-                        nb_parameters={
-                            "A": A_coeff,
-                            "B": B_coeff
-                        },
-                        nb_name=amd.forcefield_parameters["nonbond"]["form"]
-                        ["name"],
-                        nb_model=amd.forcefield_parameters["nonbond"]["form"]
-                        ["form"],
-                        utype=amd.forcefield_parameters["nonbond"]["units"])
+def _add_exclusions(dl):
+    """
+    Adds the excluded atom pairs as pair scalings of zero.
+    """
 
     # Handle exclusions
     number_excluded_atoms = dl.get_other("NUMBER_EXCLUDED_ATOMS")
@@ -503,87 +342,277 @@ def read_amber_file(dl, filename, inpcrd=None, blocksize=5000):
     if not all_excluded_df.empty:
         dl.set_pair_scalings(all_excluded_df)
 
-    # Try to pull in an inpcrd file for XYZ coordinates and box information
-    inpcrd_file = filename.replace('.prmtop', '.inpcrd')
+
+def _build_pool(pool_type, workers):
+    """
+    Builds a thread or process pool to decode sections with.
+    """
+
+    if pool_type == "thread":
+        return multiprocessing.pool.ThreadPool(workers)
+    elif pool_type == "process":
+        return multiprocessing.Pool(workers)
+    else:
+        raise KeyError("AMBER Read: Pool type '%s' not understood." % str(pool_type))
+
+
+def read_amber_file(dl,
+                    filename,
+                    inpcrd=None,
+                    blocksize=5000,
+                    sections=None,
+                    index_cache=False,
+                    workers=1,
+                    pool_type="process"):
+    """
+
+    Parameters
+    ----------
+    dl : eex.DataLayer
+        The datalayer to add data to
+    filename : str
+        The name of the prmtop file
+    inpcrd : str, optional
+        If None, attempts to read the file filename.replace("prmtop", "inpcrd") otherwise passes.
+    blocksize : int, optional
+        The number of lines of a section added to the DataLayer at once.
+    sections : list, optional
+        The %FLAG sections to load (eg - ["CHARGE", "BONDS_INC_HYDROGEN"]), otherwise all sections are loaded.
+        Residue, molecule, forcefield and exclusion data are only built if the sections they require are loaded and
+        coordinates are only read when all sections are loaded.
+    index_cache : bool, optional
+        If True the section index is cached next to the prmtop, see `build_section_index`.
+    workers : int, optional
+        The number of workers decoding sections concurrently, sections are still added to the DataLayer in file order.
+    pool_type : {"process", "thread"}, optional
+        The kind of pool used when workers is greater than one.
+
+    """
+
+    # Worker processes are forked before the background writer starts so that they do not inherit its thread state
+    pool = None
+    if workers > 1:
+        pool = _build_pool(pool_type, workers)
+
     try:
-        header_data = eex.utility.read_lines(inpcrd_file, 2)
-    except OSError:
-        header_data = []
-
-    if header_data:
-        inpcrd_size = header_data[1].split()
-        if len(inpcrd_size) > 1:
-            raise Exception(
-                "Cannot handle velocities or pressure in INPCRD file yet.")
-
-        read_size = math.ceil(float(inpcrd_size[0]) / 2)
-
-        file_handle = open(inpcrd_file, "r")
-        # Read in all information in inpcrd
-        data = pd.read_fwf(
-            file_handle,
-            widths=([12] * 6),
-            dtypes=([float] * 6),
-            header=None,
-            skiprows=2)
-
-        if data.shape[0] == read_size + 1 and sizes_dict["IFBOX"] > 0:
-            box_information = data.tail(1).values[0]
-
-            a = box_information[0]
-            b = box_information[1]
-            c = box_information[2]
-
-            box_sizes = {
-                "a": a,
-                "b": b,
-                "c": c,
-                "alpha": box_information[3],
-                "beta": box_information[3],
-                "gamma": box_information[3],
-            }
-
-            dl.set_box_size(
-                box_sizes,
-                utype={
-                    "a": amd.box_units["length"],
-                    "b": amd.box_units["length"],
-                    "c": amd.box_units["length"],
-                    "alpha": amd.box_units["angle"],
-                    "beta": amd.box_units["angle"],
-                    "gamma": amd.box_units["angle"],
-                })
-
-            box_center = []
-
-            for v in amd.box_units["center"]:
-                box_center.append(eval(v))
-
-            box_center = dict(zip(['x', 'y', 'z'], box_center))
-
-            dl.set_box_center(
-                box_center,
-                utype={
-                    "x": amd.box_units["length"],
-                    "y": amd.box_units["length"],
-                    "z": amd.box_units["length"]
-                })
-
-            # Drop box info from atom coordinates
-            data.drop(data.index[-1], inplace=True)
-
-        elif data.shape[0] == read_size and sizes_dict["IFBOX"] > 0:
-            raise Warning(
-                "Periodic prmtop used with non-periodic inpcrd. Using prmtop data"
-            )
-
-        df = pd.DataFrame(data.values.reshape(-1, 3), columns=["X", "Y", "Z"])
-        df.dropna(axis=0, how="any", inplace=True)
-        df.index = np.arange(1, df.shape[0] + 1)
-
-        df.index.name = "atom_index"
-        dl.add_atoms(df, utype={"XYZ": "angstrom"})
-
-        file_handle.close()
+        # Parse while the tables are written in the background
+        with dl.background_writes():
+            return _read_amber_file(dl, filename, inpcrd=inpcrd, blocksize=blocksize, sections=sections,
+                                    index_cache=index_cache, pool=pool)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def _read_amber_file(dl, filename, inpcrd=None, blocksize=5000, sections=None, index_cache=False, pool=None):
+    # First we need to figure out system dimensions
+    max_rows = 100  # How many lines do we attempt to search?
+    header_data = eex.utility.read_lines(filename, max_rows)
+
+    sizes_dict = {}
+    ret_data = {}
+    found_sizes = False
+    found_version = False
+    for num, line in enumerate(header_data):
+
+        # First try to figure out the version
+        if "VERSION" in line:
+            sline = line.strip().split()
+            if "VERSION_STAMP" == sline[1]:
+                ret_data["VERSION"] = sline[3]
+                if ret_data["VERSION"] != "V0001.000":
+                    raise ValueError(
+                        "AMBER Read: Did not recognize version '%s'." %
+                        ret_data["VERSION"])
+                found_version = True
+            else:
+                raise ValueError(
+                    "AMBER Read: Could not understand version line.")
+
+        # Get size_information - read in "FLAG POINTERS"
+        elif "FLAG POINTERS" in line:
+            ncols, dtype, width = amd.parse_format(header_data[num + 1])
+
+            parsed_sizes = []
+            for shift in range(4):
+                dline = header_data[num + 2 + shift]
+                # Make sure the leading white space is not being cut off each line
+                if shift < 3:
+                    dline = dline.rjust(80)
+                dline = [
+                    dtype(dline[i:(i + width)])
+                    for i in range(0, len(dline), width)
+                ]
+                parsed_sizes.extend(dline)
+
+            if len(parsed_sizes) != len(amd.size_keys):
+                raise IndexError(
+                    "AMBER Read: The size of the FLAG POINTERS does not match the FLAG NAMES."
+                )
+
+            for k, v in zip(amd.size_keys, parsed_sizes):
+                sizes_dict[k] = v
+
+            found_sizes = True
+
+    if not found_sizes:
+        raise KeyError("AMBER Read: Did not find FLAG POINTERS data.")
+
+    if not found_version:
+        raise KeyError("AMBER Read: Did not find VERSION_STAMP data.")
+
+    # Iterate over the primary data portion of the object
+    index = build_section_index(filename, cache=index_cache)
+    if sections is not None:
+        unknown = set(sections) - set(x["category"] for x in index)
+        if unknown:
+            raise KeyError("AMBER Read: Data categories '%s' not found in '%s'." % (str(sorted(unknown)), filename))
+
+        index = [x for x in index if x["category"] in sections]
+
+    for section in index:
+        if section["category"] not in amd.data_labels:
+            logger.debug("AMBER Read: Skipping unknown data category '%s'." % section["category"])
+    index = [x for x in index if x["category"] in amd.data_labels]
+
+    # Decode the sections, concurrently if requested, and add them in file order
+    decode = functools.partial(_read_section, filename)
+    if pool is not None:
+        decoded = pool.imap(decode, index)
+    else:
+        decoded = (decode(x) for x in index)
+
+    loaded = set()
+    for section in index:
+        values = next(decoded)
+        _add_section(dl, section["category"], values, amd.parse_format(section["format"]), blocksize)
+        loaded.add(section["category"])
+
+    # Handle any data we added to the other columns
+    if (sections is None) or set(amd.residue_store_names) <= loaded:
+        _add_residues(dl, sizes_dict)
+
+    if (sections is None) or ((sizes_dict["IFBOX"] > 0) and set(amd.molecule_store_names) <= loaded):
+        _add_molecules(dl, sizes_dict)
+
+    # Handle forcefield parameters
+    other_tables = set(dl.list_other_tables())
+
+    for key, param_data in amd.forcefield_parameters.items():
+        param_col_names = list(param_data["column_names"])
+
+        # if the needed parameters are stored, this will result in an empty set. If set is not empty, parameters are not
+        # stored and do not need to be put in data layer
+        if (set(param_col_names) - other_tables):
+            continue
+
+        # Nonbond parameters are stored by atom type
+        if (param_data["order"] is None) and (sections is not None) and ("ATOM_TYPE_INDEX" not in loaded):
+            continue
+
+        # Bond parameters (bond, angle, dihedral) will have an "order", the order for nonbond parameters is None
+        if param_data["order"] is not None:
+            params = dl.get_other(param_col_names).rename(columns=param_data["column_names"])
+
+            # Start counting from one
+            params["uid"] = np.arange(1, params.shape[0] + 1)
+            dl.add_term_parameters(
+                param_data["order"],
+                params,
+                term_name=param_data["form"],
+                utype=param_data["units"])
+        else:
+            # Get info for grabbing LJ parameters
+            nb_parm_index = dl.get_other("NONBONDED_PARM_INDEX")
+            A_coeff_list = dl.get_other("LENNARD_JONES_ACOEF")
+            B_coeff_list = dl.get_other("LENNARD_JONES_BCOEF")
+            stored_atom_types = np.unique(dl.get_atoms('atom_type'))
+            ntypes = len(stored_atom_types)
+
+            # Need relevant atom types. Should go 1...n where n is number of atom_types. Build all combinations
+            # (atom_type1, atom_type2) with atom_type1 <= atom_type2.
+            x, y = np.tril_indices(ntypes)
+            nb_params = pd.DataFrame({
+                "atom_type": stored_atom_types[y],
+                "atom_type2": stored_atom_types[x]
+            })
+
+            # For amber, section NONBOND_PARM_INDEX gives pointer to LENNARD_JONES_ACOEF and _BCOEF sections.
+            # The atom types are used to compute NB_PARM_INDEX index, which is used to get ACOEF and BCOEF
+            ind_nb_parm_index = ntypes * (nb_params["atom_type"].values - 1) + nb_params["atom_type2"].values
+
+            # Get index into LENNARDJONES_ACOEF and LENNARDJONES_BCOEF
+            # Subtract 1 because Amber indexes from 1, but python indexes from 0
+            nb_index = nb_parm_index.values[ind_nb_parm_index - 1].ravel().astype(np.int64)
+
+            # Grab values
+            nb_params["A"] = A_coeff_list["LENNARD_JONES_ACOEF"].values[nb_index - 1]
+            nb_params["B"] = B_coeff_list["LENNARD_JONES_BCOEF"].values[nb_index - 1]
+
+            # Store in datalayer
+            dl.add_nb_parameters(
+                nb_params,
+                nb_name=amd.forcefield_parameters["nonbond"]["form"]["name"],
+                nb_model=amd.forcefield_parameters["nonbond"]["form"]["form"],
+                utype=amd.forcefield_parameters["nonbond"]["units"])
+
+    # Exclusions are only built if loaded and coordinates are only read for full reads
+    if sections is not None:
+        if set(amd.exclusion_sections) <= loaded:
+            _add_exclusions(dl)
+        return ret_data
+
+    _add_exclusions(dl)
+
+    # Try to pull in an inpcrd file for XYZ coordinates and box information
+    inpcrd_file = filename.replace('.prmtop', '.inpcrd') if inpcrd is None else inpcrd
+    if not os.path.exists(inpcrd_file):
+        return ret_data
+
+    restart = read_amber_restart(inpcrd_file)
+
+    if (restart["box"] is not None) and sizes_dict["IFBOX"] > 0:
+        box_sizes = restart["box"]
+        a = box_sizes["a"]
+        b = box_sizes["b"]
+        c = box_sizes["c"]
+
+        dl.set_box_size(
+            box_sizes,
+            utype={
+                "a": amd.box_units["length"],
+                "b": amd.box_units["length"],
+                "c": amd.box_units["length"],
+                "alpha": amd.box_units["angle"],
+                "beta": amd.box_units["angle"],
+                "gamma": amd.box_units["angle"],
+            })
+
+        box_center = []
+
+        for v in amd.box_units["center"]:
+            box_center.append(eval(v))
+
+        box_center = dict(zip(['x', 'y', 'z'], box_center))
+
+        dl.set_box_center(
+            box_center,
+            utype={
+                "x": amd.box_units["length"],
+                "y": amd.box_units["length"],
+                "z": amd.box_units["length"]
+            })
+
+    elif (restart["box"] is None) and sizes_dict["IFBOX"] > 0:
+        raise Warning(
+            "Periodic prmtop used with non-periodic inpcrd. Using prmtop data"
+        )
+
+    df = pd.DataFrame(restart["xyz"], columns=["X", "Y", "Z"])
+    df.index = np.arange(1, df.shape[0] + 1)
+
+    df.index.name = "atom_index"
+    dl.add_atoms(df, utype={"XYZ": "angstrom"})
 
     return ret_data
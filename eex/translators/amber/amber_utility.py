@@ -2,6 +2,67 @@ import eex
 import os
 from . import amber_metadata as amd
 
+# Units of the frames returned by the coordinate readers
+_default_utype = {
+    "length": "angstrom",
+    "angle": "degree",
+    "time": "picosecond",
+}
+
+_box_keys = [("a", "b", "c"), ("alpha", "beta", "gamma")]
+
+
+def _frame_utype(utype):
+    """
+    Validates the units requested from a frame reader, filling in the defaults.
+    """
+
+    if utype is None:
+        utype = {}
+    elif not isinstance(utype, dict):
+        raise TypeError("AMBER Read: utype type not understood")
+
+    unknown = set(utype) - set(_default_utype)
+    if unknown:
+        raise KeyError("AMBER Read: utype keys '%s' not understood." % str(sorted(unknown)))
+
+    ret = _default_utype.copy()
+    ret.update(utype)
+    return ret
+
+
+def _set_frame(dl, frame, utype):
+    """
+    Sets the coordinates and box size of a frame in the DataLayer.
+    """
+
+    dl.set_coordinates(frame["xyz"], utype=utype["length"])
+    if frame["box"] is None:
+        return
+
+    box_utype = {k: utype["length"] for k in _box_keys[0]}
+    box_utype.update({k: utype["angle"] for k in _box_keys[1]})
+
+    # Boxes without angles keep the current angles, or are orthorhombic
+    box = frame["box"].copy()
+    if _box_keys[1][0] not in box:
+        current = dl.get_box_size(utype=box_utype)
+        for k in _box_keys[1]:
+            box[k] = current.get(k, 90.0 * eex.units.conversion_factor("degree", utype["angle"]))
+
+    dl.set_box_size(box, utype=box_utype)
+
+
+def _frame_slice(nframes, start, stop, step):
+    """
+    Returns the frame numbers selected by a slice.
+    """
+
+    if step == 0:
+        raise ValueError("AMBER Read: Frame step cannot be zero.")
+
+    return range(*slice(start, stop, step).indices(nframes))
+
 
 def get_energies(prmtop=None, crd=None, input_file=None, amb_path=None):
     """Evaluate energies of AMBER files. Based on InterMol
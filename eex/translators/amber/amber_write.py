@@ -3,6 +3,7 @@ Writer for amber
 
 """
 
+import re
 import time
 import pandas as pd
 import numpy as np
@@ -16,39 +17,153 @@ from . import amber_metadata as amd
 
 logger = logging.getLogger(__name__)
 
+# Integer formats built by amber_metadata.build_format
+_INT_FORMAT = re.compile(r"^%(\d+)d$")
 
-def _write_1d(file_handle, data, ncols, fmt):
 
-    data = data.ravel()
+def _format_int_fields(data, width):
+    """
+    Renders integers as a (n, width) array of characters following "%(width)d" with digit arithmetic, returns None if
+    a value does not fit in the field.
+    """
+
+    if data.dtype.kind == "f":
+        if not np.all(np.isfinite(data)):
+            return None
+        data = data.astype(np.int64)
+    elif data.dtype.kind not in "iu":
+        return None
+
+    # Negative values leave a position for the sign
+    values = np.abs(data.astype(np.int64))
+    if np.any(values >= 10**width) or np.any(values[data < 0] >= 10**(width - 1)):
+        return None
+
+    if width <= 9:
+        values = values.astype(np.int32)
+
+    # Built one field position at a time, leading zeros are blank apart from the last digit
+    fields = np.empty((width, values.shape[0]), dtype=np.uint8)
+
+    rest = values.copy()
+    digit = np.empty_like(values)
+    for k in range(width):
+        pos = width - 1 - k
+        np.remainder(rest, 10, out=digit)
+        rest //= 10
+        fields[pos] = digit
+        fields[pos] += ord("0")
+        if k:
+            fields[pos][values < 10**k] = ord(" ")
+
+    # The sign sits in front of the first digit
+    negative = np.where(data < 0)[0]
+    nnegative = np.ones(negative.shape[0], dtype=np.int64)
+    for k in range(1, width - 1):
+        nnegative += values[negative] >= 10**k
+    fields[width - 1 - nnegative, negative] = ord("-")
+
+    return np.ascontiguousarray(fields.T)
+
+
+def _join_fields(fields, ncols):
+    """
+    Joins a (n, width) array of characters into lines of ncols fields.
+    """
+
+    nrows, remainder = divmod(fields.shape[0], ncols)
+    width = fields.shape[1]
+
+    lines = np.empty((nrows, ncols * width + 1), dtype=np.uint8)
+    lines[:, :-1] = fields[:nrows * ncols].reshape(nrows, ncols * width)
+    lines[:, -1] = ord("\n")
+
+    ret = lines.tobytes()
+    if remainder:
+        ret += fields[nrows * ncols:].tobytes() + b"\n"
+
+    return ret
 
-    remainder_size = data.size % ncols
 
+def _format_1d(data, ncols, fmt):
+    """
+    Renders data as fixed-width lines of ncols values with a single template covering every line.
+    """
+
+    data = np.asarray(data).ravel()
     if data.size == 0:
-        file_handle.write("\n".encode())
-    elif remainder_size == 0:
-        np.savetxt(file_handle, data.reshape(-1, ncols), fmt=fmt, delimiter="")
-    else:
-        rem_data = data[-remainder_size:].reshape(1, -1)
-        data = data[:-remainder_size].reshape(-1, ncols)
-        np.savetxt(file_handle, data, fmt=fmt, delimiter="")
-        np.savetxt(file_handle, rem_data, fmt=fmt, delimiter="")
-    # print(data.shape, rem_data.shape)
+        return b"\n"
 
-    # Write data to file
-    file_handle.flush()
+    # Integer fields are built directly from their digits
+    match = _INT_FORMAT.match(fmt)
+    if match:
+        fields = _format_int_fields(data, int(match.group(1)))
+        if fields is not None:
+            return _join_fields(fields, ncols)
+
+    nrows, remainder = divmod(data.size, ncols)
+    template = (fmt * ncols + "\n") * nrows
+    if remainder:
+        template += fmt * remainder + "\n"
+
+    return (template % tuple(data.tolist())).encode()
+
+
+def _write_1d(file_handle, data, ncols, fmt):
+
+    file_handle.write(_format_1d(data, ncols, fmt))
 
 
 def _write_amber_data(file_handle, data, category):
     fmt_string = amd.data_labels[category][1]
     fmt_data = amd.parse_format(fmt_string)
 
-    file_handle.write(("%%FLAG %s\n" % category).encode())
-    file_handle.write((fmt_string + "\n").encode())
-
     ncols = fmt_data[0]
     fmt = amd.build_format(fmt_data)
 
-    _write_1d(file_handle, np.array(data), ncols, fmt)
+    header = ("%%FLAG %s\n%s\n" % (category, fmt_string)).encode()
+    file_handle.write(header + _format_1d(data, ncols, fmt))
+
+
+def _build_exclusion_lists(atom_index, atom1, atom2):
+    """
+    Groups excluded atom pairs by their first atom.
+
+    Parameters
+    ----------
+    atom_index : np.ndarray
+        The sorted atom indices to build exclusions for
+    atom1, atom2 : np.ndarray
+        The excluded atom pairs
+
+    Returns
+    -------
+    number_excluded : np.ndarray
+        The number of excluded atoms of each atom, atoms without exclusions count a single placeholder
+    excluded_list : np.ndarray
+        The excluded atoms of each atom in turn, in the order the pairs are given, or a 0 placeholder
+    """
+
+    # Pairs grouped by first atom, keeping the given order within each group
+    order = np.argsort(atom1, kind="mergesort")
+    atom1 = atom1[order]
+    atom2 = atom2[order]
+
+    lower = np.searchsorted(atom1, atom_index, side="left")
+    counts = np.searchsorted(atom1, atom_index, side="right") - lower
+
+    number_excluded = np.maximum(counts, 1)
+    starts = np.cumsum(number_excluded) - number_excluded
+    excluded_list = np.zeros(number_excluded.sum(), dtype=np.int64)
+
+    # Scatter the contiguous pair ranges of each atom into the list
+    found = np.where(counts > 0)[0]
+    found_counts = counts[found]
+    atoms = np.repeat(found, found_counts)
+    offsets = np.arange(atoms.shape[0]) - np.repeat(np.cumsum(found_counts) - found_counts, found_counts)
+    excluded_list[starts[atoms] + offsets] = atom2[lower[atoms] + offsets]
+
+    return number_excluded, excluded_list
 
 
 def _get_charmm_dihedral_count(dl):
@@ -331,30 +446,17 @@ def write_amber_file(dl, filename, inpcrd=None):
             label_sizes[k] = int(eval(v[0], output_sizes))
 
     # Write title and version information
-    f = open(filename, "w")
-    f.write('%%VERSION  VERSION_STAMP = V0001.000  DATE = %s  %s\n' %
-            (time.strftime("%x"), time.strftime("%H:%M:%S")))
-    f.write("%FLAG TITLE\n%FORMAT(20a4)\n")
-    f.write("prmtop generated by MolSSI EEX\n")
+    file_handle = open(filename, "wb")
+    file_handle.write(('%%VERSION  VERSION_STAMP = V0001.000  DATE = %s  %s\n' %
+                       (time.strftime("%x"), time.strftime("%H:%M:%S"))).encode())
+    file_handle.write(b"%FLAG TITLE\n%FORMAT(20a4)\n")
+    file_handle.write(b"prmtop generated by MolSSI EEX\n")
 
     # Write pointers section
-    f.write("%%FLAG POINTERS\n%s\n" % (amd.data_labels["POINTERS"][1]))
-    ncols, dtype, width = amd.parse_format(amd.data_labels["POINTERS"][1])
-    format_string = "%%%sd" % width
-
-    count = 0
-    for k in amd.size_keys:
-        f.write(format_string % output_sizes[k])
-        count += 1
-        if count % ncols == 0:
-            f.write("\n")
-
-    f.write("\n")
-    f.close()
+    _write_amber_data(file_handle, [output_sizes[k] for k in amd.size_keys], "POINTERS")
     written_categories.append("POINTERS")
 
     # Write atom properties sections
-    file_handle = open(filename, "ab")
 
     for k in amd.atom_property_names:
         # Get data
@@ -389,29 +491,22 @@ def write_amber_file(dl, filename, inpcrd=None):
             continue
         term_md = amd.forcefield_parameters[term_type]
 
-        tmps = {k: [] for k in term_md["column_names"].keys()}
         utype = term_md["units"]
         order = term_md["order"]
 
-        inv_lookup = {v: k for k, v in term_md["column_names"].items()}
-
-        # Build lists of data since AMBER holds this as 1D
-        for uid in uids:
-            params = dl.get_term_parameter(
-                order, uid, utype=utype, ftype=term_md['form'])
+        # AMBER holds each parameter as a 1D array ordered by uid
+        params = dl.get_term_parameters(
+            order, uids, utype=utype, ftype=term_md['form'])
 
-            for k, v in params[1].items():
-                tmps[inv_lookup[k]].append(v)
         # Write out FLAGS
+        for k, v in term_md["column_names"].items():
 
-        for k, v in tmps.items():
-
-            _write_amber_data(file_handle, v, k)
+            _write_amber_data(file_handle, params[v].values, k)
             written_categories.append(k)
 
     for term_type, term_name in zip([2, 3, 4],
                                     ["bonds", "angles", "dihedrals"]):
-        term = dl.get_terms(term_type)
+        term = dl.get_terms(term_type, copy=False)
 
         if term.shape[0] == 0:
             continue
@@ -490,23 +585,22 @@ def write_amber_file(dl, filename, inpcrd=None):
     ntypes = len(stored_atom_types)
 
     # Get parameters from datalayer using correct amber units
-    stored_nb_parameters = dl.list_nb_parameters(
+    stored_nb_parameters = dl.get_nb_parameters(
         nb_name="LJ",
         nb_model="AB",
         utype=amd.forcefield_parameters["nonbond"]["units"],
         itype="pair")
+
+    # Build a_coeff, b_coeff, and nb_parm lists. Pairs are numbered in the order they are stored.
+    type1 = stored_nb_parameters["atom_type"]
+    type2 = stored_nb_parameters["atom_type2"]
+    lj_a_coeff = stored_nb_parameters["A"]
+    lj_b_coeff = stored_nb_parameters["B"]
+
     nonbonded_parm_index = np.zeros(ntypes * ntypes)
-    lj_a_coeff = []
-    lj_b_coeff = []
-
-    # Build a_coeff, b_coeff, and nb_parm lists
-    for key, value in stored_nb_parameters.items():
-        lj_a_coeff.append(value['A'])
-        lj_b_coeff.append(value['B'])
-        index_to_nb = ntypes * (key[0] - 1) + key[1]
-        index_to_nb2 = ntypes * (key[1] - 1) + key[0]
-        nonbonded_parm_index[index_to_nb - 1] = len(lj_a_coeff)
-        nonbonded_parm_index[index_to_nb2 - 1] = len(lj_a_coeff)
+    pair_number = np.arange(1, lj_a_coeff.shape[0] + 1)
+    nonbonded_parm_index[ntypes * (type1 - 1) + type2 - 1] = pair_number
+    nonbonded_parm_index[ntypes * (type2 - 1) + type1 - 1] = pair_number
 
     _write_amber_data(file_handle, nonbonded_parm_index,
                       "NONBONDED_PARM_INDEX")
@@ -517,29 +611,20 @@ def write_amber_file(dl, filename, inpcrd=None):
         written_categories.append(category)
 
     # Handle exclusions and scaling
-    exclusion_categories = {}
-
-    for excl in amd.exclusion_sections:
-        exclusion_categories[excl] = []
-
     exclusions_scaling = dl.get_pair_scalings(order=True)
 
     order_2_3_4 = exclusions_scaling[(exclusions_scaling["order"].notnull())]
 
     # Build NUMBER_EXCLUDED_ATOMS and EXCLUDED_ATOMS_LIST.
-    for ind in sorted(dl.get_atoms("atomic_number").index.values):
-
-        if ind in order_2_3_4.index:
-
-            excluded_atoms_df = order_2_3_4.loc[ind]
-            excluded_atoms = excluded_atoms_df.index.values
-            exclusion_categories["EXCLUDED_ATOMS_LIST"].extend(excluded_atoms)
-            exclusion_categories["NUMBER_EXCLUDED_ATOMS"].append(
-                len(excluded_atoms))
-
-        else:
-            exclusion_categories["NUMBER_EXCLUDED_ATOMS"].append(1)
-            exclusion_categories["EXCLUDED_ATOMS_LIST"].append(0)
+    number_excluded, excluded_list = _build_exclusion_lists(
+        np.sort(dl.get_atoms("atomic_number").index.values),
+        order_2_3_4.index.get_level_values(0).values,
+        order_2_3_4.index.get_level_values(1).values)
+
+    exclusion_categories = {
+        "NUMBER_EXCLUDED_ATOMS": number_excluded,
+        "EXCLUDED_ATOMS_LIST": excluded_list
+    }
 
     for excl in amd.exclusion_sections:
         _write_amber_data(file_handle, exclusion_categories[excl], excl)
@@ -4,5 +4,7 @@ Pull in the read_lammps_file
 
 from .lammps_read import read_lammps_input_file
 from .lammps_read import read_lammps_data_file
+from .lammps_read import build_section_index
+from .lammps_dump import read_lammps_dump, build_dump_index
 from .lammps_write import write_lammps_file
 from .lammps_utility import get_energies
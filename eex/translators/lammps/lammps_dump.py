@@ -0,0 +1,334 @@
+"""
+LAMMPS dump trajectory reader
+"""
+
+import io
+import json
+import mmap
+import os
+import numpy as np
+import pandas as pd
+
+import eex
+from . import lammps_metadata as lmd
+from . import lammps_utility
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Frame index cache written next to the dump
+_INDEX_VERSION = 1
+_INDEX_SUFFIX = ".eexindex"
+
+_TIMESTEP_ITEM = b"ITEM: TIMESTEP"
+
+# Coordinate columns in order of preference, if they are scaled by the box and if they are unwrapped
+_coordinate_columns = [
+    (("xu", "yu", "zu"), False, True),
+    (("xsu", "ysu", "zsu"), True, True),
+    (("x", "y", "z"), False, False),
+    (("xs", "ys", "zs"), True, False),
+]
+
+# Periodic image flags of wrapped coordinates
+_image_columns = ["ix", "iy", "iz"]
+
+_box_keys = [("a", "b", "c"), ("alpha", "beta", "gamma")]
+
+
+def _next_line(data, pos, end):
+    """
+    Returns the line starting at pos and the start of the following line.
+    """
+
+    line_end = data.find(b"\n", pos, end)
+    line_end = end if line_end == -1 else line_end
+    return data[pos:line_end].strip(), line_end + 1
+
+
+def build_dump_index(filename, cache=False):
+    """
+    Scans a LAMMPS dump file (dump atom or dump custom) for the byte offset, timestep and atom count of every frame.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the dump file
+    cache : bool, optional
+        If True the index is read from and written to filename + ".eexindex", the cache is rebuilt when the size or
+        modification time of the dump changes.
+
+    Returns
+    -------
+    index : dict
+        Dictionary of the form {"offsets": np.ndarray, "timesteps": np.ndarray, "natoms": np.ndarray} where offsets
+        holds the start of every frame followed by the end of the last frame.
+    """
+
+    stat = os.stat(filename)
+    cache_filename = filename + _INDEX_SUFFIX
+
+    if cache and os.path.exists(cache_filename):
+        try:
+            with open(cache_filename, "r") as handle:
+                cached = json.load(handle)
+            if (cached["version"] == _INDEX_VERSION) and (cached["size"] == stat.st_size) and (
+                    cached["mtime"] == stat.st_mtime):
+                return {k: np.array(cached[k], dtype=np.int64) for k in ["offsets", "timesteps", "natoms"]}
+        except (ValueError, KeyError, OSError, IOError):
+            pass
+
+    offsets = []
+    timesteps = []
+    natoms = []
+    if stat.st_size:
+        with open(filename, "rb") as handle:
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                start = data.find(_TIMESTEP_ITEM)
+                while start != -1:
+                    # Items only start lines
+                    if (start > 0) and (data[start - 1:start] != b"\n"):
+                        start = data.find(_TIMESTEP_ITEM, start + 1)
+                        continue
+
+                    line, pos = _next_line(data, start, stat.st_size)
+                    line, pos = _next_line(data, pos, stat.st_size)
+                    timestep = int(line)
+
+                    line, pos = _next_line(data, pos, stat.st_size)
+                    if not line.startswith(b"ITEM: NUMBER OF ATOMS"):
+                        raise ValueError("LAMMPS Read: Expected 'ITEM: NUMBER OF ATOMS' after timestep %d in '%s'." %
+                                         (timestep, filename))
+                    line, pos = _next_line(data, pos, stat.st_size)
+
+                    offsets.append(start)
+                    timesteps.append(timestep)
+                    natoms.append(int(line))
+
+                    start = data.find(_TIMESTEP_ITEM, pos)
+            finally:
+                data.close()
+
+    if len(offsets) == 0:
+        raise ValueError("LAMMPS Read: Dump file '%s' does not contain any frames." % filename)
+
+    offsets.append(stat.st_size)
+
+    if cache:
+        cached = {
+            "version": _INDEX_VERSION,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "offsets": offsets,
+            "timesteps": timesteps,
+            "natoms": natoms
+        }
+        try:
+            with open(cache_filename, "w") as handle:
+                json.dump(cached, handle)
+        except (OSError, IOError):
+            logger.debug("LAMMPS Read: Could not write the frame index cache '%s'." % cache_filename)
+
+    return {
+        "offsets": np.array(offsets, dtype=np.int64),
+        "timesteps": np.array(timesteps, dtype=np.int64),
+        "natoms": np.array(natoms, dtype=np.int64)
+    }
+
+
+def _parse_box(lines):
+    """
+    Parses the BOX BOUNDS item of a frame into the lower bounds, the box lengths and the tilt factors.
+    """
+
+    header = lines[0].split()[3:]
+    bounds = np.array([line.split() for line in lines[1:4]], dtype=np.float64)
+    if bounds.shape[0] != 3:
+        raise ValueError("LAMMPS Read: Could not understand the box bounds of a dump frame.")
+
+    tilt_factors = {"xy": 0.0, "xz": 0.0, "yz": 0.0}
+    if header[:3] == [b"xy", b"xz", b"yz"]:
+        tilt_factors = {"xy": bounds[0, 2], "xz": bounds[1, 2], "yz": bounds[2, 2]}
+
+    # Triclinic dumps hold the bounding box of the tilted cell
+    xy, xz, yz = tilt_factors["xy"], tilt_factors["xz"], tilt_factors["yz"]
+    lo = bounds[:, 0] - np.array([min(0.0, xy, xz, xy + xz), min(0.0, yz), 0.0])
+    hi = bounds[:, 1] - np.array([max(0.0, xy, xz, xy + xz), max(0.0, yz), 0.0])
+
+    return lo, hi - lo, tilt_factors
+
+
+def _parse_atoms(data, columns, natoms):
+    """
+    Parses the ATOMS item of a frame into a (natoms, ncolumns) DataFrame.
+    """
+
+    try:
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns, delim_whitespace=True, engine="c")
+    except pd.errors.EmptyDataError:
+        df = pd.DataFrame(columns=columns)
+
+    if df.shape[0] != natoms:
+        raise ValueError("LAMMPS Read: Expected %d atoms in a dump frame, found %d." % (natoms, df.shape[0]))
+
+    return df
+
+
+def _id_order(ids):
+    """
+    Returns the order that sorts the atom ids, ids that are a permutation of a contiguous range are scattered in place.
+    """
+
+    lowest = ids.min()
+    if ids.max() - lowest + 1 == ids.shape[0]:
+        order = np.full(ids.shape[0], -1, dtype=np.int64)
+        order[ids - lowest] = np.arange(ids.shape[0])
+        if order.min() >= 0:
+            return order
+
+    return np.argsort(ids, kind="mergesort")
+
+
+def _decode_dump_frame(data, natoms):
+    """
+    Decodes the raw lines of a single dump frame into the atom table, coordinates and box.
+    """
+
+    atoms_start = data.find(b"ITEM: ATOMS")
+    box_start = data.find(b"ITEM: BOX BOUNDS")
+    if (atoms_start == -1) or (box_start == -1):
+        raise ValueError("LAMMPS Read: Dump frames require 'ITEM: BOX BOUNDS' and 'ITEM: ATOMS' items.")
+
+    header, pos = _next_line(data, atoms_start, len(data))
+    columns = [x.decode("ascii") for x in header.split()[2:]]
+    if "id" not in columns:
+        raise KeyError("LAMMPS Read: Dump frames require an 'id' column.")
+
+    lo, lengths, tilt_factors = _parse_box(data[box_start:atoms_start].splitlines())
+
+    atoms = _parse_atoms(data[pos:], columns, natoms)
+
+    # Frames are returned in atom id order
+    ids = atoms["id"].values.astype(np.int64)
+    if np.any(ids[1:] < ids[:-1]):
+        order = _id_order(ids)
+        atoms = atoms.iloc[order]
+        ids = ids[order]
+    atoms.index = pd.Index(ids, name="atom_index")
+
+    for names, scaled, unwrapped in _coordinate_columns:
+        if set(names).issubset(columns):
+            xyz = atoms[list(names)].values.astype(np.float64)
+            break
+    else:
+        raise KeyError("LAMMPS Read: Did not find coordinate columns in the dump frame, found '%s'." % str(columns))
+
+    # Rows are the (possibly tilted) box vectors
+    h = np.array([[lengths[0], 0.0, 0.0], [tilt_factors["xy"], lengths[1], 0.0],
+                  [tilt_factors["xz"], tilt_factors["yz"], lengths[2]]])
+
+    # Scaled coordinates are fractions of the box vectors
+    if scaled:
+        xyz = lo + np.dot(xyz, h)
+
+    # Wrapped coordinates are unwrapped by whole box vectors
+    if (not unwrapped) and set(_image_columns).issubset(columns):
+        xyz += np.dot(atoms[_image_columns].values.astype(np.float64), h)
+
+    box_size = {"x": lengths[0], "y": lengths[1], "z": lengths[2]}
+    return atoms, xyz, lammps_utility.compute_lattice_constants(box_size, tilt_factors)
+
+
+def read_lammps_dump(filename, start=None, stop=None, step=None, unit_style="real", utype=None, dl=None, index=None):
+    """
+    Lazily reads the frames of a LAMMPS dump trajectory (dump atom or dump custom).
+
+    Frames are located through a frame index and only the selected frames are read, each through a single parse of
+    its ATOMS item.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the dump file
+    start, stop, step : int, optional
+        The frames to read, following Python slice semantics.
+    unit_style : str, optional
+        The LAMMPS unit style of the simulation that wrote the dump.
+    utype : dict, optional
+        The units of the returned coordinates and box as a dictionary with optional "length" and "angle" keys,
+        defaults to the length unit of `unit_style` and degree.
+    dl : eex.DataLayer, optional
+        If given the coordinates and box size of each frame are set in the DataLayer before the frame is yielded, so
+        that `dl.evaluate()` evaluates the current frame.
+    index : dict, optional
+        The frame index of the file, otherwise built with `build_dump_index`.
+
+    Yields
+    ------
+    frame : dict
+        Dictionary of the form {"frame": frame number, "timestep": int, "atoms": pd.DataFrame of every dumped column
+        indexed and sorted by atom id, "xyz": (natoms, 3) array of cartesian coordinates,
+        "box": {"a", "b", "c", "alpha", "beta", "gamma"}}
+
+    Notes
+    -----
+    Coordinates are taken from the xu, xsu, x or xs columns in that order of preference, scaled coordinates are
+    converted to cartesian coordinates with the box of the frame. Wrapped coordinates are unwrapped with the ix, iy and
+    iz image flags when they are dumped.
+
+    Example
+    -------
+    dl = eex.datalayer.DataLayer("trajectory")
+    eex.translators.lammps.read_lammps_input_file(dl, "in.system")
+
+    energies = [dl.evaluate() for frame in read_lammps_dump("dump.system", step=10, dl=dl)]
+    """
+
+    if unit_style not in lmd.units_style:
+        raise KeyError("LAMMPS Read: Could not find unit style '%s'." % unit_style)
+
+    if "[length]" not in lmd.units_style[unit_style]:
+        raise KeyError("LAMMPS Read: Unit style '%s' does not define a length unit." % unit_style)
+
+    if utype is None:
+        utype = {}
+    elif not isinstance(utype, dict):
+        raise TypeError("LAMMPS Read: utype type not understood")
+
+    unknown = set(utype) - {"length", "angle"}
+    if unknown:
+        raise KeyError("LAMMPS Read: utype keys '%s' not understood." % str(sorted(unknown)))
+
+    length_unit = utype.get("length", lmd.units_style[unit_style]["[length]"])
+    angle_unit = utype.get("angle", "degree")
+    length_factor = eex.units.conversion_factor(lmd.units_style[unit_style]["[length]"], length_unit)
+    angle_factor = eex.units.conversion_factor("radian", angle_unit)
+
+    box_utype = {k: length_unit for k in _box_keys[0]}
+    box_utype.update({k: angle_unit for k in _box_keys[1]})
+
+    if index is None:
+        index = build_dump_index(filename)
+
+    offsets = index["offsets"]
+    nframes = offsets.shape[0] - 1
+
+    if step == 0:
+        raise ValueError("LAMMPS Read: Frame step cannot be zero.")
+
+    with open(filename, "rb") as handle:
+        for num in range(*slice(start, stop, step).indices(nframes)):
+            handle.seek(offsets[num])
+            atoms, xyz, box = _decode_dump_frame(handle.read(offsets[num + 1] - offsets[num]), index["natoms"][num])
+
+            frame = {"frame": num, "timestep": int(index["timesteps"][num]), "atoms": atoms}
+            frame["xyz"] = xyz * length_factor
+            frame["box"] = {k: box[k] * length_factor for k in _box_keys[0]}
+            frame["box"].update({k: box[k] * angle_factor for k in _box_keys[1]})
+
+            if dl is not None:
+                dl.set_coordinates(frame["xyz"], utype=length_unit)
+                dl.set_box_size(frame["box"], utype=box_utype)
+
+            yield frame
@@ -1,9 +1,10 @@
 """
 LAMMPS EEX I/O
 """
+import io
+import mmap
 import os
 import pandas as pd
-import math
 import re
 import eex
 from . import lammps_utility
@@ -12,8 +13,132 @@ from . import lammps_metadata as lmd
 import logging
 logger = logging.getLogger(__name__)
 
+# Section headers are the only data file lines, other than the title, that start with a letter
+_SECTION_REGEX = re.compile(br"^[ \t]*([A-Za-z][^#\r\n]*?)[ \t]*(?:#[^\r\n]*)?\r?$", re.MULTILINE)
 
-def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
+
+def build_section_index(filename):
+    """
+    Scans a LAMMPS data file for the byte offset and size of every section.
+
+    Parameters
+    ----------
+    filename : str
+        The name of the data file
+
+    Returns
+    -------
+    index : list
+        A list of {"category", "start", "offset", "size"} in file order, where start is the location in bytes of the
+        section header line and offset and size are the location in bytes of the data lines of the section. The
+        header of the file ends at the start of the first section.
+    """
+
+    if not os.path.isfile(filename):
+        raise OSError("Could not find file '%s'" % filename)
+
+    index = []
+    if os.stat(filename).st_size == 0:
+        return index
+
+    with open(filename, "rb") as handle:
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # The first line is always a title
+            pos = data.find(b"\n")
+            pos = len(data) if pos == -1 else pos + 1
+
+            headers = list(_SECTION_REGEX.finditer(data, pos))
+            for num, match in enumerate(headers):
+                end = headers[num + 1].start() if (num + 1) < len(headers) else len(data)
+                offset = min(match.end() + 1, end)
+
+                index.append({
+                    "category": " ".join(match.group(1).decode("ascii").split()),
+                    "start": match.start(),
+                    "offset": offset,
+                    "size": end - offset
+                })
+        finally:
+            data.close()
+
+    return index
+
+
+def _read_section(filename, section, nrows, blocksize=None):
+    """
+    Reads the rows of a single section of a LAMMPS data file, see `build_section_index`.
+
+    Yields DataFrames of at most `blocksize` rows, or a single DataFrame if `blocksize` is None.
+    """
+
+    with open(filename, "rb") as handle:
+        handle.seek(section["offset"])
+        data = handle.read(section["size"])
+
+    try:
+        reader = pd.read_csv(
+            io.BytesIO(data),
+            header=None,
+            engine="c",
+            comment="#",
+            delim_whitespace=True,
+            nrows=nrows,
+            chunksize=blocksize)
+    except pd.errors.EmptyDataError:
+        reader = pd.DataFrame() if blocksize is None else []
+
+    # A single read is checked before anything is added to the DataLayer
+    if blocksize is None:
+        _check_section_size(section, nrows, reader.shape[0])
+        yield reader
+        return
+
+    found = 0
+    for chunk in reader:
+        found += chunk.shape[0]
+        yield chunk
+
+    _check_section_size(section, nrows, found)
+
+
+def _check_section_size(section, nrows, found):
+    """
+    Checks that a section holds the number of lines given in the header of the data file.
+    """
+
+    if found != nrows:
+        raise IOError("LAMMPS Read: Expected %d lines in section '%s', found %d." %
+                      (nrows, section["category"], found))
+
+
+def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=None):
+    """
+    Reads a LAMMPS data file into the DataLayer.
+
+    The file is scanned once for its sections, each section is then parsed in a single pass sized from the counts in
+    the header of the file.
+
+    Parameters
+    ----------
+    dl : eex.DataLayer
+        The DataLayer to add the data to
+    filename : str
+        The name of the data file
+    extra_simulation_data : dict
+        The settings of the input file required to interpret the data file, at least "units" and any "*_style"
+        needed by the sections present (eg - {"units": "real", "atom_style": "full", "bond_style": "harmonic"}).
+    blocksize : int, optional
+        If given sections are added to the DataLayer in blocks of at most this many lines to bound memory, otherwise
+        each section is added at once.
+    """
+
+    # Parse while the tables are written in the background
+    with dl.background_writes():
+        return _read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=blocksize)
+
+
+def _read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=None):
 
     if not isinstance(extra_simulation_data, dict):
         raise TypeError(
@@ -28,23 +153,21 @@ def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
     # At the very least we need 'units' in the extra_simulation_data dict
     needed_keywords = ["units"]
 
-    # Figure out system dimensions and general header data
-    max_rows = 100  # How many lines do we attempt to search?
-    header_data = eex.utility.read_lines(filename, max_rows)
+    # Find the byte ranges of every section, the header ends where the first section starts
+    index = build_section_index(filename)
+    if len(index) == 0:
+        raise IOError("LAMMPS Read: Did not find any data sections in '%s'." % filename)
+
+    with open(filename, "rb") as handle:
+        header_data = handle.read(index[0]["start"]).decode("ascii").splitlines()
 
     box_size = {}
     box_center = {}
     tilt_factors = {'xy': 0, 'xz': 0, 'yz': 0}
     sizes_dict = {}
 
-    startline = None
-    current_data_category = None
-
-    # Category_list contains keywords of data file e.g. Atoms, Masses,
-    # Bond Coeffs, etc.
-    category_list = lmd.build_valid_category_list()
-
-    for num, line in enumerate(header_data[1:]):
+    for line in header_data[1:]:
+        line = line.strip()
 
         # Skip blanklines
         if line == "":
@@ -54,17 +177,6 @@ def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
         elif line[0] == "#":
             continue
 
-        # Evaluate if line contains any keyword contained in category list. If
-        # True, it means we have read all the required information in the
-        # header section. The variable start line is where the header ends
-        # and data begins. At this point, the variable current_data_category
-        # holds the first data section in the data file
-        elif eex.utility.fuzzy_list_match(line, category_list)[0]:
-            startline = num + 3  # Skips first row and two blank lines
-            current_data_category = eex.utility.fuzzy_list_match(
-                line, category_list)[1]
-            break
-
         # Read tilt factors
         elif ("xy" in line) and ("xz" in line) and ("yz" in line):
             dline = line.split()
@@ -166,22 +278,16 @@ def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
         dl.set_box_size(lattice_constants)
         dl.set_box_center(box_center)
 
-    # Make sure we have what we need
-    if startline is None:
-        raise IOError(
-            "LAMMPS Read: Did not find data start in %d header lines." %
-            max_rows)
-
     if ("atoms" not in list(sizes_dict)) or (
             "atom types" not in list(sizes_dict)):
         raise IOError(
-            "LAMMPS Read: Did not find size data on 'atoms' or 'atom types' in %d header lines."
-            % max_rows)
+            "LAMMPS Read: Did not find size data on 'atoms' or 'atom types' in the header of '%s'."
+            % filename)
 
     # sizes_dict["Pair types"] is relevant if we need to specify
     # cross interactions explicitly
     sizes_dict["pair types"] = sizes_dict["atom types"] * (
-        sizes_dict["atom types"] + 1) / 2
+        sizes_dict["atom types"] + 1) // 2
 
     # Create temporaries (op_table, term_table), specific to the current unit
     # specification
@@ -204,41 +310,21 @@ def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
     nb_term_table = lmd.build_nb_table(unit_style)
 
     # Iterate over the primary data portion of the object
+    for section in index:
+        if section["category"] not in op_table:
+            raise KeyError("LAMMPS Read: Data category '%s' not understood." % section["category"])
 
-    reader = pd.read_table(
-        filename,
-        header=None,
-        iterator=True,
-        names=range(10),
-        engine="c",
-        comment="#",
-        delim_whitespace=True,
-        skiprows=startline)
-
-    while True:
-
-        # Figure out the size of the chunk to read
-        op = op_table[current_data_category]
-
-        # Read in the current section, in chunks
-        remaining = op["size"]
-        num_blocks = int(math.ceil(op["size"] / float(blocksize)))
-        for block in range(num_blocks):
-
-            # Figure out the size of the read
-            read_size = blocksize
-            if remaining < blocksize:
-                read_size = remaining
-
-            # Read and update DL
-            data = reader.get_chunk(read_size).dropna(axis=1, how="all")
-            # Nothing defined
-            if op["dl_func"] == "NYI":
-                pass
+        op = op_table[section["category"]]
+
+        # Nothing defined
+        if (op["dl_func"] == "NYI") or (op["size"] == 0):
+            continue
+
+        # Read in the current section, sized from the header
+        for data in _read_section(filename, section, op["size"], blocksize=blocksize):
 
             # Single call
-            elif op["call_type"] == "single":
-                # print(op["dl_func"], op["df_cols"])
+            if op["call_type"] == "single":
                 if "df_cols" in op:
                     data.columns = op["df_cols"]
                 dl.call_by_string(op["dl_func"], data, **op["kwargs"])
@@ -246,73 +332,47 @@ def read_lammps_data_file(dl, filename, extra_simulation_data, blocksize=110):
             elif op["call_type"] == "add_atom_parameters":
                 atom_prop = op["atom_property"]
                 utype = op["kwargs"]["utype"][atom_prop]
-                for idx, row in data.iterrows():
+                for uid, value in zip(data.iloc[:, 0].values.tolist(), data.iloc[:, 1].values.tolist()):
                     dl.add_atom_parameter(
                         atom_prop,
-                        row.iloc[1],
-                        uid=row.iloc[0],
+                        float(value),
+                        uid=int(uid),
                         utype=utype,
                         allow_duplicates=True)
+
             # Adding parameters
             elif op["call_type"] == "parameter":
                 order = op["args"]["order"]
                 fname = op["args"]["style_keyword"]
                 cols = term_table[order][fname]["parameters"]
                 data.columns = ["uid"] + cols
-                for idx, row in data.iterrows():
-                    params = list(row[cols])
-                    utype = term_table[order][fname]["utype"]
-                    dl.add_term_parameter(
-                        order, fname, params, uid=int(row["uid"]), utype=utype)
+                utype = term_table[order][fname]["utype"]
+                dl.add_term_parameters(
+                    order, data, term_name=fname, utype=utype)
 
             elif op["call_type"] == "nb_parameter":
                 fname = op["kwargs"]["nb_name"]
-                utype = nb_term_table[fname]["utype"]
-                op["kwargs"]["utype"] = utype
                 cols = nb_term_table[fname]["parameters"]
-                n_required_params = len(cols)
-                n_given_params = len(data.columns)
-                difference = n_given_params - n_required_params
+                difference = data.shape[1] - len(cols)
                 if difference != op["n_uids"]:
                     raise Exception(
                         "Incorrect number of arguments for pair_coeff")
-                uid_list = ["uid" + str(x) for x in range(0, difference)]
-                data.columns = uid_list + cols
-                for idx, row in data.iterrows():
-
-                    op["kwargs"]["nb_parameters"] = row[['epsilon',
-                                                         'sigma']].to_dict()
-                    if len(uid_list) == 1:
-                        op["kwargs"]["atom_type"] = int(row['uid0'])
-                    elif len(uid_list) == 2:
-                        op["kwargs"]["atom_type"] = int(row['uid0'])
-                        op["kwargs"]["atom_type2"] = int(row['uid1'])
-                    dl.call_by_string(op["dl_func"], **op["kwargs"])
+
+                # One or two atom type columns, followed by the parameters
+                data.columns = ["atom_type", "atom_type2"][:difference] + cols
+                dl.add_nb_parameters(
+                    data,
+                    nb_name=fname,
+                    nb_model=op["kwargs"]["nb_model"],
+                    utype=nb_term_table[fname]["utype"])
 
             else:
                 raise KeyError("Operation table call '%s' not understoop" %
                                op["call_type"])
 
-            # Update remaining
-            remaining -= blocksize
-
-        # Figure out the next category to read
-        try:
-            tmp = reader.get_chunk(1).dropna(axis=1, how="any")
-        except StopIteration:
-            break
-        current_data_category = " ".join(str(x) for x in list(tmp.iloc[0]))
-
     # Mass is missing its index, we can copy the data over
     dl.store.copy_table("atom_type", "mass", {"atom_type": "mass"})
 
-    ## raise Exception("")
-    #data = {}
-    #data["sizes"] = sizes_dict
-    #data["header"] = header
-
-    # return data
-
 
 def get_bond_coeff():
     pass
@@ -346,7 +406,7 @@ def pair_modify():
     pass
 
 
-def read_lammps_input_file(dl, fname, blocksize=110):
+def read_lammps_input_file(dl, fname, blocksize=None):
     """
         Reads a LAMMPS input file
     """
@@ -2,6 +2,7 @@
 LAMMPS EEX I/O
 """
 
+import numpy as np
 import pandas as pd
 import eex
 
@@ -10,6 +11,36 @@ from . import lammps_metadata as lmd
 import logging
 logger = logging.getLogger(__name__)
 
+# Number of rows formatted at once
+_FORMAT_BLOCK = 100000
+
+
+def _write_rows(handle, data, row_fmt, start_index=None):
+    """
+    Writes the rows of a DataFrame or 2D array through a single row template per block of rows.
+
+    If start_index is given, the rows are numbered from start_index in a leading column.
+    """
+
+    values = np.asarray(data, dtype=np.float64)
+    if start_index is not None:
+        row_fmt = "%d " + row_fmt
+        values = np.column_stack([np.arange(start_index, start_index + values.shape[0]), values])
+
+    for start in range(0, values.shape[0], _FORMAT_BLOCK):
+        block = values[start:start + _FORMAT_BLOCK]
+        handle.write((row_fmt * block.shape[0]) % tuple(block.ravel().tolist()))
+
+
+def _read_chunks(data, blocksize):
+    """
+    Returns a single DataFrame as a list, or passes a generator of chunks through.
+    """
+
+    if blocksize is None:
+        return [data]
+    return data
+
 
 def _check_dl_forms_compatibility(dl, term_table, nb_term_table):
     # """
@@ -80,7 +111,27 @@ def write_lammps_file(dl,
                       data_filename,
                       input_filename,
                       unit_style="real",
-                      blocksize=110):
+                      blocksize=None,
+                      precision=8):
+    """
+    Writes a LAMMPS data file and the input file that reads it.
+
+    Parameters
+    ----------
+    dl : eex.DataLayer
+        The DataLayer to write
+    data_filename : str
+        The name of the data file
+    input_filename : str
+        The name of the input file
+    unit_style : str, optional
+        The LAMMPS unit style to write
+    blocksize : int, optional
+        If given the atom and term tables are read from the store and written in chunks of at most this many rows,
+        so that memory use does not depend on the size of the system. Otherwise the tables are read at once.
+    precision : int, optional
+        The number of decimals of the written parameters, charges and coordinates.
+    """
 
     # handle units
     unit_set = lmd.units_style[unit_style]
@@ -128,7 +179,12 @@ def write_lammps_file(dl,
     sizes["dihedrals"] = dl.get_term_count(
         4, "total")  # Not qutie right once we do impropers
     sizes["impropers"] = 0
-    sizes["atom types"] = len(dl.get_unique_atom_types())
+
+    # Collect the atom types a chunk at a time
+    atom_types = set()
+    for chunk in _read_chunks(dl.get_atoms("atom_type", chunksize=blocksize), blocksize):
+        atom_types.update(np.unique(chunk["atom_type"].values).tolist())
+    sizes["atom types"] = len(atom_types)
 
     # All the UID's minus the "total" columns
     sizes["bond types"] = len(dl.get_term_count(2)) - 1
@@ -177,7 +233,7 @@ def write_lammps_file(dl,
             data_file.write("% 8.6f% 8.6f %slo %shi\n" % (v[0], v[1], k, k))
         data_file.write('\n')
 
-    param_fmt = "%10.8f"
+    param_fmt = "%%%d.%df" % (precision + 2, precision)
 
     # Handle nonbonds - This needs to be generalized badly - make it work for now.
     if dl.get_mixing_rule() is not None:
@@ -206,12 +262,12 @@ def write_lammps_file(dl,
 
     for key, value in stored_nb_parameters.items():
         if key[1] is None:
-            data_file.write(("%2d %10.8f %10.8f\n" % (key[0], value['epsilon'],
-                                                      value['sigma'])))
+            data_file.write((("%2d " + param_fmt + " " + param_fmt + "\n") %
+                             (key[0], value['epsilon'], value['sigma'])))
         else:
             data_file.write(
-                ("%2d %2d %10.8f %10.8f\n" % (key[0], key[1], value['epsilon'],
-                                              value['sigma'])))
+                (("%2d %2d " + param_fmt + " " + param_fmt + "\n") %
+                 (key[0], key[1], value['epsilon'], value['sigma'])))
 
     data_file.write("\n")
 
@@ -224,67 +280,67 @@ def write_lammps_file(dl,
             continue
 
         data_file.write(("%s Coeffs\n\n" % param_type).title())
-        for uid in param_uids:
-
-            param_coeffs = dl.get_term_parameter(param_order, uid)
 
-            if param_coeffs[0] in valid_forms[param_order]:
-                term_data = term_table[param_order][param_coeffs[0]]
-                param_coeffs = dl.get_term_parameter(
-                    param_order,
-                    uid,
-                    utype=term_data["utype"],
-                    ftype=param_coeffs[0])
-            else:
-                # Arbitrarily pick the first
-                term_data = term_table[param_order][valid_forms[param_order]
-                                                    [0]]
-                param_coeffs = dl.get_term_parameter(
+        # Forms LAMMPS understands are kept, anything else is converted to the first valid form
+        stored = dl.get_term_parameters(param_order)
+        frames = []
+        for form_name, form_uids in stored.groupby("term_name").groups.items():
+            if form_name not in valid_forms[param_order]:
+                form_name = valid_forms[param_order][0]
+            frames.append(
+                dl.get_term_parameters(
                     param_order,
-                    uid,
-                    utype=term_data["utype"],
-                    ftype=valid_forms[param_order][0])
+                    form_uids,
+                    utype=term_table[param_order][form_name]["utype"],
+                    ftype=form_name))
+        param_coeffs = pd.concat(frames, sort=False).loc[stored.index]
+
+        for uid, row in zip(param_coeffs.index, param_coeffs.to_dict(orient="records")):
+            term_data = term_table[param_order][row["term_name"]]
 
             # Order the data like lammps wants it
-            parameters = [param_coeffs[1][k] for k in term_data["parameters"]]
+            parameters = [row[k] for k in term_data["parameters"]]
 
             data_file.write("%2d " % uid)
             data_file.write(" ".join(param_fmt % f for f in parameters))
             data_file.write("\n")
 
-            input_file.write("%s_style\t%s\n" % (param_type, param_coeffs[0]))
+            input_file.write("%s_style\t%s\n" % (param_type, row["term_name"]))
 
         data_file.write("\n")
 
     # Write out mass data - don't use get_atom_parameter since we cannot assume that uid = atom_type
     data_file.write(" Masses\n\n")
-    data = dl.get_atoms(["atom_type", "mass"],
-                        utype={
-                            'atom_type': None,
-                            'mass': lmd.get_context(unit_style, "[mass]")
-                        },
-                        by_value=True).drop_duplicates()
-
-    data.to_csv(data_file, sep=' ', index=False, header=False)
-
-    # This is not working in Python 3?
-    # np.savetxt(data_file, np.array(data), fmt='%2d %10.8f')
+    masses = []
+    for chunk in _read_chunks(
+            dl.get_atoms(["atom_type", "mass"],
+                         utype={
+                             'atom_type': None,
+                             'mass': lmd.get_context(unit_style, "[mass]")
+                         },
+                         by_value=True,
+                         chunksize=blocksize), blocksize):
+        masses.append(chunk.drop_duplicates())
+
+    if masses:
+        masses = pd.concat(masses).drop_duplicates()
+        _write_rows(data_file, masses[["atom_type", "mass"]], "%d " + param_fmt + "\n")
 
     data_file.write('\n')
 
-    # Write out atom data
+    # Write out atom data, atoms are numbered sequentially
     data_file.write(" Atoms\n\n")
 
-    atoms = dl.get_atoms(["molecule_index", "atom_type", "charge", "xyz"],
-                         by_value=True)
-    atoms.index = pd.RangeIndex(start=1, stop=atoms.shape[0] + 1)
-
-    # Build a simple formatter
-    def float_fmt(n):
-        return "%10.8f" % n
+    atom_fmt = "%d %d " + " ".join([param_fmt] * 4) + "\n"
+    atom_cols = ["molecule_index", "atom_type", "charge", "X", "Y", "Z"]
+    written = 0
+    for chunk in _read_chunks(
+            dl.get_atoms(["molecule_index", "atom_type", "charge", "xyz"], by_value=True, chunksize=blocksize),
+            blocksize):
+        _write_rows(data_file, chunk[atom_cols], atom_fmt, start_index=written + 1)
+        written += chunk.shape[0]
 
-    atoms.to_string(data_file, header=None, float_format=float_fmt)
-    data_file.write('\n\n')
+    data_file.write('\n')
 
     # Write out all of the term data
     for param_order, param_type in zip([2, 3, 4],
@@ -294,13 +350,15 @@ def write_lammps_file(dl,
 
         data_file.write((" %s\n\n" % param_type).title())
 
-        # Grab term and reorder
+        # Grab term and reorder, terms are numbered sequentially
         cols = ["term_index"
                 ] + ["atom%s" % d for d in range(1, param_order + 1)]
-        term = dl.get_terms(param_type)[cols]
-        term.index = pd.RangeIndex(start=1, stop=term.shape[0] + 1)
-        # print(term)
-        term.to_csv(data_file, header=None, sep=" ")
+        term_fmt = " ".join(["%d"] * len(cols)) + "\n"
+        written = 0
+        for chunk in _read_chunks(dl.get_terms(param_type, copy=False, chunksize=blocksize), blocksize):
+            _write_rows(data_file, chunk[cols], term_fmt, start_index=written + 1)
+            written += chunk.shape[0]
+
         data_file.write('\n')
 
     input_file.write("read_data\t%s\n" % (data_filename))